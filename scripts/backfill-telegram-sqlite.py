@@ -7,81 +7,172 @@ The SQLite database currently starts at message_id 57,635
 This script fetches messages from 1 to 57,634 and inserts them
 
 Requirements:
-  pip install telethon aiosqlite
+  pip install telethon
 
 Usage:
   python3 backfill-telegram-sqlite.py --check      # Check status only
   python3 backfill-telegram-sqlite.py --dry-run    # Show what would be indexed
   python3 backfill-telegram-sqlite.py --live       # Actually index
+  python3 backfill-telegram-sqlite.py --live --profile --profile-dir /var/lib/node_exporter/textfile_collector
+
+  python3 backfill-telegram-sqlite.py --live --shards 8 --rate 4
+  python3 backfill-telegram-sqlite.py --check --gaps  # List holes inside the indexed range
+  python3 backfill-telegram-sqlite.py --live --gaps   # Fetch only the holes
+  python3 backfill-telegram-sqlite.py --live --resume # Continue an interrupted backfill
+  python3 backfill-telegram-sqlite.py --follow --metrics-file /var/lib/node_exporter/textfile_collector/ingest.prom
+  python3 backfill-telegram-sqlite.py --live --db /tmp/test.db --fake-channel 60000 --fake-flood-every 200
 
 Deploy to: /opt/trendimovies/bot/backfill-telegram-sqlite.py
+     (with release_parser.py, run_profiler.py and fake_telegram.py in the same directory)
+
+Each inserted file is also parsed into movies.db's file_parse_cache table,
+so the episode migration does not have to parse it again.
+
+Rows are written in short executemany transactions (--flush-rows /
+--flush-seconds) on a WAL-mode connection with a busy timeout, so the
+live bot keeps indexing while the backfill runs.
+
+The range is split into --shards contiguous slices fetched by separate
+coroutines; one writer task owns the SQLite connection and drains a
+bounded queue, running its transactions on a dedicated thread so
+Telegram reads continue while SQLite commits. All shards share one token
+bucket (--rate requests/s), and a FloodWaitError pauses every shard for
+the requested time. --fake-channel replaces Telegram with an offline
+generated channel (fake_telegram.py) for testing; bench-backfill-overlap.py
+compares throughput with and without the writer thread.
+
+--gaps repairs holes inside the indexed range (bot downtime, a crashed
+run): a window query over movies finds the missing message_id ranges,
+ids already scanned (table backfill_scanned_ranges: merged ranges of ids
+seen as indexed, skipped or deleted) are dropped, and the rest are
+fetched with get_messages(ids=[...]), 100 per request. Every run records
+what it scanned, so a repair costs time in proportion to what is
+missing, not to the channel's size.
+
+Each shard's last fully processed message id is checkpointed in
+backfill_checkpoints, in the same transaction as the rows it covers.
+Connection drops and Telegram server errors are retried with backoff; if
+a shard still fails, or the run is killed, --resume continues every
+unfinished shard from its checkpoint, losing at most one flush of work.
+
+--follow keeps movies.db current as a live tail: on every (re)connect
+it catches up from MAX(message_id), then indexes NewMessage events
+through the same batched writer (so new files land within
+--flush-seconds), rewrites rows of edited messages, and marks rows of
+deleted messages is_active = 0 (the column is added on first use).
+Telegram connection drops are retried with backoff. The ingest lag
+(message date -> commit) goes to the log and, with --metrics-file, to a
+Prometheus textfile. Missed events below MAX(message_id) are left to
+--gaps.
+
+--profile reports wall/CPU/RSS/items per stage, with the time spent
+waiting on Telegram, inserting and parsing broken out, and a latency
+histogram per Telegram request type.
 """
 
 import os
 import sys
 import asyncio
+import time
+import random
 import sqlite3
 import argparse
-import re
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
+from release_parser import (
+    PARSE_CACHE_INSERT, ensure_parse_cache, extract_quality, extract_year, is_series,
+    parse_cache_row, parse_release,
+)
+from run_profiler import LATENCY_BUCKETS, METRIC_PREFIX, LatencyHistogram, RunProfiler
+
 # Configuration - UPDATE THESE VALUES
 SQLITE_DB = '/opt/trendimovies/bot/database/movies.db'
 CHANNEL_ID = -1001234567890  # UPDATE: Your Telegram channel ID
 API_ID = 12345678            # UPDATE: Your Telegram API ID
 API_HASH = 'your_api_hash'   # UPDATE: Your Telegram API hash
 
+# Buffered writes: one short transaction per FLUSH_ROWS rows or
+# FLUSH_SECONDS, whichever comes first, so the bot's own indexer never
+# waits on the backfill for longer than one small executemany
+FLUSH_ROWS = 500
+FLUSH_SECONDS = 2.0
+BUSY_TIMEOUT_MS = 5000
+
+# Concurrent fetch: the range is split into SHARDS slices, each paged by
+# its own coroutine; every history request takes a token from one shared
+# bucket, and a FloodWaitError pauses the bucket (so every shard) for the
+# time Telegram asked for
+SHARDS = 4
+REQUESTS_PER_SECOND = 3.0
+REQUEST_BURST = 5
+PAGE_SIZE = 100           # Telegram's cap per history request
+QUEUE_ROWS = 5000         # fetched rows waiting for the writer task
+
+# Transient request errors (connection drops, Telegram server errors) are
+# retried with exponential backoff before a shard gives up
+FETCH_RETRIES = 5
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 30.0
+TRANSIENT_ERRORS = ('ServerError', 'RpcCallFailError', 'RpcMcgetFailError', 'TimedOutError', 'TimeoutError')
+
+# Per-shard progress of the last range backfill, committed together with
+# the rows it covers; --resume continues each unfinished shard from there
+CHECKPOINTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        shard_lo INTEGER PRIMARY KEY,
+        shard_hi INTEGER NOT NULL,
+        done_through INTEGER NOT NULL,
+        updated_at TEXT
+    )
+'''
+
+# --gaps: message ids already looked at (indexed, skipped or deleted) are
+# kept as merged [lo, hi] ranges, so a repair run only asks Telegram for
+# ids that were never scanned
+SCANNED_RANGES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS backfill_scanned_ranges (
+        lo INTEGER PRIMARY KEY,
+        hi INTEGER NOT NULL
+    )
+'''
+
+# Missing message_id ranges between indexed rows
+HOLES_QUERY = '''
+    SELECT prev + 1, message_id - 1
+    FROM (
+        SELECT message_id, LAG(message_id) OVER (ORDER BY message_id) AS prev
+        FROM movies
+        WHERE message_id IS NOT NULL
+    )
+    WHERE message_id - prev > 1
+    ORDER BY message_id
+'''
+
+MOVIES_INSERT = '''
+    INSERT OR IGNORE INTO movies
+    (message_id, file_id, file_name, file_size, quality, year, is_series, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# --follow: an edited message replaces its row's file columns
+MOVIES_UPDATE = '''
+    UPDATE movies
+    SET file_id = ?, file_name = ?, file_size = ?, quality = ?, year = ?, is_series = ?
+    WHERE message_id = ?
+'''
+
 # File patterns to index
 VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.avi', '.webm', '.mov', '.wmv', '.flv'}
 SUBTITLE_EXTENSIONS = {'.srt', '.sub', '.ass', '.ssa', '.vtt'}
 
+# Stage timings and Telegram request latencies; reported with --profile
+profiler = RunProfiler('backfill_telegram_sqlite')
+
 def log(msg):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
 
-def extract_quality(filename):
-    """Extract quality from filename"""
-    lower = filename.lower()
-    if '2160p' in lower or '4k' in lower:
-        return '2160p'
-    if '1080p' in lower:
-        return '1080p'
-    if '720p' in lower:
-        return '720p'
-    if 'hdrip' in lower:
-        return 'hdrip'
-    if 'bdrip' in lower or 'bluray' in lower:
-        return 'bluray'
-    if 'webrip' in lower or 'web-dl' in lower:
-        return 'webrip'
-    return ''
-
-def extract_year(filename):
-    """Extract year from filename"""
-    # Look for year in common patterns like Movie.Title.2024.Quality
-    match = re.search(r'[.\-_\s](19|20\d{2})[.\-_\s]', filename)
-    if match:
-        year = int(match.group(1) + match.group(0)[-3:-1])
-        if 1900 <= year <= 2030:
-            return year
-    return None
-
-def is_series(filename):
-    """Check if file is a TV series episode"""
-    lower = filename.lower()
-    # Common series patterns: S01E01, Season 1 Episode 1, 1x01
-    patterns = [
-        r's\d{1,2}e\d{1,2}',
-        r'season\s*\d+',
-        r'\d{1,2}x\d{1,2}',
-        r'episode\s*\d+',
-        r'ep\s*\d+',
-    ]
-    for pattern in patterns:
-        if re.search(pattern, lower):
-            return 1
-    return 0
-
 def get_db_status(db_path):
     """Get current database status"""
     if not os.path.exists(db_path):
@@ -116,15 +207,575 @@ def search_movie(db_path, title):
     conn.close()
     return results
 
-async def backfill_messages(args):
-    """Main backfill function"""
+def profiled_client_class(client_class):
+    """TelegramClient subclass that times every MTProto request for --profile."""
+    class ProfiledTelegramClient(client_class):
+        async def __call__(self, request, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await super().__call__(request, *args, **kwargs)
+            finally:
+                profiler.observe_http(f'telegram {type(request).__name__}', time.perf_counter() - t0)
+    return ProfiledTelegramClient
+
+def open_backfill_db(db_path):
+    """
+    Autocommit connection (transactions are explicit) in WAL mode. Flushes
+    run on the writer thread, so the connection is not tied to the thread
+    that opened it; callers never use it from two threads at once.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    # Persistent: readers (the bot, the migration) no longer block on our commits
+    mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    if mode.lower() != 'wal':
+        log(f"WARNING: could not switch {db_path} to WAL (journal_mode={mode})")
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+def merge_ranges(ranges):
+    """Sort and merge overlapping or adjacent inclusive (lo, hi) ranges."""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1][1] = hi
+        else:
+            merged.append([lo, hi])
+    return [(lo, hi) for lo, hi in merged]
+
+def load_scanned_ranges(conn):
+    """Scanned ranges recorded by earlier runs ([] before the first one)."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'backfill_scanned_ranges'"
+    ).fetchone()
+    if not exists:
+        return []
+    return conn.execute('SELECT lo, hi FROM backfill_scanned_ranges ORDER BY lo').fetchall()
+
+def record_scanned_ranges(conn, ranges):
+    """Merge ranges into backfill_scanned_ranges (inside the caller's transaction)."""
+    for lo, hi in merge_ranges(ranges):
+        touching = conn.execute(
+            'SELECT lo, hi FROM backfill_scanned_ranges WHERE lo <= ? AND hi >= ?', (hi + 1, lo - 1)
+        ).fetchall()
+        if touching:
+            conn.execute('DELETE FROM backfill_scanned_ranges WHERE lo <= ? AND hi >= ?', (hi + 1, lo - 1))
+            lo = min(lo, min(r[0] for r in touching))
+            hi = max(hi, max(r[1] for r in touching))
+        conn.execute('INSERT INTO backfill_scanned_ranges (lo, hi) VALUES (?, ?)', (lo, hi))
+
+def load_checkpoints(conn):
+    """(shard_lo, shard_hi, done_through) of the last range backfill ([] if none)."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'backfill_checkpoints'"
+    ).fetchone()
+    if not exists:
+        return []
+    return conn.execute('SELECT shard_lo, shard_hi, done_through FROM backfill_checkpoints ORDER BY shard_lo').fetchall()
+
+def start_checkpoints(conn, shards):
+    """A new range backfill: replace the previous run's checkpoints with these shards."""
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM backfill_checkpoints')
+        conn.executemany('INSERT INTO backfill_checkpoints (shard_lo, shard_hi, done_through, updated_at) '
+                         'VALUES (?, ?, ?, ?)', [(lo, hi, lo - 1, now) for lo, hi in shards])
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+def find_holes(conn):
+    """Missing message_id ranges inside the indexed range, minus those already scanned."""
+    scanned = load_scanned_ranges(conn)
+    holes = []
+    i = 0
+    for lo, hi in conn.execute(HOLES_QUERY):
+        # Both lists are sorted: skip scanned ranges ending before this hole
+        while i < len(scanned) and scanned[i][1] < lo:
+            i += 1
+        j = i
+        while lo <= hi and j < len(scanned) and scanned[j][0] <= hi:
+            if scanned[j][0] > lo:
+                holes.append((lo, scanned[j][0] - 1))
+            lo = max(lo, scanned[j][1] + 1)
+            j += 1
+        if lo <= hi:
+            holes.append((lo, hi))
+    return holes
+
+def hole_batches(holes, size=PAGE_SIZE):
+    """
+    The ids of the holes in ascending batches of `size` for
+    get_messages(ids=...), each with the span it covers: from just after
+    the previous batch up to its last id. Ids in a span but not in the
+    batch are indexed or already scanned, so the spans tile the whole
+    repaired range and merge into one scanned range.
+    """
+    batch = []
+    start = holes[0][0] if holes else 0
+    for lo, hi in holes:
+        for message_id in range(lo, hi + 1):
+            batch.append(message_id)
+            if len(batch) == size:
+                yield range(start, message_id + 1), batch
+                start = message_id + 1
+                batch = []
+    if batch:
+        yield range(start, batch[-1] + 1), batch
+
+class ScannedSpan:
+    """Queue item: every message in lo..hi has been fetched and its rows queued."""
+
+    __slots__ = ('lo', 'hi', 'shard')
+
+    def __init__(self, lo, hi, shard=None):
+        self.lo = lo
+        self.hi = hi
+        self.shard = shard  # shard_lo of the range backfill shard, for its checkpoint
+
+class Edited:
+    """Queue item: the row of an edited message (updated, or inserted if new)."""
+
+    __slots__ = ('row', 'parsed')
+
+    def __init__(self, row, parsed):
+        self.row = row
+        self.parsed = parsed
+
+class Deleted:
+    """Queue item: message ids deleted from the channel."""
+
+    __slots__ = ('message_ids',)
+
+    def __init__(self, message_ids):
+        self.message_ids = list(message_ids)
+
+class BackfillWriter:
+    """
+    Buffers movies rows and writes them with executemany, one
+    BEGIN IMMEDIATE transaction per flush. Inserted/ignored counts are
+    exact: total_changes tells how many rows the INSERT OR IGNORE really
+    added, and (holding the write lock) the new rows are exactly those
+    above the previous MAX(id), which is how their parse-cache rows are
+    keyed without a per-row lastrowid. Scanned id ranges and shard
+    checkpoints are recorded in the same transaction as their rows, so a
+    killed run loses at most the rows buffered since the last flush.
+    With --follow, edits and deletions (is_active = 0) ride the same
+    transactions, and lag (an IngestLag) sees every committed new row.
+    """
+
+    def __init__(self, conn, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.conn = conn
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.inserted = 0
+        self.ignored = 0
+        self.updated = 0
+        self.deactivated = 0
+        self.flushes = 0
+        self.lag = None
+        self._rows = []
+        self._edited = []
+        self._deleted = []
+        self._parsed = {}
+        self._scanned = []
+        self._first_buffered = None
+
+    def _buffering(self):
+        return bool(self._rows or self._edited or self._deleted or self._scanned)
+
+    def _touch(self):
+        if not self._buffering():
+            self._first_buffered = time.monotonic()
+
+    def add(self, row, parsed):
+        """row: values for MOVIES_INSERT; parsed: its ParsedRelease."""
+        self._touch()
+        self._rows.append(row)
+        self._parsed[row[0]] = parsed
+
+    def edit(self, row, parsed):
+        """An edited message: its row is rewritten (or inserted if it was never indexed)."""
+        self._touch()
+        self._edited.append(row)
+        self._parsed[row[0]] = parsed
+
+    def deactivate(self, message_ids):
+        """Messages deleted from the channel: their rows get is_active = 0."""
+        self._touch()
+        self._deleted.extend(message_ids)
+
+    def mark_scanned(self, span):
+        """Every message in the ScannedSpan has been fetched and its rows added."""
+        self._touch()
+        self._scanned.append(span)
+
+    def due(self):
+        """A full buffer, or anything buffered for flush_seconds."""
+        if len(self._rows) + len(self._edited) >= self.flush_rows:
+            return True
+        return self._buffering() and time.monotonic() - self._first_buffered >= self.flush_seconds
+
+    def flush(self):
+        if not self._buffering():
+            return 0
+        rows, edited, deleted = self._rows, self._edited, self._deleted
+        parsed, scanned = self._parsed, self._scanned
+        self._rows, self._edited, self._deleted, self._parsed, self._scanned = [], [], [], {}, []
+        conn = self.conn
+        t0 = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            inserted = edit_inserted = 0
+            new_rows = []
+            if rows or edited:
+                before_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM movies').fetchone()[0]
+                before = conn.total_changes
+                conn.executemany(MOVIES_INSERT, rows)
+                inserted = conn.total_changes - before
+                before = conn.total_changes
+                conn.executemany(MOVIES_INSERT, edited)
+                edit_inserted = conn.total_changes - before
+            if inserted or edit_inserted:
+                new_rows = conn.execute('SELECT id, message_id FROM movies WHERE id > ?', (before_id,)).fetchall()
+                conn.executemany(PARSE_CACHE_INSERT,
+                                 [parse_cache_row(movie_id, parsed[message_id]) for movie_id, message_id in new_rows])
+            if edited:
+                conn.executemany(MOVIES_UPDATE, [row[1:7] + (row[0],) for row in edited])
+                placeholders = ','.join('?' * len(edited))
+                changed = conn.execute(f'SELECT id, message_id FROM movies WHERE message_id IN ({placeholders})',
+                                       [row[0] for row in edited]).fetchall()
+                conn.executemany(PARSE_CACHE_INSERT,
+                                 [parse_cache_row(movie_id, parsed[message_id]) for movie_id, message_id in changed])
+            if deleted:
+                before = conn.total_changes
+                conn.executemany('UPDATE movies SET is_active = 0 WHERE message_id = ? AND is_active = 1',
+                                 [(message_id,) for message_id in deleted])
+                self.deactivated += conn.total_changes - before
+            if scanned:
+                record_scanned_ranges(conn, [(span.lo, span.hi) for span in scanned])
+                now = datetime.now().isoformat(timespec='seconds')
+                conn.executemany('UPDATE backfill_checkpoints SET done_through = MAX(done_through, ?), '
+                                 'updated_at = ? WHERE shard_lo = ?',
+                                 [(span.hi, now, span.shard) for span in scanned if span.shard is not None])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        profiler.add_time('sqlite_flush', time.perf_counter() - t0)
+        self.inserted += inserted + edit_inserted
+        self.ignored += len(rows) - inserted
+        self.updated += len(edited) - edit_inserted
+        self.flushes += 1
+        if self.lag is not None:
+            dates = {row[0]: row[7] for row in rows + edited}
+            self.lag.committed([dates[message_id] for _, message_id in new_rows], self)
+        return inserted + edit_inserted
+
+class IngestLag:
+    """
+    --follow: message date -> commit time of every new row, as a
+    histogram and the latest value, optionally kept in a Prometheus
+    textfile (rewritten atomically after each commit).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.histogram = LatencyHistogram()
+        self.last = None
+
+    def committed(self, dates, writer):
+        """Called by BackfillWriter.flush() (on the writer thread) after each commit."""
+        now = datetime.now(timezone.utc)
+        for date in dates:
+            if not date:
+                continue
+            posted = datetime.fromisoformat(date)
+            if posted.tzinfo is None:
+                posted = posted.replace(tzinfo=timezone.utc)  # Telegram dates are UTC
+            self.last = max(0.0, (now - posted).total_seconds())
+            self.histogram.observe(self.last)
+        if self.path:
+            self.write_prometheus(writer)
+
+    def write_prometheus(self, writer):
+        job = profiler.job
+        name = f'{METRIC_PREFIX}_ingest_lag_seconds'
+        lines = [
+            f'# HELP {name} Telegram message date to movies.db commit, per new row.',
+            f'# TYPE {name} histogram',
+        ]
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), self.histogram.buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{{job="{job}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{job="{job}"}} {self.histogram.total:.6f}')
+        lines.append(f'{name}_count{{job="{job}"}} {self.histogram.count}')
+        lines.append(f'# HELP {METRIC_PREFIX}_ingest_last_lag_seconds Lag of the most recently committed row.')
+        lines.append(f'# TYPE {METRIC_PREFIX}_ingest_last_lag_seconds gauge')
+        lines.append(f'{METRIC_PREFIX}_ingest_last_lag_seconds{{job="{job}"}} {self.last or 0:.3f}')
+        lines.append(f'# HELP {METRIC_PREFIX}_ingest_rows_total Rows changed by the live tail.')
+        lines.append(f'# TYPE {METRIC_PREFIX}_ingest_rows_total counter')
+        for change, n in (('inserted', writer.inserted), ('updated', writer.updated),
+                          ('deactivated', writer.deactivated)):
+            lines.append(f'{METRIC_PREFIX}_ingest_rows_total{{job="{job}",change="{change}"}} {n}')
+        lines.append(f'# HELP {METRIC_PREFIX}_ingest_last_commit_timestamp_seconds When the live tail last committed.')
+        lines.append(f'# TYPE {METRIC_PREFIX}_ingest_last_commit_timestamp_seconds gauge')
+        lines.append(f'{METRIC_PREFIX}_ingest_last_commit_timestamp_seconds{{job="{job}"}} {int(time.time())}')
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+class TokenBucket:
+    """Request rate limit shared by all shard coroutines."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.flood_waits = 0
+        self.flood_seconds = 0
+        self._stamp = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:  # one waiter at a time keeps it first-come, first-served
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def flood_wait(self, seconds):
+        """Telegram asked for a pause: hold every shard, then restart with an empty bucket."""
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+def flood_wait_seconds(exc):
+    """Seconds to wait if exc is a flood wait (telethon's or the fake client's), else None."""
+    if type(exc).__name__ in ('FloodWaitError', 'FloodPremiumWaitError'):
+        return getattr(exc, 'seconds', None)
+    return None
+
+def shard_ranges(start, end, shards):
+    """Split [start, end] into up to `shards` contiguous inclusive ranges."""
+    shards = max(1, min(shards, end - start + 1))
+    step = (end - start + 1) / shards
+    bounds = [start + round(i * step) for i in range(shards)] + [end + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(shards)]
+
+def message_row(message):
+    """
+    (row, parsed) for an indexable message, 'skip' for a document that is
+    not a named video/subtitle file, None for messages without a document.
+    """
+    if not message.media or not hasattr(message.media, 'document'):
+        return None
+
+    doc = message.media.document
+    if not doc:
+        return None
+
+    # Get filename from attributes
+    filename = None
+    for attr in doc.attributes:
+        if hasattr(attr, 'file_name'):
+            filename = attr.file_name
+            break
+
+    if not filename:
+        return 'skip'
+
+    # Check if it's a video or subtitle
+    ext = Path(filename).suffix.lower()
+    if ext not in VIDEO_EXTENSIONS and ext not in SUBTITLE_EXTENSIONS:
+        return 'skip'
+
+    # Parsed now (outside the write transaction) so
+    # migrate-episode-ddl.py can read it back
+    row = (
+        message.id,
+        str(doc.id),
+        filename,
+        doc.size,
+        extract_quality(filename),
+        extract_year(filename),
+        is_series(filename),
+        message.date.isoformat() if message.date else None,
+    )
+    return row, parse_release(filename)
+
+def is_transient(exc):
+    """Connection-level and Telegram server-side errors worth retrying."""
+    return isinstance(exc, (ConnectionError, asyncio.TimeoutError)) or type(exc).__name__ in TRANSIENT_ERRORS
+
+async def limited_request(limiter, label, request, stats):
+    """
+    Await request() under the shared limiter. Flood waits pause every
+    shard and are retried without limit; transient errors are retried
+    FETCH_RETRIES times with exponential backoff, then raised.
+    """
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        t0 = time.perf_counter()
+        try:
+            result = await request()
+        except Exception as e:
+            seconds = flood_wait_seconds(e)
+            if seconds is not None:
+                log(f"  FloodWait: {seconds}s requested ({label}); all shards pause")
+                limiter.flood_wait(seconds)
+                continue
+            if not is_transient(e) or attempt >= FETCH_RETRIES:
+                raise
+            attempt += 1
+            stats['retries'] += 1
+            delay = min(RETRY_BACKOFF_BASE * (2 ** (attempt - 1)), RETRY_BACKOFF_MAX)
+            log(f"  {type(e).__name__}: {e} ({label}); retry {attempt}/{FETCH_RETRIES} in {delay:.0f}s")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            continue
+        profiler.add_time('telegram_wait', time.perf_counter() - t0)
+        return result
+
+async def queue_messages(messages, queue, stats):
+    """Filter and parse fetched messages; indexable rows go to the writer."""
+    for message in messages:
+        stats['scanned'] += 1
+        t0 = time.perf_counter()
+        item = message_row(message)
+        profiler.add_time('parse', time.perf_counter() - t0)
+        if item == 'skip':
+            stats['skipped'] += 1
+        elif item is not None:
+            await queue.put(item)
+
+async def fetch_shard(client, channel, lo, hi, limiter, queue, stats, after=None):
+    """
+    Page through message ids lo..hi (oldest first) and queue the indexable
+    rows; after: last id a previous run finished (--resume), default lo - 1.
+    """
+    after = lo - 1 if after is None else after
+    while after < hi:
+        page = await limited_request(
+            limiter, f"shard {lo:,}-{hi:,}",
+            lambda: client.get_messages(channel, limit=PAGE_SIZE, min_id=after, max_id=hi + 1, reverse=True),
+            stats,
+        )
+        if not page:
+            await queue.put(ScannedSpan(after + 1, hi, lo))  # nothing left but deleted ids
+            break
+        await queue_messages(page, queue, stats)
+        # Ids skipped between pages were deleted: the whole span is scanned
+        await queue.put(ScannedSpan(after + 1, page[-1].id, lo))
+        after = page[-1].id
+
+async def fetch_holes(client, channel, batches, limiter, queue, stats):
+    """Fetch hole ids by id, PAGE_SIZE per request; batches is shared by all workers."""
+    for span, ids in batches:
+        messages = await limited_request(
+            limiter, f"ids {ids[0]:,}-{ids[-1]:,}",
+            lambda: client.get_messages(channel, ids=ids),
+            stats,
+        )
+        found = [m for m in messages if m is not None]
+        stats['deleted'] += len(ids) - len(found)
+        await queue_messages(found, queue, stats)
+        await queue.put(ScannedSpan(span.start, span.stop - 1))
+
+async def write_rows(queue, writer, stats, overlap=True):
+    """
+    The only task touching SQLite: drain the queue into BackfillWriter.
+    Flushes run on a dedicated writer thread, so the event loop keeps
+    serving Telegram reads (and the queue keeps filling) during a
+    commit; overlap=False flushes on the loop instead (for comparison).
+    """
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer') as pool:
+
+        async def flush():
+            if overlap:
+                await loop.run_in_executor(pool, writer.flush)
+            else:
+                writer.flush()
+
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=writer.flush_seconds)
+            except asyncio.TimeoutError:
+                item = ()
+            if item is None:
+                break
+            if isinstance(item, ScannedSpan):
+                writer.mark_scanned(item)
+            elif isinstance(item, Edited):
+                writer.edit(item.row, item.parsed)
+            elif isinstance(item, Deleted):
+                writer.deactivate(item.message_ids)
+            elif item:
+                writer.add(*item)
+            if writer.due():
+                await flush()
+            if writer.flushes != stats['logged_flushes']:
+                stats['logged_flushes'] = writer.flushes
+                log(f"  Progress: {writer.inserted:,} inserted, {writer.ignored:,} already indexed, "
+                    f"{stats['skipped']:,} skipped ({stats['scanned']:,} messages scanned)")
+        await flush()
+
+async def fetch_all(fetchers, queue, writer, stats, overlap=True):
+    """
+    Run the (label, coroutine) fetchers, which fill queue, against one
+    writer task. Returns [(label, exception)] for the fetchers that
+    failed; a writer error cancels the fetchers and is raised.
+    """
+    writer_task = asyncio.create_task(write_rows(queue, writer, stats, overlap))
+    fetching = asyncio.gather(*(fetcher for _, fetcher in fetchers), return_exceptions=True)
+    await asyncio.wait([fetching, writer_task], return_when=asyncio.FIRST_COMPLETED)
+    if writer_task.done():  # before the sentinel, the writer only stops on an error
+        fetching.cancel()
+        await asyncio.gather(fetching, return_exceptions=True)
+        await writer_task
+    results = fetching.result()
+    await queue.put(None)
+    await writer_task
+    return [(label, result) for (label, _), result in zip(fetchers, results) if isinstance(result, Exception)]
+
+def make_client(args):
+    """Telethon client, or the offline fake with --fake-channel."""
+    if args.fake_channel:
+        from fake_telegram import FakeTelegramClient
+        log(f"Using fake Telegram client ({args.fake_channel:,} messages)")
+        return FakeTelegramClient(args.fake_channel, latency=args.fake_latency / 1000,
+                                  flood_every=args.fake_flood_every, fail_every=args.fake_fail_every,
+                                  post_interval=args.fake_post_interval,
+                                  disconnect_after=args.fake_disconnect_after, chat_id=CHANNEL_ID)
     try:
         from telethon import TelegramClient
-        from telethon.tl.types import MessageMediaDocument
     except ImportError:
         log("ERROR: telethon not installed. Run: pip install telethon")
         sys.exit(1)
+    # The live tail has its own session, so it can run next to a backfill
+    session_path = Path(SQLITE_DB).parent / ('follow_session' if args.follow else 'backfill_session')
+    # flood_sleep_threshold=0: every flood wait reaches the shared limiter
+    return profiled_client_class(TelegramClient)(str(session_path), API_ID, API_HASH, flood_sleep_threshold=0)
 
+async def backfill_messages(args):
+    """Main backfill function"""
+    profiler.stage('status')
     status = get_db_status(SQLITE_DB)
     if not status:
         log(f"ERROR: Database not found at {SQLITE_DB}")
@@ -145,21 +796,53 @@ async def backfill_messages(args):
     else:
         log("  Not found in database")
 
+    conn = sqlite3.connect(SQLITE_DB)
+    unfinished = [(lo, hi, done) for lo, hi, done in load_checkpoints(conn) if done < hi]
+    holes = find_holes(conn) if args.gaps else []
+    conn.close()
+    if unfinished:
+        log("")
+        log(f"Interrupted backfill: {len(unfinished)} unfinished shards, "
+            f"{sum(hi - done for _, hi, done in unfinished):,} message ids left"
+            + ("" if args.resume else " (continue with --resume)"))
+
+    if args.gaps:
+        missing = sum(hi - lo + 1 for lo, hi in holes)
+        log("")
+        log(f"Unscanned holes between {status['min_id']:,} and {status['max_id']:,}: "
+            f"{len(holes):,} ranges, {missing:,} message ids")
+        for lo, hi in sorted(holes, key=lambda h: h[0] - h[1])[:5]:
+            log(f"  {lo:,} to {hi:,} ({hi - lo + 1:,} ids)")
+
     if args.check:
         log("")
         log("Check complete. Run with --live to backfill.")
         return
 
-    min_id = status['min_id']
-    target_start = 1
-    target_end = min_id - 1
+    if args.gaps:
+        if not holes:
+            log("No holes to fetch")
+            return
+        log("")
+        log(f"Will fetch {missing:,} message ids in {(missing + PAGE_SIZE - 1) // PAGE_SIZE:,} requests")
+    elif args.resume:
+        if not unfinished:
+            log("Nothing to resume: the last backfill finished every shard")
+            return
+        log("")
+        for lo, hi, done in unfinished:
+            log(f"Will resume shard {lo:,}-{hi:,} from {done + 1:,}")
+    else:
+        min_id = status['min_id']
+        target_start = 1
+        target_end = min_id - 1
 
-    if target_end <= 0:
-        log("No messages to backfill - database already starts at 1")
-        return
+        if target_end <= 0:
+            log("No messages to backfill - database already starts at 1")
+            return
 
-    log("")
-    log(f"Will fetch messages {target_start:,} to {target_end:,} ({target_end:,} messages)")
+        log("")
+        log(f"Will fetch messages {target_start:,} to {target_end:,} ({target_end:,} messages)")
 
     if args.dry_run:
         log("")
@@ -168,12 +851,11 @@ async def backfill_messages(args):
         return
 
     # Connect to Telegram
+    profiler.stage('connect')
     log("")
     log("Connecting to Telegram...")
 
-    session_path = Path(SQLITE_DB).parent / 'backfill_session'
-    client = TelegramClient(str(session_path), API_ID, API_HASH)
-
+    client = make_client(args)
     await client.start()
     log("Connected!")
 
@@ -188,99 +870,66 @@ async def backfill_messages(args):
         return
 
     # Open database connection
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
+    conn = open_backfill_db(SQLITE_DB)
+    ensure_parse_cache(conn)
+    conn.execute(SCANNED_RANGES_SCHEMA)
+    conn.execute(CHECKPOINTS_SCHEMA)
+    writer = BackfillWriter(conn, args.flush_rows, args.flush_seconds)
 
-    # Process messages in batches
-    indexed = 0
-    skipped = 0
-    batch_size = 100
+    # Shards fetch concurrently; one writer task (flushing on its own
+    # thread) owns the connection
+    profiler.stage('fetch')
+    limiter = TokenBucket(args.rate, REQUEST_BURST)
+    queue = asyncio.Queue(maxsize=QUEUE_ROWS)
+    stats = {'scanned': 0, 'skipped': 0, 'deleted': 0, 'retries': 0, 'logged_flushes': 0}
 
     log("")
-    log(f"Fetching messages from {target_start} to {target_end}...")
+    if args.gaps:
+        batches = hole_batches(holes)
+        workers = max(1, min(args.shards, (missing + PAGE_SIZE - 1) // PAGE_SIZE))
+        fetchers = [(f"gap worker {n + 1}", fetch_holes(client, channel, batches, limiter, queue, stats))
+                    for n in range(workers)]
+        log(f"Fetching {missing:,} hole ids with {workers} workers ({args.rate:g} requests/s)...")
+    elif args.resume:
+        fetchers = [(f"{lo:,}-{hi:,}", fetch_shard(client, channel, lo, hi, limiter, queue, stats, after=done))
+                    for lo, hi, done in unfinished]
+        log(f"Resuming {len(unfinished)} shards ({args.rate:g} requests/s)...")
+    else:
+        shards = shard_ranges(target_start, target_end, args.shards)
+        start_checkpoints(conn, shards)
+        fetchers = [(f"{lo:,}-{hi:,}", fetch_shard(client, channel, lo, hi, limiter, queue, stats))
+                    for lo, hi in shards]
+        log(f"Fetching messages from {target_start} to {target_end} in {len(shards)} shards "
+            f"({args.rate:g} requests/s)...")
 
     try:
-        # Iterate through messages starting from oldest
-        async for message in client.iter_messages(
-            channel,
-            min_id=target_start - 1,  # inclusive
-            max_id=target_end + 1,    # inclusive
-            reverse=True              # oldest first
-        ):
-            if not message.media or not hasattr(message.media, 'document'):
-                continue
-
-            doc = message.media.document
-            if not doc:
-                continue
-
-            # Get filename from attributes
-            filename = None
-            for attr in doc.attributes:
-                if hasattr(attr, 'file_name'):
-                    filename = attr.file_name
-                    break
-
-            if not filename:
-                skipped += 1
-                continue
-
-            # Check if it's a video or subtitle
-            ext = Path(filename).suffix.lower()
-            if ext not in VIDEO_EXTENSIONS and ext not in SUBTITLE_EXTENSIONS:
-                skipped += 1
-                continue
-
-            # Prepare data for insertion
-            file_data = {
-                'message_id': message.id,
-                'file_id': str(doc.id),
-                'file_name': filename,
-                'file_size': doc.size,
-                'quality': extract_quality(filename),
-                'year': extract_year(filename),
-                'is_series': is_series(filename),
-                'created_at': message.date.isoformat() if message.date else None,
-            }
-
-            # Insert into database
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO movies
-                    (message_id, file_id, file_name, file_size, quality, year, is_series, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    file_data['message_id'],
-                    file_data['file_id'],
-                    file_data['file_name'],
-                    file_data['file_size'],
-                    file_data['quality'],
-                    file_data['year'],
-                    file_data['is_series'],
-                    file_data['created_at'],
-                ))
-                indexed += 1
-            except sqlite3.IntegrityError:
-                skipped += 1  # Already exists
-
-            # Progress log
-            if indexed % batch_size == 0:
-                conn.commit()
-                log(f"  Progress: {indexed:,} indexed, {skipped:,} skipped (at msg {message.id})")
-
+        for label, error in await fetch_all(fetchers, queue, writer, stats):
+            log(f"ERROR during backfill of {label}: {error}")
     except Exception as e:
-        log(f"ERROR during backfill: {e}")
-
-    # Final commit
-    conn.commit()
+        log(f"ERROR writing backfilled rows: {e}")
+    skipped = stats['skipped']
+    scanned = stats['scanned']
+    unfinished = [(lo, hi, done) for lo, hi, done in load_checkpoints(conn) if done < hi]
     conn.close()
+    profiler.count(scanned)
 
     await client.disconnect()
+    profiler.stage('verify')
 
     log("")
     log("=== BACKFILL COMPLETE ===")
-    log(f"Indexed: {indexed:,}")
+    log(f"Inserted: {writer.inserted:,}")
+    log(f"Already indexed: {writer.ignored:,}")
     log(f"Skipped: {skipped:,}")
+    if args.gaps:
+        log(f"Deleted: {stats['deleted']:,}")
+    log(f"Transactions: {writer.flushes:,}")
+    if limiter.flood_waits:
+        log(f"Flood waits: {limiter.flood_waits:,} ({limiter.flood_seconds:,}s)")
+    if stats['retries']:
+        log(f"Retried requests: {stats['retries']:,}")
+    if unfinished and not args.gaps:
+        log(f"Unfinished shards: {len(unfinished)} - run again with --resume")
 
     # Check new status
     new_status = get_db_status(SQLITE_DB)
@@ -289,32 +938,195 @@ async def backfill_messages(args):
     log(f"  Total files: {new_status['total']:,}")
     log(f"  Message ID range: {new_status['min_id']:,} to {new_status['max_id']:,}")
 
+def event_builders(args):
+    """telethon.events, or the fake client's stand-ins with --fake-channel."""
+    if args.fake_channel:
+        import fake_telegram
+        return fake_telegram
+    from telethon import events
+    return events
+
+def ensure_active_column(conn):
+    """movies.is_active (1 unless --follow saw the message deleted)."""
+    if not any(row[1] == 'is_active' for row in conn.execute('PRAGMA table_info(movies)')):
+        conn.execute('ALTER TABLE movies ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1')
+        log("Added movies.is_active")
+
+async def catch_up(client, channel, limiter, queue, stats, shards):
+    """Fetch everything posted after MAX(message_id) (missed while not listening)."""
+    status = get_db_status(SQLITE_DB)
+    latest = await limited_request(limiter, 'latest message', lambda: client.get_messages(channel, limit=1), stats)
+    if not latest:
+        return
+    start, end = status['max_id'] + 1, latest[0].id
+    if start > end:
+        log(f"Up to date at message {status['max_id']:,}")
+        return
+    log(f"Catching up on messages {start:,} to {end:,}...")
+    ranges = shard_ranges(start, end, shards)
+    results = await asyncio.gather(
+        *(fetch_shard(client, channel, lo, hi, limiter, queue, stats) for lo, hi in ranges),
+        return_exceptions=True,
+    )
+    for (lo, hi), result in zip(ranges, results):
+        if isinstance(result, Exception):
+            raise result
+
+async def follow_channel(args):
+    """--follow: catch up from MAX(message_id), then index live posts, edits and deletions."""
+    profiler.stage('connect')
+    if not get_db_status(SQLITE_DB):
+        log(f"ERROR: Database not found at {SQLITE_DB}")
+        sys.exit(1)
+    events = event_builders(args)
+    client = make_client(args)
+
+    conn = open_backfill_db(SQLITE_DB)
+    ensure_parse_cache(conn)
+    conn.execute(SCANNED_RANGES_SCHEMA)
+    conn.execute(CHECKPOINTS_SCHEMA)
+    ensure_active_column(conn)
+    writer = BackfillWriter(conn, args.flush_rows, args.flush_seconds)
+    writer.lag = IngestLag(args.metrics_file)
+    limiter = TokenBucket(args.rate, REQUEST_BURST)
+    queue = asyncio.Queue(maxsize=QUEUE_ROWS)
+    stats = {'scanned': 0, 'skipped': 0, 'deleted': 0, 'retries': 0, 'logged_flushes': 0}
+    writer_task = asyncio.create_task(write_rows(queue, writer, stats))
+
+    # Handlers stay registered across reconnects; rows that also arrive
+    # through a catch-up are ignored by INSERT OR IGNORE
+    async def on_message(event):
+        stats['scanned'] += 1
+        item = message_row(event.message)
+        if item == 'skip':
+            stats['skipped'] += 1
+        elif item is not None:
+            await queue.put(item)
+
+    async def on_edit(event):
+        item = message_row(event.message)
+        if item not in (None, 'skip'):
+            await queue.put(Edited(*item))
+
+    async def on_delete(event):
+        if event.deleted_ids:
+            await queue.put(Deleted(event.deleted_ids))
+
+    client.add_event_handler(on_message, events.NewMessage(chats=CHANNEL_ID))
+    client.add_event_handler(on_edit, events.MessageEdited(chats=CHANNEL_ID))
+    client.add_event_handler(on_delete, events.MessageDeleted(chats=CHANNEL_ID))
+
+    profiler.stage('follow')
+    attempt = 0
+    try:
+        while True:
+            try:
+                await client.start()
+                channel = await client.get_entity(CHANNEL_ID)
+                log(f"Connected: {channel.title}")
+                await catch_up(client, channel, limiter, queue, stats, args.shards)
+                log("Following new messages, edits and deletions (Ctrl-C to stop)")
+                attempt = 0
+                await client.run_until_disconnected()
+                log("Disconnected from Telegram")
+            except Exception as e:
+                if not is_transient(e) and not isinstance(e, OSError):
+                    raise
+                log(f"  {type(e).__name__}: {e}")
+            if writer_task.done():
+                break  # the writer failed; its error is raised below
+            attempt += 1
+            delay = min(RETRY_BACKOFF_BASE * (2 ** (attempt - 1)), RETRY_BACKOFF_MAX)
+            log(f"Reconnecting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+    finally:
+        if not writer_task.done():
+            await queue.put(None)
+        await writer_task
+        conn.close()
+        profiler.count(stats['scanned'])
+        log(f"Live tail stopped: {writer.inserted:,} inserted, {writer.updated:,} edited, "
+            f"{writer.deactivated:,} deactivated"
+            + (f", last ingest lag {writer.lag.last:.1f}s" if writer.lag.last is not None else ""))
+
 def main():
+    global SQLITE_DB
     parser = argparse.ArgumentParser(description='Backfill older Telegram messages into SQLite')
     parser.add_argument('--check', action='store_true', help='Check status only')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done')
     parser.add_argument('--live', action='store_true', help='Actually backfill')
+    parser.add_argument('--follow', action='store_true',
+                        help='Live tail: catch up from MAX(message_id), then index new posts, edits and deletions')
+    parser.add_argument('--metrics-file', default=None,
+                        help='With --follow: Prometheus textfile for the ingest lag (message date -> commit)')
+    parser.add_argument('--gaps', action='store_true',
+                        help='Find missing message_id ranges inside the index and fetch only those ids')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the unfinished shards of an interrupted backfill from their checkpoints')
+    parser.add_argument('--db', default=SQLITE_DB, help='movies.db to backfill')
+    parser.add_argument('--shards', type=int, default=SHARDS, help='Concurrent fetch coroutines')
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND,
+                        help='Telegram history requests per second, across all shards')
+    parser.add_argument('--fake-channel', type=int, default=0, metavar='N',
+                        help='Offline test: read a generated channel of N messages instead of Telegram')
+    parser.add_argument('--fake-latency', type=float, default=50, help='Fake client latency per request (ms)')
+    parser.add_argument('--fake-flood-every', type=int, default=0,
+                        help='Fake client: every Nth request raises FloodWaitError')
+    parser.add_argument('--fake-fail-every', type=int, default=0,
+                        help='Fake client: every Nth request drops the connection')
+    parser.add_argument('--fake-post-interval', type=float, default=1.0,
+                        help='Fake client with --follow: seconds between live posts/edits/deletions')
+    parser.add_argument('--fake-disconnect-after', type=int, default=0,
+                        help='Fake client with --follow: drop the connection after every N live events')
+    parser.add_argument('--flush-rows', type=int, default=FLUSH_ROWS,
+                        help='Rows per write transaction')
+    parser.add_argument('--flush-seconds', type=float, default=FLUSH_SECONDS,
+                        help='Longest a buffered row waits before its transaction')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report per-stage wall/CPU/RSS/items and Telegram request latencies (JSON + Prometheus)')
+    parser.add_argument('--profile-dir', default='.',
+                        help='Where --profile writes backfill_telegram_sqlite.profile.json and .prom')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='With --profile: also dump cProfile stats of the slowest stage')
     args = parser.parse_args()
 
-    if not args.check and not args.dry_run and not args.live:
+    if not args.check and not args.dry_run and not args.live and not args.follow:
         parser.print_help()
         log("")
-        log("Please specify --check, --dry-run, or --live")
+        log("Please specify --check, --dry-run, --live or --follow")
         sys.exit(1)
 
+    SQLITE_DB = args.db
+    if args.resume and args.gaps:
+        parser.error('--resume continues a range backfill; it cannot be combined with --gaps')
+    if args.follow and (args.check or args.dry_run or args.live or args.gaps or args.resume):
+        parser.error('--follow is a mode of its own; run the backfill modes separately')
+
     log("Telegram SQLite Backfill Script")
-    log(f"Mode: {'CHECK' if args.check else 'DRY-RUN' if args.dry_run else 'LIVE'}")
+    log(f"Mode: {'CHECK' if args.check else 'DRY-RUN' if args.dry_run else 'FOLLOW' if args.follow else 'LIVE'}")
     log("")
 
     # Check configuration
-    if CHANNEL_ID == -1001234567890 or API_ID == 12345678:
+    if not args.fake_channel and (CHANNEL_ID == -1001234567890 or API_ID == 12345678):
         log("WARNING: Default configuration detected!")
         log("Please update CHANNEL_ID, API_ID, and API_HASH in the script")
-        if args.live:
-            log("Cannot run in LIVE mode with default configuration")
+        if args.live or args.follow:
+            log("Cannot run in LIVE or FOLLOW mode with default configuration")
             sys.exit(1)
 
-    asyncio.run(backfill_messages(args))
+    profiler.cprofile = args.profile and args.cprofile
+    try:
+        asyncio.run(follow_channel(args) if args.follow else backfill_messages(args))
+    except KeyboardInterrupt:
+        if not args.follow:
+            raise
+    finally:
+        if args.profile:
+            log("")
+            log("Profile:")
+            profiler.print_table()
+            for path in profiler.write_reports(args.profile_dir):
+                log(f"  Wrote {path}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: adaptive (AIMD) insert batch size of the episode migration
+=====================================================================
+Starts a local PostgREST stand-in (POST /download_links only) whose
+response time is a fixed per-request overhead plus a per-row cost, with
+a statement timeout that answers 500 like PostgREST does when Postgres
+cancels the insert. The same synthetic rows are then written through
+LinkWriter at a few fixed batch sizes and once with the adaptive sizer;
+each run prints rows/s and, for the adaptive one, where it settled.
+
+Rows that fail after retries (oversized fixed batches hitting the
+statement timeout) are reported; the run fails only if a writer loses or
+duplicates rows.
+
+Usage:
+  python3 bench-adaptive-batching.py                          # defaults below
+  python3 bench-adaptive-batching.py --row-ms 0.5 --timeout 1.5
+  python3 bench-adaptive-batching.py --rows 50000 --fixed 100,1000,5000
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import importlib.util
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The migration script's file name is not importable as-is
+_spec = importlib.util.spec_from_file_location(
+    "migrate_episode_ddl", Path(__file__).with_name("migrate-episode-ddl.py"))
+migrate = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = migrate
+_spec.loader.exec_module(migrate)
+
+
+class StandIn(ThreadingHTTPServer):
+    """PostgREST stand-in: latency = overhead + rows * per-row cost."""
+
+    daemon_threads = True
+
+    def __init__(self, overhead: float, per_row: float, statement_timeout: float, pool: int):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.overhead = overhead
+        self.per_row = per_row
+        self.statement_timeout = statement_timeout
+        self.slots = threading.BoundedSemaphore(pool)  # Postgres connections behind PostgREST
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.ids = []
+        self.requests = 0
+        self.timeouts = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        rows = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.slots:
+            cost = server.overhead + len(rows) * server.per_row
+            if cost > server.statement_timeout:
+                time.sleep(server.statement_timeout)
+                with server.lock:
+                    server.requests += 1
+                    server.timeouts += 1
+                body = b'{"code":"57014","message":"canceling statement due to statement timeout"}'
+                self.send_response(500)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            time.sleep(cost)
+        with server.lock:
+            server.requests += 1
+            server.ids.extend(int(r["telegram_file_id"]) for r in rows)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def synthetic_rows(n: int) -> list:
+    return [migrate.make_link_row(100000 + i // 2, ("720p", "1080p")[i % 2], f"{1 + i % 3000} MB", i,
+                                  ("webdl", "bluray", "hdtv", "other")[i % 4])
+            for i in range(n)]
+
+
+def run(server: StandIn, rows: list, label: str, batch_size: int, bounds: tuple, writers: int) -> bool:
+    server.reset()
+    start = time.perf_counter()
+    writer = migrate.LinkWriter(live=True, batch_size=batch_size, workers=writers, journal_path="",
+                                batch_bounds=bounds)
+    for row in rows:
+        writer.submit(row)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    # Failed rows are fine (oversized fixed batches time out); lost or doubled ones are not
+    ok = (len(server.ids) == len(set(server.ids)) == writer.inserted
+          and writer.inserted + writer.failed_rows == len(rows))
+    settled = (f"  settled {writer.sizer.size:,} (ranged {writer.sizer.low:,}-{writer.sizer.high:,})"
+               if writer.sizer.adaptive else "")
+    print(f"  {label:16} {len(rows) / elapsed:>10,.0f} rows/s  {elapsed:6.2f}s  "
+          f"{server.requests:>5,} requests  {server.timeouts:>3,} timeouts  {writer.retries:>3,} retries  {writer.failed_rows:>6,} failed"
+          f"{settled}{'' if ok else '  ROWS MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed vs adaptive LinkWriter batch size against a local stand-in")
+    parser.add_argument("--rows", type=int, default=50000, help="Rows to insert per run")
+    parser.add_argument("--overhead-ms", type=float, default=40.0, help="Per-request latency")
+    parser.add_argument("--row-ms", type=float, default=0.25, help="Per-row latency")
+    parser.add_argument("--timeout", type=float, default=1.5, help="Stand-in statement timeout (seconds)")
+    parser.add_argument("--pool", type=int, default=4, help="Concurrent inserts the stand-in serves")
+    parser.add_argument("--writers", type=int, default=migrate.WRITER_THREADS, help="LinkWriter threads")
+    parser.add_argument("--fixed", type=str, default="50,500,2000,5000", help="Fixed batch sizes to compare")
+    parser.add_argument("--start", type=int, default=500, help="Adaptive starting batch size")
+    parser.add_argument("--batch-min", type=int, default=migrate.BATCH_MIN)
+    parser.add_argument("--batch-max", type=int, default=migrate.BATCH_MAX)
+    parser.add_argument("--target", type=float, default=migrate.BATCH_TARGET_SECONDS,
+                        help="Adaptive latency target per batch (seconds)")
+    args = parser.parse_args()
+
+    server = StandIn(args.overhead_ms / 1000, args.row_ms / 1000, args.timeout, args.pool)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    migrate.POSTGREST_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    migrate.BATCH_TARGET_SECONDS = args.target
+
+    rows = synthetic_rows(args.rows)
+    print(f"Stand-in: {args.overhead_ms:g}ms/request + {args.row_ms:g}ms/row, "
+          f"statement timeout {args.timeout:g}s, {args.pool} connections")
+    print(f"{args.rows:,} rows, {args.writers} writer threads, adaptive target {args.target:g}s/batch")
+
+    ok = True
+    for size in (int(x) for x in args.fixed.split(",") if x):
+        ok &= run(server, rows, f"fixed {size}", size, (size, size), args.writers)
+    ok &= run(server, rows, f"adaptive {args.batch_min}-{args.batch_max}", args.start,
+              (args.batch_min, args.batch_max), args.writers)
+
+    server.shutdown()
+    if not ok:
+        print("FAIL: a writer lost or duplicated rows")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Telegram backfill throughput with and without write overlap
+======================================================================
+Runs the backfill's fetch/write pipeline (shards, token bucket, writer
+task) against fake_telegram.FakeTelegramClient into a fresh movies.db,
+twice:
+
+  inline     writer.flush() runs on the event loop: every commit stalls
+             the Telegram reads of all shards
+  overlap    flushes run on the writer thread (what the script does)
+
+and reports messages/sec, the worst event-loop stall seen by a probe
+task, and the rows written. Both runs must write the same rows.
+
+Usage:
+  python3 bench-backfill-overlap.py
+  python3 bench-backfill-overlap.py --messages 200000 --latency-ms 20 --flush-rows 2000
+  python3 bench-backfill-overlap.py --work-dir /opt/trendimovies/tmp   # on the real disk
+"""
+
+import sys
+import time
+import shutil
+import asyncio
+import sqlite3
+import tempfile
+import argparse
+import importlib.util
+from pathlib import Path
+
+# The backfill script's file name is not importable as-is
+_spec = importlib.util.spec_from_file_location(
+    "backfill_telegram_sqlite", Path(__file__).with_name("backfill-telegram-sqlite.py"))
+backfill = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = backfill
+_spec.loader.exec_module(backfill)
+
+from fake_telegram import FakeTelegramClient
+from release_parser import ensure_parse_cache
+
+DEFAULT_WORK_DIR = Path(tempfile.gettempdir()) / "backfill-overlap-bench"
+
+# How often the stall probe wakes up
+PROBE_INTERVAL = 0.005
+
+MOVIES_SCHEMA = """
+    CREATE TABLE movies (id INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER UNIQUE, file_id TEXT,
+        file_name TEXT, file_size INTEGER, quality TEXT, year INTEGER, is_series INTEGER DEFAULT 0,
+        created_at TEXT, source TEXT, resolution TEXT)
+"""
+
+
+async def probe_stalls(stop: asyncio.Event, worst: list):
+    """Record the longest time the loop took to wake this task past its deadline."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        worst[0] = max(worst[0], time.perf_counter() - t0 - PROBE_INTERVAL)
+
+
+async def run_pipeline(db_path: Path, args, overlap: bool) -> dict:
+    conn = backfill.open_backfill_db(str(db_path))
+    ensure_parse_cache(conn)
+    conn.execute(backfill.SCANNED_RANGES_SCHEMA)
+    conn.execute(backfill.CHECKPOINTS_SCHEMA)
+    writer = backfill.BackfillWriter(conn, args.flush_rows, args.flush_seconds)
+    client = FakeTelegramClient(args.messages, latency=args.latency_ms / 1000)
+    limiter = backfill.TokenBucket(rate=1e6, burst=1e6)  # the fake has no rate limit
+    queue = asyncio.Queue(maxsize=backfill.QUEUE_ROWS)
+    stats = {"scanned": 0, "skipped": 0, "deleted": 0, "retries": 0, "logged_flushes": 0}
+
+    shards = backfill.shard_ranges(1, args.messages, args.shards)
+    backfill.start_checkpoints(conn, shards)
+    fetchers = [(f"{lo}-{hi}", backfill.fetch_shard(client, None, lo, hi, limiter, queue, stats))
+                for lo, hi in shards]
+
+    stop = asyncio.Event()
+    worst = [0.0]
+    probe = asyncio.create_task(probe_stalls(stop, worst))
+    t0 = time.perf_counter()
+    errors = await backfill.fetch_all(fetchers, queue, writer, stats, overlap=overlap)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    conn.close()
+    if errors:
+        raise RuntimeError(f"fetch failed: {errors}")
+    return {
+        "elapsed": elapsed,
+        "scanned": stats["scanned"],
+        "inserted": writer.inserted,
+        "flushes": writer.flushes,
+        "requests": client.requests,
+        "worst_stall": worst[0],
+    }
+
+
+def fingerprint(db_path: Path):
+    conn = sqlite3.connect(str(db_path))
+    rows = conn.execute("SELECT COUNT(*), SUM(message_id), SUM(LENGTH(file_name)) FROM movies").fetchone()
+    cached = conn.execute("SELECT COUNT(*) FROM file_parse_cache").fetchone()[0]
+    conn.close()
+    return rows + (cached,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill throughput with and without the writer thread")
+    parser.add_argument("--messages", type=int, default=50000, help="Fake channel size")
+    parser.add_argument("--shards", type=int, default=backfill.SHARDS)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake Telegram latency per request")
+    parser.add_argument("--flush-rows", type=int, default=backfill.FLUSH_ROWS)
+    parser.add_argument("--flush-seconds", type=float, default=backfill.FLUSH_SECONDS)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per mode (best time is kept)")
+    parser.add_argument("--work-dir", type=str, default=str(DEFAULT_WORK_DIR),
+                        help="Where the test databases are created (pick the disk you care about)")
+    args = parser.parse_args()
+
+    backfill.log = lambda msg: None  # progress lines would swamp the table
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"{args.messages:,} messages, {args.shards} shards, {args.latency_ms:g}ms/request, "
+          f"{args.flush_rows} rows per transaction, databases in {work_dir}")
+    print()
+    print(f"  {'Mode':8} {'Seconds':>9} {'Messages/s':>11} {'Worst stall':>12} {'Inserted':>10} {'Flushes':>8}")
+
+    results = {}
+    prints = {}
+    for mode, overlap in (("inline", False), ("overlap", True)):
+        best = None
+        for _ in range(args.repeat):
+            db_path = work_dir / f"bench-{mode}.db"
+            for suffix in ("", "-wal", "-shm"):
+                Path(str(db_path) + suffix).unlink(missing_ok=True)
+            conn = sqlite3.connect(str(db_path))
+            conn.execute(MOVIES_SCHEMA)
+            conn.close()
+            result = asyncio.run(run_pipeline(db_path, args, overlap))
+            if best is None or result["elapsed"] < best["elapsed"]:
+                best = result
+            prints[mode] = fingerprint(db_path)
+        results[mode] = best
+        rate = best["scanned"] / best["elapsed"]
+        print(f"  {mode:8} {best['elapsed']:>8.2f}s {rate:>11,.0f} {best['worst_stall'] * 1000:>10.1f}ms "
+              f"{best['inserted']:>10,} {best['flushes']:>8,}")
+
+    inline, overlap = results["inline"], results["overlap"]
+    print()
+    print(f"Overlap speedup: {inline['elapsed'] / overlap['elapsed']:.2f}x")
+    if prints["inline"] != prints["overlap"]:
+        print(f"FAIL: the two modes wrote different rows: {prints['inline']} vs {prints['overlap']}")
+        sys.exit(1)
+    print("Both modes wrote the same rows")
+    if work_dir == DEFAULT_WORK_DIR:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Check + benchmark: columnar (NumPy) episode file picking
+========================================================
+Property check for pick_best_columnar() in migrate-episode-ddl.py: on
+randomly generated episode groups it must return exactly what the
+scalar pick_best_episode_files() returns for every group (same files,
+same float scores, same dict order). Groups are built to hit the
+tie-breaks: equal base scores, equal or missing sizes, and sizes past
+the 5 GiB penalty cap, where the earlier file has to win.
+
+With --db the same comparison (and timing) runs on a real movies.db.
+
+Usage:
+  python3 bench-columnar-scoring.py                  # 2000 random trials
+  python3 bench-columnar-scoring.py --trials 20000 --seed 7
+  python3 bench-columnar-scoring.py --db /opt/trendimovies/bot/database/movies.db
+"""
+
+import sys
+import time
+import random
+import argparse
+import importlib.util
+from pathlib import Path
+
+# The migration script's file name is not importable as-is
+_spec = importlib.util.spec_from_file_location(
+    "migrate_episode_ddl", Path(__file__).with_name("migrate-episode-ddl.py"))
+migrate = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = migrate
+_spec.loader.exec_module(migrate)
+
+VARIANT_TAGS = ["BluRay", "WEB-DL", "WEBRip", "HDTV", "HDRip", "AMZN", "NF", ""]
+CODEC_TAGS = ["x265", "HEVC", "x264", "H.264", ""]
+GROUP_TAGS = ["PSA", "BONE", "RMTeam", "YTS", "RARBG", "NTb", ""]
+QUALITY_TAGS = ["720p", "1080p", "2160p", "480p", ""]
+GIB = 1024 * 1024 * 1024
+
+
+def random_size(rng: random.Random, sizes: list) -> int:
+    roll = rng.random()
+    if roll < 0.15 and sizes:
+        return rng.choice(sizes)                  # exact tie with an earlier file
+    if roll < 0.20:
+        return rng.choice((0, None))              # no size: no penalty
+    if roll < 0.30:
+        return rng.randint(5 * GIB, 40 * GIB)     # past the cap: penalty 0.99
+    return rng.randint(50 * 1024 * 1024, 4 * GIB)
+
+
+def random_groups(rng: random.Random, count: int) -> dict:
+    groups = {}
+    sqlite_id = 0
+    for g in range(count):
+        files = []
+        sizes = []
+        # Few tag choices per group so equal base scores are common
+        variants = rng.sample(VARIANT_TAGS, 2)
+        codecs = rng.sample(CODEC_TAGS, 2)
+        for _ in range(rng.randint(0, 8)):
+            sqlite_id += rng.randint(1, 3)
+            quality = rng.choice(QUALITY_TAGS)
+            name = ".".join(t for t in (
+                "Show", f"S01E{g % 99 + 1:02d}", quality, rng.choice(variants), rng.choice(codecs),
+            ) if t) + "-" + rng.choice(GROUP_TAGS) + ".mkv"
+            size = random_size(rng, sizes)
+            sizes.append(size)
+            resolution = rng.choice(("", "", "720p", "1080p", " 1080P "))
+            files.append(migrate.EpisodeFile(sqlite_id, name, size, rng.choice(("", quality)), resolution,
+                                             None, None, migrate.parse_release(name)))
+        groups[("show", 1, g)] = files
+    return groups
+
+
+def compare(groups: dict, columnar: dict) -> int:
+    mismatches = 0
+    for key, files in groups.items():
+        scalar = migrate.pick_best_episode_files(files)
+        got = columnar[key]
+        if scalar != got or list(scalar) != list(got):
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  MISMATCH {key}:\n    scalar   {scalar}\n    columnar {got}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check columnar picking against the scalar path")
+    parser.add_argument("--trials", type=int, default=2000, help="Random trials (each one a batch of groups)")
+    parser.add_argument("--groups", type=int, default=50, help="Groups per trial")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed")
+    parser.add_argument("--db", type=str, default="", help="Also compare on this movies.db")
+    args = parser.parse_args()
+
+    if not migrate.HAS_NUMPY:
+        print("ERROR: numpy required. Install: pip install numpy")
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    mismatches = 0
+    print(f"Property check: {args.trials:,} trials x {args.groups} groups...")
+    for _ in range(args.trials):
+        groups = random_groups(rng, args.groups)
+        mismatches += compare(groups, migrate.pick_best_columnar(groups))
+    print(f"  {mismatches:,} mismatching groups")
+
+    if args.db:
+        print(f"Real data: {args.db}")
+        groups = migrate.group_episodes(migrate.iter_episode_files(args.db))
+        start = time.perf_counter()
+        for files in groups.values():
+            migrate.pick_best_episode_files(files)
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        columnar = migrate.pick_best_columnar(groups)
+        columnar_time = time.perf_counter() - start
+        print(f"  {len(groups):,} groups: scalar {scalar_time:.3f}s, columnar {columnar_time:.3f}s")
+        db_mismatches = compare(groups, columnar)
+        print(f"  {db_mismatches:,} mismatching groups")
+        mismatches += db_mismatches
+
+    if mismatches:
+        print("ERROR: columnar picks differ from the scalar path")
+        sys.exit(1)
+    print("  Columnar picks identical to the scalar path")
+
+
+if __name__ == "__main__":
+    main()
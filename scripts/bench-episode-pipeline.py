@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: episode selection pipeline on a synthetic corpus
+=================================================================
+Generates a movies.db shaped like the bot's channel index (movies +
+movie_metadata) and a matching series/season/episode catalogue (saved as
+a catalogue index file, so no PostgREST is needed), then times the hot
+paths of migrate-episode-ddl.py at each corpus size:
+
+  fetch_episode_files      SQLite read + parse (parse cache off)
+  group_episodes           grouping by (series, season, episode)
+  pick_best_episode_files  720p/1080p pick for every group
+  fuzzy_match              FuzzySeriesMatcher over titles that miss exactly
+  dry_run                  the whole migration, dry-run, --catalogue
+
+Every stage also records a fingerprint of what it produced (hash of the
+picks, matched names, link counts). Results are compared with a baseline
+file: a stage more than --tolerance slower, or any changed fingerprint,
+fails the run. After an intended change, re-run with --save-baseline.
+
+Corpora are cached in --work-dir, keyed by their parameters.
+
+Usage:
+  python3 bench-episode-pipeline.py                          # 10k, 100k, 1M rows
+  python3 bench-episode-pipeline.py --sizes 10000,100000     # quicker
+  python3 bench-episode-pipeline.py --save-baseline          # accept current results
+  python3 bench-episode-pipeline.py --non-english 0.3 --typos 0.2 --no-baseline
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import tempfile
+import argparse
+import platform
+import importlib.util
+from pathlib import Path
+from contextlib import redirect_stdout
+
+# The migration script's file name is not importable as-is
+_spec = importlib.util.spec_from_file_location(
+    "migrate_episode_ddl", Path(__file__).with_name("migrate-episode-ddl.py"))
+migrate = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = migrate
+_spec.loader.exec_module(migrate)
+
+from catalogue_index import CatalogueIndex
+from release_parser import NON_ENGLISH_KEYWORDS, normalize_series_name
+from run_profiler import RunProfiler
+
+DEFAULT_SIZES = "10000,100000,1000000"
+DEFAULT_BASELINE = Path(__file__).with_name("bench-episode-pipeline.baseline.json")
+DEFAULT_WORK_DIR = Path(tempfile.gettempdir()) / "episode-bench-corpus"
+
+# Slower than baseline by more than this fraction AND this many seconds = regression
+NOISE_FLOOR_SECONDS = 0.05
+
+_ADJECTIVES = (
+    "silent", "broken", "golden", "hidden", "last", "dark", "wild", "burning", "frozen", "lost",
+    "crimson", "hollow", "iron", "secret", "bright", "northern", "savage", "quiet", "eternal", "rogue",
+    "scarlet", "shattered", "distant", "forgotten", "wicked", "electric", "paper", "velvet", "stone", "glass",
+)
+_NOUNS = (
+    "river", "crown", "empire", "harbor", "kingdom", "signal", "garden", "frontier", "circle", "mirror",
+    "station", "island", "valley", "legacy", "protocol", "covenant", "horizon", "district", "archive", "orchard",
+    "lantern", "citadel", "meridian", "outpost", "parish", "sanctuary", "tribunal", "voyage", "witness", "dynasty",
+)
+_SUFFIXES = ("", "", "", "chronicles", "files", "academy", "unit", "saga")
+
+_VARIANTS = ("BluRay", "WEB-DL", "WEBRip", "HDTV", "HDRip", "AMZN.WEB-DL", "NF.WEBRip", "DSNP.WEB-DL", "")
+_CODECS = ("x265", "x264", "HEVC", "H.264", "AVC", "")
+_LANGUAGES = ("Hindi", "FRENCH", "Dual.Audio", "Tamil", "Korean", "dubbed", "ITALIAN")
+_AUX_EXTENSIONS = (".srt", ".nfo", ".ass", ".jpg")
+
+
+def parse_mix(text: str) -> tuple[list, list]:
+    """'720p:40,1080p:45,:5' -> (['720p', '1080p', ''], [40.0, 45.0, 5.0])"""
+    values, weights = [], []
+    for item in text.split(","):
+        value, _, weight = item.rpartition(":")
+        values.append(value)
+        weights.append(float(weight))
+    return values, weights
+
+
+def series_titles(count: int, rng: random.Random) -> list[str]:
+    """Distinct, English-looking titles of 1-4 words (no language keyword inside)."""
+    titles = []
+    seen = set()
+    while len(titles) < count:
+        words = [rng.choice(_ADJECTIVES), rng.choice(_NOUNS)]
+        shape = rng.random()
+        if shape < 0.25:
+            words.insert(0, "the")
+        elif shape < 0.35:
+            words = words[1:]
+        suffix = rng.choice(_SUFFIXES)
+        if suffix:
+            words.append(suffix)
+        if len(seen) > len(_ADJECTIVES) * len(_NOUNS):
+            words.append(str(len(titles)))  # word combinations exhausted
+        title = " ".join(words)
+        if title in seen or any(kw in title for kw in NON_ENGLISH_KEYWORDS):
+            continue
+        seen.add(title)
+        titles.append(title.title())
+    return titles
+
+
+def misspell(title: str, rng: random.Random) -> str:
+    """Swap two adjacent letters inside the longest word (keeps the word count)."""
+    words = title.split()
+    i = max(range(len(words)), key=lambda w: len(words[w]))
+    word = words[i]
+    if len(word) < 5:
+        return title
+    j = rng.randrange(1, len(word) - 2)
+    words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    return " ".join(words)
+
+
+def generate_corpus(db_path: Path, catalogue_path: Path, args, rows: int, seed: int):
+    """Write movies.db and the catalogue index for one corpus size."""
+    rng = random.Random(seed)
+    n_series = args.series or max(50, rows // 40)
+    titles = series_titles(n_series, rng)
+    qualities, quality_weights = parse_mix(args.quality_mix)
+    groups, group_weights = parse_mix(args.group_mix)
+
+    # Catalogue: every series but the --unmatched share, with its seasons
+    catalogue = CatalogueIndex()
+    spans = []
+    episode_id = 0
+    for series_id, title in enumerate(titles, 1):
+        seasons = [rng.randint(6, 24) for _ in range(rng.randint(1, 8))]
+        spans.append(seasons)
+        if rng.random() < args.unmatched:
+            continue
+        catalogue.add_series(series_id, 100000 + series_id, normalize_series_name(title))
+        for season, episodes in enumerate(seasons, 1):
+            for episode in range(1, episodes + 1):
+                episode_id += 1
+                catalogue.add_episode(series_id, season, episode, episode_id)
+    catalogue.save(str(catalogue_path))
+
+    # Files: popular series get most of them (Zipf-like)
+    file_titles = [misspell(t, rng) if rng.random() < args.typos else t for t in titles]
+    cum_weights = []
+    total = 0.0
+    for rank in range(n_series):
+        total += 1.0 / (rank + 1) ** 0.8
+        cum_weights.append(total)
+
+    if db_path.exists():
+        db_path.unlink()
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript("""
+        CREATE TABLE movies (id INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER UNIQUE, file_id TEXT,
+            file_name TEXT, file_size INTEGER, quality TEXT, year INTEGER, is_series INTEGER DEFAULT 0,
+            created_at TEXT, source TEXT, resolution TEXT);
+        CREATE TABLE movie_metadata (id INTEGER PRIMARY KEY, movie_id INTEGER, tmdb_id INTEGER, title TEXT);
+    """)
+    batch, metadata = [], []
+    series_ids = rng.choices(range(n_series), cum_weights=cum_weights, k=rows)
+    for i, s in enumerate(series_ids):
+        sep = rng.choice((".", ".", ".", " ", "_"))
+        seasons = spans[s]
+        season = rng.randrange(len(seasons)) + 1
+        episode = rng.randint(1, seasons[season - 1])
+        quality = rng.choices(qualities, quality_weights)[0]
+        parts = [file_titles[s].replace(" ", sep), f"S{season:02d}E{episode:02d}", quality,
+                 rng.choice(_VARIANTS), rng.choice(_CODECS)]
+        if rng.random() < args.non_english:
+            parts.append(rng.choice(_LANGUAGES))
+        name = sep.join(p for p in parts if p)
+        group = rng.choices(groups, group_weights)[0]
+        if group:
+            name += "-" + group
+        name += rng.choice(_AUX_EXTENSIONS) if rng.random() < args.aux else rng.choice((".mkv", ".mkv", ".mp4"))
+        base = {"2160p": 4000, "1080p": 1500, "720p": 700}.get(quality, 300)
+        size = int(base * rng.uniform(0.15, 2.5)) * 1024 * 1024
+        batch.append((1000 + i, f"f{i}", name, size, rng.choice(("", quality, "HD")), None,
+                      1 if rng.random() < 0.95 else 0, None, "telegram", rng.choice(("", quality))))
+        if rng.random() < args.metadata:
+            metadata.append((i + 1, 100000 + s + 1, titles[s]))
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO movies (message_id, file_id, file_name, file_size, quality, year, "
+                             "is_series, created_at, source, resolution) VALUES (?,?,?,?,?,?,?,?,?,?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO movies (message_id, file_id, file_name, file_size, quality, year, "
+                         "is_series, created_at, source, resolution) VALUES (?,?,?,?,?,?,?,?,?,?)", batch)
+    conn.executemany("INSERT INTO movie_metadata (movie_id, tmdb_id, title) VALUES (?,?,?)", metadata)
+    conn.commit()
+    conn.close()
+
+
+def corpus_paths(args, rows: int) -> tuple[Path, Path]:
+    params = json.dumps([rows, args.series, args.seed, args.quality_mix, args.group_mix, args.non_english,
+                         args.unmatched, args.typos, args.metadata, args.aux])
+    tag = hashlib.sha1(params.encode()).hexdigest()[:10]
+    work = Path(args.work_dir)
+    work.mkdir(parents=True, exist_ok=True)
+    return work / f"corpus-{rows}-{tag}.db", work / f"corpus-{rows}-{tag}.catalogue"
+
+
+def digest(items) -> str:
+    h = hashlib.sha1()
+    for item in items:
+        h.update(repr(item).encode())
+    return h.hexdigest()[:16]
+
+
+def timed(fn, repeat: int):
+    """Best wall time of `repeat` calls (parse memo cleared before each)."""
+    best, result = None, None
+    for _ in range(repeat):
+        migrate.parse_release.cache_clear()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_size(args, rows: int) -> dict:
+    db_path, catalogue_path = corpus_paths(args, rows)
+    if not db_path.exists() or not catalogue_path.exists():
+        print(f"  Generating {rows:,}-row corpus in {db_path}...")
+        start = time.perf_counter()
+        generate_corpus(db_path, catalogue_path, args, rows, args.seed)
+        print(f"    done in {time.perf_counter() - start:.1f}s")
+    catalogue = CatalogueIndex.load(str(catalogue_path))
+    results = {}
+
+    def record(stage: str, seconds: float, items: int, fingerprint):
+        results[stage] = {"seconds": round(seconds, 4), "items": items, "fingerprint": fingerprint}
+        print(f"  {stage:26} {seconds:>9.3f}s {items:>11,} items {items / seconds if seconds else 0:>12,.0f}/s")
+
+    def fetch():
+        with redirect_stdout(io.StringIO()):
+            return migrate.fetch_episode_files(str(db_path))
+    seconds, files = timed(fetch, args.repeat)
+    record("fetch_episode_files", seconds, len(files), digest((f.sqlite_id, f.key) for f in files))
+
+    seconds, groups = timed(lambda: migrate.group_episodes(files), args.repeat)
+    record("group_episodes", seconds, len(groups), digest((k, len(v)) for k, v in groups.items()))
+
+    seconds, picks = timed(lambda: [migrate.pick_best_episode_files(v) for v in groups.values()], args.repeat)
+    record("pick_best_episode_files", seconds, len(picks),
+           digest(sorted((q, p["sqlite_id"], p["score"]) for group in picks for q, p in group.items())))
+
+    names = sorted({key[0] for key in groups} - set(catalogue.series_by_title))
+
+    def fuzzy():
+        matcher = migrate.FuzzySeriesMatcher(catalogue.series_by_title)
+        return [matcher.match(name) for name in names]
+    seconds, matched = timed(fuzzy, args.repeat)
+    record("fuzzy_match", seconds, len(names), digest(zip(names, matched)))
+    del files, groups, picks
+
+    def dry_run():
+        migrate.SQLITE_DB = str(db_path)
+        migrate.profiler = RunProfiler("migrate_episode_ddl")
+        run_args = migrate.build_arg_parser().parse_args(["--catalogue", str(catalogue_path), "--no-parse-cache"])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            migrate.migrate(run_args)
+        return out.getvalue()
+    seconds, output = timed(dry_run, args.repeat)
+    summary = {label: int(value.replace(",", "")) for label, value in
+               re.findall(r"^  (Episodes matched|Links created|has_downloads set):\s+([\d,]+)", output, re.M)}
+    record("dry_run", seconds, rows, digest(sorted(summary.items())))
+    for stage in migrate.profiler.report()["stages"]:
+        print(f"    {stage['stage']:24} {stage['wall_seconds']:>9.3f}s")
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    problems = []
+    for size, stages in current.items():
+        base_stages = baseline.get("results", {}).get(size)
+        if base_stages is None:
+            print(f"  {size} rows: no baseline")
+            continue
+        for stage, now in stages.items():
+            base = base_stages.get(stage)
+            if base is None:
+                continue
+            ratio = now["seconds"] / base["seconds"] if base["seconds"] else 1.0
+            verdict = "ok"
+            if now["fingerprint"] != base["fingerprint"] or now["items"] != base["items"]:
+                verdict = "OUTPUT CHANGED"
+                problems.append(f"{size} rows / {stage}: output changed")
+            elif ratio > 1 + tolerance and now["seconds"] - base["seconds"] > NOISE_FLOOR_SECONDS:
+                verdict = "REGRESSION"
+                problems.append(f"{size} rows / {stage}: {ratio:.2f}x baseline")
+            print(f"  {size:>8} {stage:26} {base['seconds']:>9.3f}s -> {now['seconds']:>9.3f}s "
+                  f"({ratio:5.2f}x)  {verdict}")
+    return problems
+
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu": platform.processor()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the episode pipeline on synthetic corpora")
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES, help="Corpus sizes (movies rows)")
+    parser.add_argument("--series", type=int, default=0, help="Distinct series (default: rows/40, min 50)")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("--quality-mix", type=str, default="720p:38,1080p:45,2160p:5,480p:7,:5",
+                        help="Quality token weights in filenames (empty value = none)")
+    parser.add_argument("--group-mix", type=str, default="PSA:10,BONE:5,RMTeam:4,YTS:3,RARBG:8,NTb:10,"
+                        "GalaxyTV:15,MeGusta:15,:30", help="Release group weights (empty value = none)")
+    parser.add_argument("--non-english", type=float, default=0.08, help="Share of files with a language tag")
+    parser.add_argument("--unmatched", type=float, default=0.03, help="Share of series missing from the catalogue")
+    parser.add_argument("--typos", type=float, default=0.05, help="Share of series misspelled in filenames")
+    parser.add_argument("--metadata", type=float, default=0.3, help="Share of files with a TMDB metadata row")
+    parser.add_argument("--aux", type=float, default=0.03, help="Share of subtitle/nfo/image files")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage (best time is kept)")
+    parser.add_argument("--work-dir", type=str, default=str(DEFAULT_WORK_DIR), help="Where generated corpora are kept")
+    parser.add_argument("--baseline", type=str, default=str(DEFAULT_BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="Do not compare with the baseline")
+    args = parser.parse_args()
+
+    current = {}
+    for rows in (int(x) for x in args.sizes.split(",") if x):
+        print(f"{rows:,} rows")
+        current[str(rows)] = bench_size(args, rows)
+        print()
+
+    if args.save_baseline:
+        baseline = {}
+        if Path(args.baseline).exists():
+            baseline = json.loads(Path(args.baseline).read_text())
+        baseline.setdefault("results", {}).update(current)
+        baseline["machine"] = machine()
+        baseline["saved"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        Path(args.baseline).write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if args.no_baseline:
+        return
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline} (run with --save-baseline)")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    print(f"Against baseline {args.baseline} (saved {baseline.get('saved', '?')}):")
+    if baseline.get("machine") != machine():
+        print("  NOTE: baseline was recorded on a different machine; timings are indicative only")
+    problems = compare(baseline, current, args.tolerance)
+    if problems:
+        print()
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        print("(if the change is intended, re-run with --save-baseline)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
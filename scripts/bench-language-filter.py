@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: non-English filename filter
+===========================================
+Compares the legacy per-keyword is_non_english loop (substring test +
+fresh re.escape regex + two startswith checks, for each of ~40 keywords)
+with the single-scan matcher in release_parser.py, on a synthetic corpus
+of release names. Both must agree on every filename; the run fails if
+they do not.
+
+Usage:
+  python3 bench-language-filter.py                   # 1M filenames
+  python3 bench-language-filter.py --count 200000    # smaller corpus
+  python3 bench-language-filter.py --foreign 0.3     # 30% non-English names
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+from release_parser import NON_ENGLISH_KEYWORDS, detect_language
+
+SERIES = [
+    "Breaking Bad", "The Office", "Game of Thrones", "Stranger Things",
+    "Money Heist", "The Boys", "Succession", "Better Call Saul",
+    "House of the Dragon", "Severance", "The Bear", "Only Murders in the Building",
+]
+TAGS = ["720p", "1080p", "2160p", "BluRay", "WEB-DL", "WEBRip", "HDTV", "AMZN", "NF",
+        "x264", "x265", "HEVC", "DDP5.1", "AAC", "10bit"]
+GROUPS = ["PSA", "BONE", "RMTeam", "YTS", "RARBG", "GalaxyTV", "NTb", "FLUX"]
+
+
+def legacy_is_non_english(file_name: str) -> bool:
+    """is_non_english as it shipped before release_parser.py."""
+    fn = file_name.lower()
+    for keyword in NON_ENGLISH_KEYWORDS:
+        if keyword in fn:
+            return True
+        pattern = r'[.\-_\s\[\(]' + re.escape(keyword) + r'[.\-_\s\]\),]'
+        if re.search(pattern, fn):
+            return True
+        if fn.startswith(keyword + ".") or fn.startswith(keyword + " "):
+            return True
+    return False
+
+
+def make_corpus(count: int, foreign_ratio: float, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        sep = rng.choice(".. _")
+        parts = rng.choice(SERIES).split()
+        parts.append(f"S{rng.randint(1, 12):02d}E{rng.randint(1, 24):02d}")
+        parts.extend(rng.sample(TAGS, rng.randint(2, 5)))
+        if rng.random() < foreign_ratio:
+            parts.insert(rng.randint(1, len(parts)), rng.choice(NON_ENGLISH_KEYWORDS).title())
+        corpus.append(sep.join(parts) + "-" + rng.choice(GROUPS) + rng.choice((".mkv", ".mp4")))
+    return corpus
+
+
+def timed(label: str, fn, corpus: list[str]):
+    start = time.perf_counter()
+    results = [fn(name) for name in corpus]
+    elapsed = time.perf_counter() - start
+    rate = len(corpus) / elapsed if elapsed else 0
+    print(f"  {label:28} {elapsed:8.3f}s  {rate:>12,.0f} names/sec")
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the non-English filename filter")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Synthetic filenames to generate")
+    parser.add_argument("--foreign", type=float, default=0.15, help="Share of names with a language marker")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus RNG seed")
+    args = parser.parse_args()
+
+    print(f"Generating {args.count:,} filenames ({args.foreign:.0%} non-English)...")
+    corpus = make_corpus(args.count, args.foreign, args.seed)
+
+    print("Timing:")
+    legacy, legacy_time = timed("legacy is_non_english", legacy_is_non_english, corpus)
+    languages, new_time = timed("release_parser matcher", detect_language, corpus)
+
+    mismatches = sum(1 for old, lang in zip(legacy, languages) if old != bool(lang))
+    print(f"  Speedup: {legacy_time / new_time:.1f}x" if new_time else "  Speedup: n/a")
+
+    by_language = Counter(lang for lang in languages if lang)
+    print(f"  Non-English: {sum(by_language.values()):,}  (top: "
+          + ", ".join(f"{lang} {n:,}" for lang, n in by_language.most_common(5)) + ")")
+
+    if mismatches:
+        print(f"ERROR: {mismatches:,} filenames classified differently")
+        sys.exit(1)
+    print("  Results identical on every filename")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Check + benchmark: multi-core parse/score stage of the episode migration
+========================================================================
+Runs steps [1/6]+[2/6] of migrate-episode-ddl.py twice on the same
+movies.db: once on the single stream (group_episodes + picks) and once
+through group_episodes_parallel() with --workers processes. Both runs are
+rendered to the same canonical text (group order, first file, picks with
+scores, read stats); the run fails unless the two are byte-identical.
+
+Usage:
+  python3 bench-parallel-grouping.py                     # SQLITE_DB, 8 workers
+  python3 bench-parallel-grouping.py --workers 4 --limit 100
+  python3 bench-parallel-grouping.py --series "Breaking Bad"
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib.util
+from pathlib import Path
+
+# The migration script's file name is not importable as-is
+_spec = importlib.util.spec_from_file_location(
+    "migrate_episode_ddl", Path(__file__).with_name("migrate-episode-ddl.py"))
+migrate = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = migrate
+_spec.loader.exec_module(migrate)
+
+
+def render(groups: dict, read_stats: dict) -> bytes:
+    """Everything step 5 consumes from steps 1+2, as canonical text."""
+    lines = [json.dumps({
+        "read": read_stats["read"],
+        "kept": read_stats["kept"],
+        "unparseable": read_stats["unparseable"],
+        "by_language": read_stats["by_language"].most_common(),
+    })]
+    for key, files in groups.items():
+        picks = migrate.pick_best_episode_files(files)
+        first = files[0]
+        lines.append(json.dumps([
+            list(key), first.sqlite_id, first.tmdb_id, first.meta_title,
+            {q: [p["sqlite_id"], p["score"], p["variant"], p["codec"]] for q, p in sorted(picks.items())},
+            [f.sqlite_id for f in migrate.group_survivors(files, picks)],
+        ]))
+    return "\n".join(lines).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check --workers output against the single-process path")
+    parser.add_argument("--db", type=str, default=migrate.SQLITE_DB, help="movies.db to read")
+    parser.add_argument("--workers", type=int, default=8, help="Worker processes for the parallel run")
+    parser.add_argument("--limit", type=int, default=0, help="Only the first N series (as migrate --limit)")
+    parser.add_argument("--series", type=str, default="", help="Series filter (as migrate --series)")
+    args = parser.parse_args()
+
+    series_filter = migrate.normalize_series_name(args.series) if args.series else ""
+    series_limit = 0 if args.series else args.limit
+
+    print(f"Single process on {args.db}...")
+    start = time.perf_counter()
+    single_stats = migrate.new_read_stats()
+    groups = migrate.group_episodes(
+        migrate.iter_episode_files(args.db, single_stats, series_filter=series_filter),
+        series_limit=series_limit,
+    )
+    single = render(groups, single_stats)
+    single_time = time.perf_counter() - start
+    print(f"  {len(groups):,} groups from {single_stats['read']:,} rows in {single_time:.2f}s")
+    del groups
+
+    print(f"{args.workers} worker processes...")
+    start = time.perf_counter()
+    parallel_stats = migrate.new_read_stats()
+    groups = migrate.group_episodes_parallel(
+        args.db, parallel_stats, args.workers, series_filter=series_filter, series_limit=series_limit,
+    )
+    parallel = render(groups, parallel_stats)
+    parallel_time = time.perf_counter() - start
+    print(f"  {len(groups):,} groups from {parallel_stats['read']:,} rows in {parallel_time:.2f}s")
+    print(f"  Speedup: {single_time / parallel_time:.1f}x" if parallel_time else "  Speedup: n/a")
+
+    if single != parallel:
+        a, b = single.split(b"\n"), parallel.split(b"\n")
+        first_diff = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+        print(f"ERROR: outputs differ (first difference at line {first_diff + 1})")
+        sys.exit(1)
+    print(f"  Byte-identical ({len(single):,} bytes, sha256 {hashlib.sha256(single).hexdigest()[:16]})")
+
+
+if __name__ == "__main__":
+    main()
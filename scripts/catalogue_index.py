@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compact lookup index over the PostgREST series/episode catalogue
+================================================================
+Instead of keeping every series/season/episode row as a JSON dict, the
+catalogue is reduced to three flat maps:
+
+  episodes         packed (series_id, season, episode) int -> episode id
+  series_by_tmdb   tmdb_id -> series id
+  series_by_title  normalized title -> series id
+
+The index can be written to / read from a small binary file so other
+scripts (and dry runs) can reuse one catalogue download.
+
+Used by: migrate-episode-ddl.py (--catalogue / --save-catalogue)
+"""
+
+import sys
+import json
+import hashlib
+from array import array
+
+# Packed episode key layout: series_id | season (12 bits) | episode (16 bits)
+SEASON_BITS = 12
+EPISODE_BITS = 16
+_SEASON_SHIFT = EPISODE_BITS
+_SERIES_SHIFT = SEASON_BITS + EPISODE_BITS
+_SEASON_MAX = (1 << SEASON_BITS) - 1
+_EPISODE_MAX = (1 << EPISODE_BITS) - 1
+
+_FILE_MAGIC = b"TMCATIDX1\n"
+
+
+def pack_episode_key(series_id: int, season: int, episode: int):
+    """Pack an episode coordinate into one int (None if out of range)."""
+    if series_id is None or season is None or episode is None:
+        return None
+    if not (0 <= season <= _SEASON_MAX and 0 <= episode <= _EPISODE_MAX and series_id >= 0):
+        return None
+    return (series_id << _SERIES_SHIFT) | (season << _SEASON_SHIFT) | episode
+
+
+def unpack_episode_key(key: int) -> tuple[int, int, int]:
+    return key >> _SERIES_SHIFT, (key >> _SEASON_SHIFT) & _SEASON_MAX, key & _EPISODE_MAX
+
+
+class CatalogueIndex:
+    """int -> int maps for series and episode matching."""
+
+    __slots__ = ("episodes", "series_by_tmdb", "series_by_title", "skipped_episodes")
+
+    def __init__(self):
+        self.episodes = {}
+        self.series_by_tmdb = {}
+        self.series_by_title = {}
+        self.skipped_episodes = 0
+
+    def add_series(self, series_id: int, tmdb_id, norm_title: str):
+        if tmdb_id:
+            self.series_by_tmdb[tmdb_id] = series_id
+        if norm_title:
+            self.series_by_title[norm_title] = series_id
+
+    def add_episode(self, series_id: int, season: int, episode: int, episode_id: int) -> bool:
+        key = pack_episode_key(series_id, season, episode)
+        if key is None:
+            self.skipped_episodes += 1
+            return False
+        self.episodes[key] = episode_id
+        return True
+
+    def episode_id(self, series_id: int, season: int, episode: int):
+        key = pack_episode_key(series_id, season, episode)
+        return self.episodes.get(key) if key is not None else None
+
+    def version(self) -> str:
+        """
+        Fingerprint of everything matching looks at: a hash of the three
+        maps, so added, removed or edited rows (a renamed title, a fixed
+        tmdb_id, an episode re-numbered) all change it.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for mapping in (self.series_by_tmdb, self.series_by_title):
+            digest.update(json.dumps(sorted(mapping.items()), separators=(",", ":")).encode())
+        episodes = array("q")
+        for key, episode_id in sorted(self.episodes.items()):
+            episodes.append(key)
+            episodes.append(episode_id)
+        digest.update(episodes.tobytes())
+        return digest.hexdigest()
+
+    # --------------------------------------------------------
+    # Serialization: magic line, JSON header line, then the episode keys
+    # and ids as two raw int64 arrays.
+    # --------------------------------------------------------
+
+    def save(self, path: str):
+        keys = array("q", self.episodes.keys())
+        ids = array("q", self.episodes.values())
+        header = {
+            "byteorder": sys.byteorder,
+            "episodes": len(keys),
+            "series_by_tmdb": [[k, v] for k, v in self.series_by_tmdb.items()],
+            "series_by_title": self.series_by_title,
+        }
+        with open(path, "wb") as fh:
+            fh.write(_FILE_MAGIC)
+            fh.write(json.dumps(header, separators=(",", ":")).encode() + b"\n")
+            keys.tofile(fh)
+            ids.tofile(fh)
+
+    @classmethod
+    def load(cls, path: str) -> "CatalogueIndex":
+        index = cls()
+        with open(path, "rb") as fh:
+            if fh.readline() != _FILE_MAGIC:
+                raise ValueError(f"{path} is not a catalogue index file")
+            header = json.loads(fh.readline())
+            keys = array("q")
+            ids = array("q")
+            keys.fromfile(fh, header["episodes"])
+            ids.fromfile(fh, header["episodes"])
+        if header["byteorder"] != sys.byteorder:
+            keys.byteswap()
+            ids.byteswap()
+        index.episodes = dict(zip(keys, ids))
+        index.series_by_tmdb = {k: v for k, v in header["series_by_tmdb"]}
+        index.series_by_title = header["series_by_title"]
+        return index
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Telegram channel the backfill reads
+============================================================
+FakeTelegramClient implements the small part of telethon's
+TelegramClient that backfill-telegram-sqlite.py uses: start(),
+disconnect(), get_entity(), get_messages() (range pages or ids=[...])
+and iter_messages(). Every request sleeps for the configured latency,
+every flood_every-th request raises FloodWaitError, like Telegram does
+when a client asks too fast, and every fail_every-th request raises
+ConnectionError, like a dropped connection.
+
+With post_interval set, run_until_disconnected() keeps the channel live:
+new posts, edits (a release renamed to PROPER) and deletions are
+delivered to handlers registered with add_event_handler() and the
+NewMessage / MessageEdited / MessageDeleted builders below (the names
+telethon.events uses). Every disconnect_after events the connection
+"drops": a few messages are posted while the client is away, and only a
+catch-up fetch will see them.
+
+The channel itself is generated from the message id, so any size costs
+no memory: a few percent of ids are deleted (gaps), some messages are
+text only, some carry subtitles, images or files without a name, and
+the rest are episode and movie releases.
+
+Used by: backfill-telegram-sqlite.py --fake-channel N
+"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+DELETED_SHARE = 0.03
+TEXT_SHARE = 0.08
+PAGE_LIMIT = 100  # Telegram's cap on messages per history request
+EDIT_SHARE = 0.08
+DELETE_SHARE = 0.05
+OFFLINE_POSTS = 5  # posted while a dropped connection is away
+
+_TITLES = (
+    "Silent River", "The Golden Crown", "Hidden Harbor", "Iron Kingdom", "Northern Signal",
+    "Broken Garden", "The Last Frontier", "Crimson Circle", "Frozen Mirror", "Wild Station",
+)
+_VARIANTS = ("BluRay", "WEB-DL", "WEBRip", "HDTV", "AMZN.WEB-DL")
+_QUALITIES = ("720p", "1080p", "1080p", "2160p", "480p")
+_EPOCH = datetime(2021, 1, 1)
+
+
+class FloodWaitError(Exception):
+    """Same name and .seconds as telethon.errors.FloodWaitError."""
+
+    def __init__(self, seconds: int):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+class FakeAttribute:
+    __slots__ = ("file_name",)
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+
+class FakeDocument:
+    __slots__ = ("id", "size", "attributes")
+
+    def __init__(self, doc_id, size, attributes):
+        self.id = doc_id
+        self.size = size
+        self.attributes = attributes
+
+
+class FakeMedia:
+    __slots__ = ("document",)
+
+    def __init__(self, document):
+        self.document = document
+
+
+class FakeMessage:
+    __slots__ = ("id", "date", "media", "message")
+
+    def __init__(self, message_id, date, media, text=""):
+        self.id = message_id
+        self.date = date
+        self.media = media
+        self.message = text
+
+
+class FakeChannel:
+    __slots__ = ("title", "id")
+
+    def __init__(self, channel_id):
+        self.title = "Fake channel"
+        self.id = channel_id
+
+
+class _EventBuilder:
+    """NewMessage(chats=...) and friends: which events a handler wants."""
+
+    def __init__(self, chats=None):
+        self.chats = chats
+
+
+class NewMessage(_EventBuilder):
+    pass
+
+
+class MessageEdited(_EventBuilder):
+    pass
+
+
+class MessageDeleted(_EventBuilder):
+    pass
+
+
+class FakeEvent:
+    __slots__ = ("chat_id", "message", "deleted_ids")
+
+    def __init__(self, chat_id, message=None, deleted_ids=None):
+        self.chat_id = chat_id
+        self.message = message
+        self.deleted_ids = deleted_ids or []
+
+
+def fake_message(message_id: int, seed: int = 0):
+    """The message with this id, or None if it was deleted."""
+    rng = random.Random(seed * 1_000_003 + message_id)
+    if rng.random() < DELETED_SHARE:
+        return None
+    date = _EPOCH + timedelta(minutes=message_id)
+    if rng.random() < TEXT_SHARE:
+        return FakeMessage(message_id, date, None, "announcement")
+    kind = rng.random()
+    title = rng.choice(_TITLES).replace(" ", ".")
+    quality = rng.choice(_QUALITIES)
+    if kind < 0.70:
+        name = (f"{title}.S{rng.randint(1, 6):02d}E{rng.randint(1, 20):02d}."
+                f"{quality}.{rng.choice(_VARIANTS)}.x264-GRP.mkv")
+    elif kind < 0.85:
+        name = f"{title}.{rng.randint(1990, 2024)}.{quality}.{rng.choice(_VARIANTS)}.mp4"
+    elif kind < 0.92:
+        name = f"{title}.S01E{rng.randint(1, 20):02d}.srt"
+    elif kind < 0.97:
+        name = f"{title}.poster.jpg"
+    else:
+        name = None
+    attributes = [FakeAttribute(name)] if name else []
+    document = FakeDocument(10_000_000 + message_id, rng.randint(50, 4000) * 1024 * 1024, attributes)
+    return FakeMessage(message_id, date, FakeMedia(document))
+
+
+class FakeTelegramClient:
+    """The telethon client surface the backfill uses, over a generated channel."""
+
+    def __init__(self, last_message_id: int, latency: float = 0.05, flood_every: int = 0,
+                 flood_seconds: int = 3, seed: int = 0, fail_every: int = 0,
+                 post_interval: float = 0, disconnect_after: int = 0, chat_id: int = 0):
+        self.last_message_id = last_message_id
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.seed = seed
+        self.fail_every = fail_every
+        self.post_interval = post_interval
+        self.disconnect_after = disconnect_after
+        self.chat_id = chat_id
+        self.requests = 0
+        self.flood_waits = 0
+        self.connected = False
+        self.handlers = []
+        # Live changes on top of the generated history
+        self.posted = []
+        self.edited = {}
+        self.deleted = set()
+        self.live_dates = {}
+        self._rng = random.Random(seed)
+
+    async def start(self):
+        self.connected = True
+        return self
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def add_event_handler(self, callback, event):
+        self.handlers.append((event, callback))
+
+    def message(self, message_id: int):
+        """The message as the channel shows it now (None if deleted or never posted)."""
+        if not 0 < message_id <= self.last_message_id or message_id in self.deleted:
+            return None
+        if message_id in self.edited:
+            return self.edited[message_id]
+        message = fake_message(message_id, self.seed)
+        if message is not None and message_id in self.live_dates:
+            message.date = self.live_dates[message_id]
+        return message
+
+    def _post(self):
+        self.last_message_id += 1
+        self.live_dates[self.last_message_id] = datetime.now(timezone.utc)
+        message = self.message(self.last_message_id)
+        if message is not None:
+            self.posted.append(message.id)
+        return message
+
+    async def _dispatch(self, builder_class, event):
+        for builder, callback in self.handlers:
+            if isinstance(builder, builder_class):
+                await callback(event)
+
+    async def run_until_disconnected(self):
+        """Deliver live posts, edits and deletions until the (simulated) connection drops."""
+        delivered = 0
+        while self.connected:
+            await asyncio.sleep(self.post_interval or 3600)
+            roll = self._rng.random()
+            named = [i for i in self.posted[-50:] if i not in self.deleted and self.message(i).media
+                     and self.message(i).media.document.attributes]
+            if roll < EDIT_SHARE and named:
+                original = self.message(self._rng.choice(named))
+                name = original.media.document.attributes[0].file_name.replace(".x264", ".PROPER.x264", 1)
+                document = FakeDocument(original.media.document.id, original.media.document.size,
+                                        [FakeAttribute(name)])
+                edited = FakeMessage(original.id, original.date, FakeMedia(document))
+                self.edited[original.id] = edited
+                await self._dispatch(MessageEdited, FakeEvent(self.chat_id, message=edited))
+            elif roll < EDIT_SHARE + DELETE_SHARE and named:
+                message_id = self._rng.choice(named)
+                self.deleted.add(message_id)
+                await self._dispatch(MessageDeleted, FakeEvent(self.chat_id, deleted_ids=[message_id]))
+            else:
+                message = self._post()
+                if message is None:
+                    continue
+                await self._dispatch(NewMessage, FakeEvent(self.chat_id, message=message))
+            delivered += 1
+            if self.disconnect_after and delivered % self.disconnect_after == 0:
+                for _ in range(OFFLINE_POSTS):
+                    self._post()  # nobody is listening
+                self.connected = False
+
+    async def get_entity(self, channel_id):
+        return FakeChannel(channel_id)
+
+    async def _request(self):
+        self.requests += 1
+        number = self.requests
+        await asyncio.sleep(self.latency)
+        if self.flood_every and number % self.flood_every == 0:
+            self.flood_waits += 1
+            raise FloodWaitError(self.flood_seconds)
+        if self.fail_every and number % self.fail_every == 0:
+            raise ConnectionError("Connection to Telegram failed")
+
+    async def get_messages(self, entity, limit: int = PAGE_LIMIT, min_id: int = 0, max_id: int = 0,
+                           reverse: bool = False, ids=None):
+        """
+        ids=[...]: those messages in that order (None where deleted).
+        Otherwise up to `limit` messages with min_id < id < max_id (0 = no
+        bound), newest first, or oldest first with reverse=True.
+        """
+        await self._request()
+        if ids is not None:
+            ids = list(ids)[:PAGE_LIMIT]
+            return [self.message(i) for i in ids]
+        limit = min(limit or PAGE_LIMIT, PAGE_LIMIT)
+        hi = min(max_id - 1 if max_id else self.last_message_id, self.last_message_id)
+        lo = max(min_id + 1, 1)
+        candidates = range(lo, hi + 1) if reverse else range(hi, lo - 1, -1)
+        page = []
+        for message_id in candidates:
+            message = self.message(message_id)
+            if message is not None:
+                page.append(message)
+                if len(page) >= limit:
+                    break
+        return page
+
+    async def iter_messages(self, entity, limit=None, min_id: int = 0, max_id: int = 0, reverse: bool = False):
+        yielded = 0
+        while True:
+            page = await self.get_messages(entity, min_id=min_id, max_id=max_id, reverse=reverse)
+            if not page:
+                return
+            for message in page:
+                yield message
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            if reverse:
+                min_id = page[-1].id
+            else:
+                max_id = page[-1].id
@@ -5,6 +5,11 @@ Migrate Episode DDLs from Telegram SQLite to PostgREST download_links
 For every episode in the PostgreSQL episodes table, finds the best
 720p + 1080p file from the Telegram SQLite and inserts into download_links.
 
+Filenames are parsed once (release_parser.py) and, on --live runs (or
+with --fill-parse-cache), the results kept in movies.db's file_parse_cache
+table for later runs; dry runs only read it. The PostgREST catalogue
+is held in a compact index (catalogue_index.py). Deploy both alongside.
+
 File Selection Algorithm (per episode):
   1. Group files by (series_name, season, episode)
   2. Bucket by quality (720p / 1080p)
@@ -17,7 +22,18 @@ Usage:
   python3 migrate-episode-ddl.py --limit 100            # first 100 series only
   python3 migrate-episode-ddl.py --live                 # execute for real
   python3 migrate-episode-ddl.py --live --clear          # clear existing episode links first
+  POSTGREST_KEY=<writer JWT> python3 migrate-episode-ddl.py --live --clear  # staged rebuild (005 grants)
   python3 migrate-episode-ddl.py --series "Breaking Bad" # single series debug
+  python3 migrate-episode-ddl.py --live --incremental --clear  # first run: rebuild + save state
+  python3 migrate-episode-ddl.py --live --incremental          # nightly: only newly indexed files
+  python3 migrate-episode-ddl.py --live --workers 8     # parse/score on 8 cores
+  python3 migrate-episode-ddl.py --live --columnar      # NumPy scoring (pip install numpy)
+  python3 migrate-episode-ddl.py --clear --plan eps.plan     # compute + save the result
+  python3 migrate-episode-ddl.py --live --apply eps.plan     # write exactly that plan
+  python3 migrate-episode-ddl.py --live --batch-min 500 --batch-max 500  # fixed batch size
+  python3 migrate-episode-ddl.py --live --resume        # re-send batches that failed after retries
+  python3 migrate-episode-ddl.py --optimize-sqlite      # one-off: index movies.db for this query
+  python3 migrate-episode-ddl.py --live --profile --profile-dir /var/lib/node_exporter/textfile_collector
 
 Author: Evans Agyemang (xboggg)
 """
@@ -25,10 +41,28 @@ Author: Evans Agyemang (xboggg)
 import sqlite3
 import sys
 import os
-import re
+import glob
+import gzip
+import json
 import time
+import random
 import argparse
-from collections import defaultdict
+import threading
+import tempfile
+from urllib.parse import quote
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from queue import Queue
+from difflib import SequenceMatcher
+
+from catalogue_index import CatalogueIndex, unpack_episode_key
+from run_profiler import RunProfiler
+from release_parser import (
+    CODEC_PRIORITY, PARSE_CACHE_COLUMNS, PARSE_CACHE_INSERT, PARSER_VERSION, VARIANT_PRIORITY,
+    ensure_parse_cache, normalize_series_name, parse_cache_row, parse_release, parsed_from_cache,
+    resolve_quality, squash_name,
+)
 
 try:
     import requests
@@ -37,47 +71,61 @@ except ImportError:
     HAS_REQUESTS = False
     print("WARNING: requests not installed. Install with: pip install requests")
 
+# Optional: only --columnar needs it
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # ============================================================
 # CONFIGURATION
 # ============================================================
 
 SQLITE_DB = os.environ.get("SQLITE_DB", "/opt/trendimovies/bot/database/movies.db")
 POSTGREST_URL = os.environ.get("POSTGREST_URL", "http://localhost:3001")
+# JWT of a writer role (never the public anon key): --clear's staging table
+# and its swap function are not granted to web_anon
+POSTGREST_KEY = os.environ.get("POSTGREST_KEY") or os.environ.get("SUPABASE_SERVICE_KEY", "")
 TELEGRAM_STREAM_BASE = "https://trendimovies.com/tgstream"
-
-# Variant priority (higher = better)
-VARIANT_PRIORITY = {
-    "bluray": 1000,
-    "webrip": 800,
-    "webdl": 700,
-    "hdtv": 500,
-    "hdrip": 400,
-    "other": 100,
-}
-
-# Codec bonus
-CODEC_PRIORITY = {
-    "x265": 200, "hevc": 200, "h265": 200,
-    "x264": 100, "h264": 100, "avc": 100,
-}
-
-# Release group bonus
-RELEASE_GROUP_BONUS = {
-    "psa": 30, "bone": 20, "rmteam": 15, "yts": 10, "rarbg": 10,
-}
-
-# Non-English language keywords
-NON_ENGLISH_KEYWORDS = [
-    "tamil", "hindi", "telugu", "kannada", "malayalam", "bengali",
-    "korean", "japanese", "chinese", "mandarin", "cantonese",
-    "arabic", "turkish", "thai", "vietnamese", "indonesian",
-    "french", "spanish", "portuguese", "german", "italian",
-    "russian", "polish", "dutch", "swedish", "danish", "norwegian",
-    "finnish", "czech", "hungarian", "romanian", "greek",
-    "persian", "farsi", "urdu", "punjabi", "marathi", "gujarati",
-    "dual.audio", "multi.audio", "dubbed",
-]
-
+# Run state that must outlive a run (the failure journal); never the source tree
+STATE_DIR = os.environ.get("TRENDIMOVIES_STATE_DIR") or os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"), "trendimovies")
+
+# PostgREST loading: concurrent keyset ranges over one pooled session
+LOAD_WORKERS = 4
+HTTP_POOL_SIZE = 16
+EPISODES_SELECT = "id,episode_number,series_id,seasons(season_number)"
+# --series/--limit: matched series ids per scoped episodes request
+SCOPED_SERIES_BATCH = 200
+
+# download_links writer: parallel POSTs, retries, failure journal (--resume)
+WRITER_THREADS = 4
+WRITE_RETRIES = 5
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 30.0
+DEFAULT_JOURNAL = os.path.join(STATE_DIR, "episode-links-failed.jsonl")
+
+# Adaptive batch size (AIMD): grow by BATCH_GROW_ROWS per round of batches
+# that come back under the latency target, halve on a slow, oversized or
+# failed one.
+# --batch-size is the starting point; --batch-min = --batch-max pins it.
+BATCH_MIN = 50
+BATCH_MAX = 5000
+BATCH_GROW_ROWS = 250
+BATCH_TARGET_SECONDS = 2.0           # well inside the 30s request timeout
+BATCH_MAX_BYTES = 4 * 1024 * 1024    # JSON body per request
+INSERT_TIMEOUT = 30
+
+# has_downloads reconciliation runs server-side in one statement
+RECONCILE_TIMEOUT = 300
+
+# --clear rebuilds into this table, then swaps it in with one RPC
+STAGING_TABLE = "download_links_staging"
+SWAP_TIMEOUT = 600
+
+# Fuzzy series fallback: minimum SequenceMatcher ratio (same word count required)
+FUZZY_MATCH_RATIO = 0.90
 
 # ============================================================
 # UTILITY FUNCTIONS (from migrate_telegram_to_supabase.py)
@@ -94,42 +142,15 @@ def format_file_size(size_bytes: int) -> str:
 
 
 def detect_variant(file_name: str) -> str:
-    fn = file_name.lower()
-    if "bluray" in fn or "blu-ray" in fn or "bdrip" in fn or "brrip" in fn:
-        return "bluray"
-    if "web-dl" in fn or "webdl" in fn or "web.dl" in fn or "web dl" in fn:
-        return "webdl"
-    if re.search(r'\b(amzn|amazn|amazon)\b', fn) or re.search(r'\bNF\b', file_name) or \
-       re.search(r'\b(dsnp|dnsp|disney)\b', fn) or re.search(r'\b(hmax|hbo)\b', fn) or \
-       re.search(r'\b(atvp|apple)\b', fn) or re.search(r'\b(pcok|peacock)\b', fn) or \
-       re.search(r'\b(pmtp|paramount)\b', fn):
-        return "webdl"
-    if "webrip" in fn or "web-rip" in fn or "web.rip" in fn:
-        return "webrip"
-    if "hdtv" in fn:
-        return "hdtv"
-    if "hdrip" in fn or "web-hd" in fn or "webhd" in fn or "web.hd" in fn or "dvdrip" in fn:
-        return "hdrip"
-    return "other"
+    return parse_release(file_name).variant
 
 
 def detect_codec(file_name: str) -> str:
-    fn = file_name.lower()
-    for codec in ["x265", "hevc", "h.265", "h265"]:
-        if codec in fn:
-            return "x265"
-    for codec in ["x264", "h.264", "h264", "avc"]:
-        if codec in fn:
-            return "x264"
-    return ""
+    return parse_release(file_name).codec
 
 
 def detect_release_group(file_name: str) -> int:
-    fn = file_name.lower()
-    for group, bonus in RELEASE_GROUP_BONUS.items():
-        if fn.endswith(group) or f"-{group}" in fn or f".{group}" in fn or f"[{group}]" in fn:
-            return bonus
-    return 0
+    return parse_release(file_name).group_bonus
 
 
 def score_episode_file(file_name: str, file_size: int) -> float:
@@ -138,179 +159,507 @@ def score_episode_file(file_name: str, file_size: int) -> float:
     DIFFERENCE from movie scoring: file size tiebreaker is INVERTED
     (smaller file wins, since episode quality is consistent).
     """
-    variant = detect_variant(file_name)
-    variant_score = VARIANT_PRIORITY.get(variant, VARIANT_PRIORITY["other"])
-
-    codec = detect_codec(file_name)
-    codec_score = CODEC_PRIORITY.get(codec, 0)
-
-    group_score = detect_release_group(file_name)
-
-    # INVERTED size tiebreaker: smaller files preferred (0 to -0.99)
-    # Subtract a small fraction so that among same quality, smaller wins
-    size_penalty = min(file_size / (5 * 1024 * 1024 * 1024), 0.99) if file_size else 0
-
-    return variant_score + codec_score + group_score - size_penalty
+    return parse_release(file_name).score_with_size(file_size)
 
 
 def normalize_quality(quality_str: str, resolution_str: str, file_name: str = "") -> str:
-    if resolution_str:
-        res = resolution_str.strip().lower()
-        if res in ("720p", "1080p", "2160p"):
-            return res
-
-    if quality_str:
-        match = re.search(r'(\d{3,4}p)', quality_str.lower())
-        if match:
-            q = match.group(1)
-            if q in ("720p", "1080p", "2160p"):
-                return q
-
-    if file_name:
-        match = re.search(r'[.\-_ ](\d{3,4}p)[.\-_ ]', file_name.lower())
-        if match:
-            q = match.group(1)
-            if q in ("720p", "1080p", "2160p"):
-                return q
-
-    return ""
+    return resolve_quality(quality_str, resolution_str, parse_release(file_name) if file_name else None)
 
 
 def is_non_english(file_name: str) -> bool:
-    fn = file_name.lower()
-    for keyword in NON_ENGLISH_KEYWORDS:
-        if keyword in fn:
-            return True
-        pattern = r'[.\-_\s\[\(]' + re.escape(keyword) + r'[.\-_\s\]\),]'
-        if re.search(pattern, fn):
-            return True
-        if fn.startswith(keyword + ".") or fn.startswith(keyword + " "):
-            return True
-    return False
+    return parse_release(file_name).non_english
 
 
 def parse_episode_info(file_name: str):
     """Parse series name, season number, episode number from filename."""
-    match = re.search(r'[. _-]S(\d{1,2})E(\d{1,3})', file_name, re.IGNORECASE)
-    if not match:
+    parsed = parse_release(file_name)
+    if not parsed.series:
         return None, None, None
-
-    season = int(match.group(1))
-    episode = int(match.group(2))
-
-    # Series name = everything before S##E##
-    series_part = file_name[:match.start()]
-    series_name = re.sub(r'[._-]', ' ', series_part).strip()
-    series_name = re.sub(r'\b(19|20)\d{2}\b', '', series_name).strip()
-    series_name = re.sub(r'\s+', ' ', series_name).strip()
-
-    return series_name, season, episode
-
-
-def normalize_series_name(name: str) -> str:
-    """Normalize series name for matching."""
-    if not name:
-        return ""
-    n = name.lower().strip()
-    n = re.sub(r'[^a-z0-9\s]', '', n)
-    n = re.sub(r'\s+', ' ', n).strip()
-    return n
+    return parsed.series, parsed.season, parsed.episode
 
 
 def postgrest_headers() -> dict:
-    return {
+    headers = {
         "Content-Profile": "public",
         "Accept-Profile": "public",
         "Content-Type": "application/json",
         "Prefer": "return=representation",
     }
+    if POSTGREST_KEY:
+        headers["Authorization"] = f"Bearer {POSTGREST_KEY}"
+    return headers
 
 
 # ============================================================
 # DATABASE FUNCTIONS
 # ============================================================
 
-def fetch_episode_files(db_path: str) -> list[dict]:
-    """Fetch all series episode files from SQLite."""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT
-            m.id as sqlite_id,
-            m.file_name,
-            m.file_size,
-            m.quality,
-            m.source as file_source,
-            m.resolution,
-            mm.tmdb_id,
-            mm.title as meta_title
-        FROM movies m
-        LEFT JOIN movie_metadata mm ON m.id = mm.movie_id
-        WHERE m.is_series = 1
-          AND m.file_size >= 52428800
-          AND m.file_name NOT LIKE '%.srt'
-          AND m.file_name NOT LIKE '%.sub'
-          AND m.file_name NOT LIKE '%.ass'
-          AND m.file_name NOT LIKE '%.ssa'
-          AND m.file_name NOT LIKE '%.idx'
-          AND m.file_name NOT LIKE '%.txt'
-          AND m.file_name NOT LIKE '%.nfo'
-          AND m.file_name NOT LIKE '%.vtt'
-          AND m.file_name NOT LIKE '%.jpg'
-          AND m.file_name NOT LIKE '%.jpeg'
-          AND m.file_name NOT LIKE '%.png'
-          AND m.file_name NOT LIKE '%.pdf'
-          AND m.file_name NOT LIKE '%.zip'
-          AND m.file_name NOT LIKE '%.rar'
-          AND m.file_name NOT LIKE '%.7z'
-        ORDER BY m.id
-    """)
-
-    raw_rows = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    # Filter non-English
-    filtered = []
-    skipped_non_english = 0
-    skipped_unparseable = 0
-
-    for row in raw_rows:
-        fname = row.get("file_name", "")
-
-        if is_non_english(fname):
-            skipped_non_english += 1
-            continue
+# Non-video attachments that share the channel with episode files
+AUX_EXTENSIONS = (
+    ".srt", ".sub", ".ass", ".ssa", ".idx", ".txt", ".nfo", ".vtt",
+    ".jpg", ".jpeg", ".png", ".pdf", ".zip", ".rar", ".7z",
+)
+
+_EPISODE_FILES_SELECT = """
+    SELECT
+        m.id as sqlite_id,
+        m.file_name,
+        m.file_size,
+        m.quality,
+        m.resolution,
+        mm.tmdb_id,
+        mm.title as meta_title
+    FROM movies m
+    LEFT JOIN movie_metadata mm ON m.id = mm.movie_id
+"""
 
-        # Parse episode info
-        series_name, season, episode = parse_episode_info(fname)
-        if not series_name:
-            skipped_unparseable += 1
-            continue
+# With file_parse_cache: the cached parse for the current parser version
+# (pc.movie_id is NULL on a miss or a stale row)
+_PARSE_CACHE_SELECT = "        mm.title as meta_title,\n        pc.movie_id" + "".join(
+    f",\n        pc.{column}" for column in PARSE_CACHE_COLUMNS
+) + "\n"
+_PARSE_CACHE_JOIN = (
+    "    LEFT JOIN file_parse_cache pc\n"
+    f"           ON pc.movie_id = m.id AND pc.parser_version = {PARSER_VERSION}\n"
+)
+
+# Legacy filter: every run scans the whole movies table
+EPISODE_FILES_WHERE = """
+    WHERE m.is_series = 1
+      AND m.file_size >= 52428800
+""" + "".join(f"      AND m.file_name NOT LIKE '%{ext}'\n" for ext in AUX_EXTENSIONS)
+
+# After --optimize-sqlite: served by idx_movies_series_kind_id_size (id order
+# comes straight from the index, file_size is checked without a table read)
+EPISODE_FILES_INDEXED_WHERE = """
+    WHERE m.is_series = 1
+      AND m.kind = 'media'
+      AND m.file_size >= 52428800
+"""
+
+# movies.is_active exists once backfill-telegram-sqlite.py --follow has run;
+# it is 0 for files deleted from the channel
+EPISODE_FILES_ACTIVE = """
+      AND m.is_active = 1
+"""
+
+# --incremental: only rows indexed since the last run
+EPISODE_FILES_ID_RANGE = """
+      AND m.id > ? AND m.id <= ?
+"""
+
+# --series: cheap SQL prefilter. The squashed filter's characters must
+# appear in order in the filename (true for every file whose parsed name
+# contains the filter); non-ASCII names always pass, since LIKE only folds
+# ASCII case.
+EPISODE_FILES_NAME_FILTER = """
+      AND (m.file_name LIKE ? OR m.file_name GLOB '*[^ -~]*')
+"""
+# ... and with file_parse_cache, cached rows are filtered on the parse itself
+EPISODE_FILES_CACHED_SERIES_FILTER = """
+      AND (pc.movie_id IS NULL OR instr(pc.norm_series, ?) > 0)
+"""
+
+# movies.kind: 'aux' for the extensions above, 'media' otherwise, NULL when
+# file_name is NULL. Same LIKE semantics (ASCII case-insensitive) as the
+# legacy predicates, so both queries select exactly the same rows.
+MOVIES_KIND_EXPR = (
+    "CASE WHEN file_name IS NULL THEN NULL"
+    + "".join(f" WHEN file_name LIKE '%{ext}' THEN 'aux'" for ext in AUX_EXTENSIONS)
+    + " ELSE 'media' END"
+)
+
+SQLITE_SCHEMA_STEPS = (
+    ("movies.kind generated column",
+     f"ALTER TABLE movies ADD COLUMN kind TEXT GENERATED ALWAYS AS ({MOVIES_KIND_EXPR}) VIRTUAL"),
+    ("idx_movies_series_kind_id_size",
+     "CREATE INDEX IF NOT EXISTS idx_movies_series_kind_id_size ON movies(is_series, kind, id, file_size)"),
+    ("idx_movie_metadata_movie_id",
+     "CREATE INDEX IF NOT EXISTS idx_movie_metadata_movie_id ON movie_metadata(movie_id)"),
+)
+
+# Read-side tuning for the (large) channel index
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+# Rows pulled from the SQLite cursor per fetchmany() call
+FETCH_SIZE = 5000
+
+# file_parse_cache writes (lock wait covers other --workers writing)
+PARSE_CACHE_WRITE_BATCH = 10000
+PARSE_CACHE_WRITE_TIMEOUT = 120
+
+# --workers: id-range shards per worker process (smooths out uneven shards)
+SHARDS_PER_WORKER = 4
+
+
+class EpisodeFile:
+    """One candidate episode file: only the columns the migration uses."""
+
+    __slots__ = ("sqlite_id", "file_name", "file_size", "quality", "resolution",
+                 "tmdb_id", "meta_title", "parsed")
+
+    def __init__(self, sqlite_id, file_name, file_size, quality, resolution,
+                 tmdb_id, meta_title, parsed):
+        self.sqlite_id = sqlite_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.quality = quality
+        self.resolution = resolution
+        self.tmdb_id = tmdb_id
+        self.meta_title = meta_title
+        self.parsed = parsed
+
+    @property
+    def key(self) -> tuple:
+        """Grouping key: (normalized_series, season, episode)."""
+        return (self.parsed.norm_series, self.parsed.season, self.parsed.episode)
+
+
+def open_sqlite_readonly(db_path: str, immutable: bool = False) -> sqlite3.Connection:
+    """
+    Open movies.db read-only with mmap'd reads. immutable=1 also skips all
+    locking; only use it on a snapshot copy or while the bot is stopped.
+    """
+    uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    return conn
+
+
+def has_kind_column(conn: sqlite3.Connection) -> bool:
+    # table_xinfo (not table_info) lists generated columns
+    return any(row[1] == "kind" for row in conn.execute("PRAGMA table_xinfo(movies)"))
 
-        row["parsed_series"] = series_name
-        row["parsed_season"] = season
-        row["parsed_episode"] = episode
-        row["normalized_series"] = normalize_series_name(series_name)
 
-        filtered.append(row)
+def has_active_column(conn: sqlite3.Connection) -> bool:
+    return any(row[1] == "is_active" for row in conn.execute("PRAGMA table_info(movies)"))
 
+
+def has_parse_cache(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_parse_cache'"
+    ).fetchone() is not None
+
+
+def episode_files_sql(conn: sqlite3.Connection, id_range: bool = False, parse_cache: bool = False,
+                      series_filter: bool = False) -> str:
+    """
+    Indexed query once --optimize-sqlite has run, legacy scan otherwise.
+    parse_cache adds the file_parse_cache columns (see _PARSE_CACHE_SELECT);
+    files --follow saw deleted (is_active = 0) are left out.
+    Parameters, in order: id_range bounds, then the series_filter ones
+    (see episode_files_params).
+    """
+    where = EPISODE_FILES_INDEXED_WHERE if has_kind_column(conn) else EPISODE_FILES_WHERE
+    if has_active_column(conn):
+        where += EPISODE_FILES_ACTIVE
+    if id_range:
+        where += EPISODE_FILES_ID_RANGE
+    if series_filter:
+        where += EPISODE_FILES_NAME_FILTER
+        if parse_cache:
+            where += EPISODE_FILES_CACHED_SERIES_FILTER
+    select = _EPISODE_FILES_SELECT
+    if parse_cache:
+        select = select.replace("        mm.title as meta_title\n", _PARSE_CACHE_SELECT) + _PARSE_CACHE_JOIN
+    return select + where + "    ORDER BY m.id\n"
+
+
+def episode_files_params(id_range: tuple = None, series_filter: str = "", parse_cache: bool = False) -> tuple:
+    params = tuple(id_range or ())
+    if series_filter:
+        params += ("%" + "%".join(squash_name(series_filter)) + "%",)
+        if parse_cache:
+            params += (series_filter,)
+    return params
+
+
+class ParseCacheSpool:
+    """
+    Cache misses of one scan. Rows are buffered PARSE_CACHE_WRITE_BATCH at
+    a time and spilled to a temporary SQLite file, so a cold cache (or a
+    PARSER_VERSION bump) costs disk, not RSS. save() copies them into
+    movies.db after the scan's read transaction has ended, one short
+    transaction per chunk so the bot is never locked out for long.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.count = 0
+        self._path = ""
+        self._conn = None
+
+    def add(self, row: tuple):
+        self.rows.append(row)
+        self.count += 1
+        if len(self.rows) >= PARSE_CACHE_WRITE_BATCH:
+            self._spill()
+
+    def _spill(self):
+        if self._conn is None:
+            fd, self._path = tempfile.mkstemp(prefix="parse-cache-", suffix=".db")
+            os.close(fd)
+            self._conn = sqlite3.connect(self._path)
+            self._conn.execute("PRAGMA journal_mode = OFF")
+            self._conn.execute("PRAGMA synchronous = OFF")
+            ensure_parse_cache(self._conn)
+        self._conn.executemany(PARSE_CACHE_INSERT, self.rows)
+        self._conn.commit()
+        self.rows = []
+
+    def save(self, db_path: str) -> int:
+        """Copy the spooled rows into db_path's file_parse_cache; returns the row count."""
+        if not self.count:
+            return 0
+        if self._conn is None:
+            return save_parse_cache(db_path, self.rows)
+        self._spill()
+        self._conn.close()
+        self._conn = None
+        columns = "movie_id, parser_version, " + ", ".join(PARSE_CACHE_COLUMNS)
+        conn = sqlite3.connect(db_path, timeout=PARSE_CACHE_WRITE_TIMEOUT)
+        try:
+            ensure_parse_cache(conn)
+            conn.commit()
+            conn.execute("ATTACH DATABASE ? AS spool", (self._path,))
+            after = -1
+            while True:
+                upto = conn.execute(
+                    "SELECT MAX(movie_id) FROM (SELECT movie_id FROM spool.file_parse_cache "
+                    "WHERE movie_id > ? ORDER BY movie_id LIMIT ?)", (after, PARSE_CACHE_WRITE_BATCH),
+                ).fetchone()[0]
+                if upto is None:
+                    break
+                conn.execute(f"INSERT OR REPLACE INTO main.file_parse_cache ({columns}) "
+                             f"SELECT {columns} FROM spool.file_parse_cache WHERE movie_id > ? AND movie_id <= ?",
+                             (after, upto))
+                conn.commit()
+                after = upto
+            conn.execute("DETACH DATABASE spool")
+        finally:
+            conn.close()
+            self.discard()
+        return self.count
+
+    def discard(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._path:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = ""
+        self.rows = []
+
+
+def save_parse_cache(db_path: str, rows: list) -> int:
+    """Write freshly parsed rows to file_parse_cache (one transaction)."""
+    conn = sqlite3.connect(db_path, timeout=PARSE_CACHE_WRITE_TIMEOUT)
+    try:
+        ensure_parse_cache(conn)
+        for i in range(0, len(rows), PARSE_CACHE_WRITE_BATCH):
+            conn.executemany(PARSE_CACHE_INSERT, rows[i:i + PARSE_CACHE_WRITE_BATCH])
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def max_movie_id(db_path: str, immutable: bool = False) -> int:
+    conn = open_sqlite_readonly(db_path, immutable=immutable)
+    try:
+        return conn.execute("SELECT MAX(id) FROM movies").fetchone()[0] or 0
+    finally:
+        conn.close()
+
+
+def new_read_stats() -> dict:
+    return {"read": 0, "kept": 0, "unparseable": 0, "cache_hits": 0, "cache_added": 0,
+            "by_language": Counter()}
+
+
+def iter_episode_files(db_path: str, read_stats: dict = None, series_filter: str = "",
+                       fetch_size: int = FETCH_SIZE, immutable: bool = False, id_range: tuple = None,
+                       parse_cache: bool = False, fill_cache: bool = True):
+    """
+    Stream series episode files from SQLite as EpisodeFile records.
+    Rows are fetched fetch_size at a time and filtered/parsed on the fly,
+    so memory is bounded by what the caller keeps.
+
+    series_filter (normalized) keeps only files whose series name contains
+    it; rows that cannot contain it are dropped in SQL or before parsing.
+    id_range (after_id, upto_id) limits the scan to movies.id in that
+    half-open range.
+
+    parse_cache reads parse results from file_parse_cache instead of
+    parsing. With fill_cache (and not immutable) the ones it had to parse
+    are spooled to a temporary file (ParseCacheSpool) and stored once the
+    scan is complete: the read transaction must end before SQLite lets
+    anyone write.
+    """
+    if read_stats is None:
+        read_stats = new_read_stats()
+    by_language = read_stats["by_language"]
+    filter_words = series_filter.split()
+    spool = ParseCacheSpool() if parse_cache and fill_cache and not immutable else None
+
+    conn = open_sqlite_readonly(db_path, immutable=immutable)
+    try:
+        use_cache = parse_cache and has_parse_cache(conn)
+        sql = episode_files_sql(conn, id_range=bool(id_range), parse_cache=use_cache,
+                                series_filter=bool(series_filter))
+        cursor = conn.cursor()
+        cursor.execute(sql, episode_files_params(id_range, series_filter, use_cache))
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            read_stats["read"] += len(batch)
+
+            for row in batch:
+                sqlite_id, file_name, file_size, quality, resolution, tmdb_id, meta_title = row[:7]
+                if filter_words:
+                    squashed = squash_name(file_name)
+                    if not all(w in squashed for w in filter_words):
+                        continue
+
+                if use_cache and row[7] is not None:
+                    parsed = parsed_from_cache(row[8:])
+                    read_stats["cache_hits"] += 1
+                else:
+                    parsed = parse_release(file_name)
+                    if spool is not None:
+                        spool.add(parse_cache_row(sqlite_id, parsed))
+
+                if parsed.language:
+                    by_language[parsed.language] += 1
+                    continue
+
+                if not parsed.series:
+                    read_stats["unparseable"] += 1
+                    continue
+
+                if series_filter and series_filter not in parsed.norm_series:
+                    continue
+
+                read_stats["kept"] += 1
+                yield EpisodeFile(sqlite_id, file_name, file_size, quality, resolution,
+                                  tmdb_id, meta_title, parsed)
+    except BaseException:
+        if spool is not None:
+            spool.discard()
+        raise
+    finally:
+        conn.close()
+
+    if spool is not None:
+        read_stats["cache_added"] += spool.save(db_path)
+
+
+def print_read_stats(read_stats: dict):
+    skipped_non_english = sum(read_stats["by_language"].values())
     if skipped_non_english > 0:
         print(f"  Filtered out {skipped_non_english:,} non-English files")
-    if skipped_unparseable > 0:
-        print(f"  Filtered out {skipped_unparseable:,} unparseable files (no S##E## pattern)")
+        breakdown = ", ".join(f"{lang} {count:,}" for lang, count in read_stats["by_language"].most_common(8))
+        print(f"    by language: {breakdown}")
+    if read_stats["unparseable"] > 0:
+        print(f"  Filtered out {read_stats['unparseable']:,} unparseable files (no S##E## pattern)")
+    if read_stats["cache_hits"] or read_stats["cache_added"]:
+        print(f"  Parse cache: {read_stats['cache_hits']:,} hits, {read_stats['cache_added']:,} rows added")
+
+
+def fetch_episode_files(db_path: str) -> list[EpisodeFile]:
+    """Fetch all series episode files from SQLite."""
+    read_stats = new_read_stats()
+    files = list(iter_episode_files(db_path, read_stats))
+    print_read_stats(read_stats)
+    return files
+
+
+def group_episodes(files, series_limit: int = 0) -> dict:
+    """
+    Group files by (normalized_series, season, episode).
+
+    With series_limit, no new groups are opened once a file of series
+    N+1 shows up; existing groups still collect their later files. That
+    is exactly the set of groups the --limit matching loop gets to.
+    """
+    groups = {}
+    seen_series = set()
+    closed = False
+    for f in files:
+        key = f.key
+        group = groups.get(key)
+        if group is not None:
+            group.append(f)
+            continue
+        if closed:
+            continue
+        if series_limit and key[0] not in seen_series:
+            if len(seen_series) >= series_limit:
+                closed = True
+                continue
+            seen_series.add(key[0])
+        groups[key] = [f]
+    return groups
+
+
+def _plan_and_time(conn: sqlite3.Connection, sql: str) -> tuple[list, int, float]:
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    start = time.perf_counter()
+    count = 0
+    cursor = conn.execute(sql)
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            break
+        count += len(batch)
+    return plan, count, time.perf_counter() - start
+
 
-    return filtered
+def _print_plan(label: str, plan: list, count: int, elapsed: float):
+    print(f"  {label}: {count:,} rows in {elapsed:.3f}s")
+    for line in plan:
+        print(f"    {line}")
 
 
-def group_episodes(rows: list[dict]) -> dict:
-    """Group files by (normalized_series, season, episode)."""
-    groups = defaultdict(list)
-    for row in rows:
-        key = (row["normalized_series"], row["parsed_season"], row["parsed_episode"])
-        groups[key].append(row)
-    return dict(groups)
+def optimize_sqlite(db_path: str) -> bool:
+    """
+    Opt-in schema maintenance for movies.db: adds the generated movies.kind
+    column and the indexes the episode query needs, runs ANALYZE, and
+    reports the query plan + timing before and after.
+    """
+    if sqlite3.sqlite_version_info < (3, 31, 0):
+        print(f"  ERROR: SQLite {sqlite3.sqlite_version} has no generated columns (needs 3.31+)")
+        return False
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        _print_plan("Before", *_plan_and_time(conn, episode_files_sql(conn)))
+
+        for label, ddl in SQLITE_SCHEMA_STEPS:
+            if label.startswith("movies.kind") and has_kind_column(conn):
+                print(f"  = {label} (exists)")
+                continue
+            start = time.perf_counter()
+            conn.execute(ddl)
+            conn.commit()
+            print(f"  + {label} ({time.perf_counter() - start:.2f}s)")
+
+        start = time.perf_counter()
+        conn.execute("ANALYZE")
+        conn.commit()
+        print(f"  + ANALYZE ({time.perf_counter() - start:.2f}s)")
+
+        _print_plan("After", *_plan_and_time(conn, episode_files_sql(conn)))
+    finally:
+        conn.close()
+    return True
 
 
 def pick_best_episode_files(files: list[dict]) -> dict:
@@ -321,201 +670,963 @@ def pick_best_episode_files(files: list[dict]) -> dict:
     by_quality = defaultdict(list)
 
     for f in files:
-        q = normalize_quality(
-            f.get("quality", ""),
-            f.get("resolution", ""),
-            f.get("file_name", ""),
-        )
+        parsed = f.parsed
+        q = resolve_quality(f.quality, f.resolution, parsed)
         if q in ("720p", "1080p"):
-            by_quality[q].append(f)
+            by_quality[q].append((parsed.score_with_size(f.file_size), f))
 
     picks = {}
     for quality, candidates in by_quality.items():
-        # Score each candidate, sort descending
-        candidates.sort(
-            key=lambda c: score_episode_file(c.get("file_name", ""), c.get("file_size", 0)),
-            reverse=True
-        )
-        best = candidates[0]
+        # Highest score wins; max() keeps the first of equal scores,
+        # exactly like the stable descending sort it replaces
+        score, best = max(candidates, key=lambda c: c[0])
         picks[quality] = {
-            "sqlite_id": best["sqlite_id"],
-            "file_name": best["file_name"],
-            "file_size": best["file_size"],
+            "sqlite_id": best.sqlite_id,
+            "file_name": best.file_name,
+            "file_size": best.file_size,
             "quality": quality,
-            "variant": detect_variant(best.get("file_name", "")),
-            "codec": detect_codec(best.get("file_name", "")),
-            "tmdb_id": best.get("tmdb_id"),
-            "meta_title": best.get("meta_title", ""),
-            "score": score_episode_file(best.get("file_name", ""), best.get("file_size", 0)),
+            "variant": best.parsed.variant,
+            "codec": best.parsed.codec,
+            "tmdb_id": best.tmdb_id,
+            "meta_title": best.meta_title,
+            "score": score,
         }
 
     return picks
 
 
+# Columnar scoring (--columnar): codes index these lookup tables
+QUALITY_CODES = {"720p": 0, "1080p": 1}
+_QUALITY_NAMES = tuple(QUALITY_CODES)
+_VARIANT_CODES = {v: i for i, v in enumerate(VARIANT_PRIORITY)}
+_CODEC_CODES = {c: i for i, c in enumerate(("",) + tuple(CODEC_PRIORITY))}
+SIZE_PENALTY_SCALE = 5 * 1024 * 1024 * 1024
+
+
+def pick_best_columnar(groups: dict) -> dict:
+    """
+    pick_best_episode_files() for every group at once, on NumPy columns.
+
+    Each 720p/1080p candidate becomes one row of (group, quality code,
+    variant code, codec code, group bonus, file size). Scores come from
+    the VARIANT_PRIORITY/CODEC_PRIORITY lookup tables plus the bonus, minus
+    the same size penalty in float64, so they equal the scalar scores
+    bit for bit. One lexsort on (group, quality, -score, position) puts
+    each (group, quality) winner first; equal scores fall back to the
+    earlier file, like max() does. Returns {group key: picks}.
+    """
+    variant_table = np.array([VARIANT_PRIORITY[v] for v in _VARIANT_CODES], dtype=np.int64)
+    codec_table = np.array([CODEC_PRIORITY.get(c, 0) for c in _CODEC_CODES], dtype=np.int64)
+
+    keys = list(groups)
+    group_col, quality_col, variant_col, codec_col, bonus_col, size_col = [], [], [], [], [], []
+    candidates = []
+    for g, files in enumerate(groups.values()):
+        for f in files:
+            parsed = f.parsed
+            code = QUALITY_CODES.get(resolve_quality(f.quality, f.resolution, parsed))
+            if code is None:
+                continue
+            group_col.append(g)
+            quality_col.append(code)
+            variant_col.append(_VARIANT_CODES[parsed.variant])
+            codec_col.append(_CODEC_CODES[parsed.codec])
+            bonus_col.append(parsed.group_bonus)
+            size_col.append(f.file_size or 0)
+            candidates.append(f)
+
+    picks_by_group = {key: {} for key in keys}
+    if not candidates:
+        return picks_by_group
+
+    group = np.array(group_col, dtype=np.int64)
+    quality = np.array(quality_col, dtype=np.int8)
+    size = np.array(size_col, dtype=np.int64)
+    base = (variant_table[np.array(variant_col, dtype=np.intp)]
+            + codec_table[np.array(codec_col, dtype=np.intp)]
+            + np.array(bonus_col, dtype=np.int64))
+    penalty = np.where(size != 0, np.minimum(size / SIZE_PENALTY_SCALE, 0.99), 0.0)
+    score = base - penalty
+
+    position = np.arange(len(candidates))
+    order = np.lexsort((position, -score, quality, group))
+    starts = np.flatnonzero(np.concatenate((
+        [True], (group[order][1:] != group[order][:-1]) | (quality[order][1:] != quality[order][:-1]),
+    )))
+    winners = order[starts]
+    # picks keep the scalar dict order: qualities in order of first appearance
+    first_seen = np.minimum.reduceat(order, starts)
+    for i in winners[np.lexsort((first_seen, group[winners]))]:
+        best = candidates[i]
+        quality_name = _QUALITY_NAMES[quality[i]]
+        picks_by_group[keys[group[i]]][quality_name] = {
+            "sqlite_id": best.sqlite_id,
+            "file_name": best.file_name,
+            "file_size": best.file_size,
+            "quality": quality_name,
+            "variant": best.parsed.variant,
+            "codec": best.parsed.codec,
+            "tmdb_id": best.tmdb_id,
+            "meta_title": best.meta_title,
+            "score": float(score[i]),
+        }
+    return picks_by_group
+
+
 # ============================================================
-# POSTGREST LOAD FUNCTIONS
+# INCREMENTAL STATE (--incremental)
 # ============================================================
 
-def load_all_series() -> tuple[dict, dict]:
-    """Load all series from PostgreSQL. Returns (by_tmdb_id, by_normalized_title)."""
-    print("  Loading all series from PostgreSQL...")
+class MigrationState:
+    """
+    High-water mark and per-episode-group survivors, kept in movies.db.
+
+    For every group the state keeps only the files that can still matter:
+    the group's first file (its tmdb_id drives series matching) and the
+    current best 720p/1080p picks. Newer files always have higher ids, so
+    re-picking over survivors + new files gives the same result as
+    re-picking over the whole group. That only holds while the survivors
+    are unchanged in movies; stale_groups() finds the ones that are not.
+    """
 
-    all_series = []
-    offset = 0
-    batch_size = 1000
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS episode_migration_state (
+               key TEXT PRIMARY KEY,
+               value TEXT NOT NULL,
+               updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)""",
+        """CREATE TABLE IF NOT EXISTS episode_migration_groups (
+               norm_series TEXT NOT NULL,
+               season INTEGER NOT NULL,
+               episode INTEGER NOT NULL,
+               episode_id INTEGER,
+               pick_720 INTEGER,
+               pick_1080 INTEGER,
+               PRIMARY KEY (norm_series, season, episode)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS episode_migration_files (
+               norm_series TEXT NOT NULL,
+               season INTEGER NOT NULL,
+               episode INTEGER NOT NULL,
+               sqlite_id INTEGER NOT NULL,
+               file_name TEXT NOT NULL,
+               file_size INTEGER,
+               quality TEXT,
+               resolution TEXT,
+               tmdb_id INTEGER,
+               meta_title TEXT,
+               PRIMARY KEY (norm_series, season, episode, sqlite_id)) WITHOUT ROWID""",
+    )
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        for ddl in self.SCHEMA:
+            self.conn.execute(ddl)
+        self.conn.commit()
+
+    def get(self, key: str, default: str = "") -> str:
+        row = self.conn.execute(
+            "SELECT value FROM episode_migration_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def set(self, key: str, value):
+        self.conn.execute(
+            "INSERT INTO episode_migration_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (key, str(value)),
+        )
 
-    while True:
-        resp = requests.get(
-            f"{POSTGREST_URL}/series",
-            params={"select": "id,tmdb_id,title", "limit": str(batch_size), "offset": str(offset)},
-            headers=postgrest_headers(),
-            timeout=30,
+    def reset(self):
+        for table in ("episode_migration_state", "episode_migration_groups", "episode_migration_files"):
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.commit()
+
+    def group_keys(self) -> list[tuple]:
+        return self.conn.execute(
+            "SELECT norm_series, season, episode FROM episode_migration_groups"
+        ).fetchall()
+
+    def stale_groups(self, everything: bool = False) -> tuple[set, set]:
+        """
+        Groups with a stored survivor that movies no longer backs: the row
+        is gone, deactivated (is_active = 0), or any column the picks and
+        the series match read (file_name, file_size, quality, resolution,
+        movie_metadata tmdb_id/title) changed since it was stored.
+        everything marks every stored group (the parser changed).
+        Returns (group keys, survivor sqlite_ids).
+        """
+        inactive = " OR m.is_active = 0" if has_active_column(self.conn) else ""
+        where = "" if everything else (
+            "WHERE m.id IS NULL OR m.is_series IS NOT 1 OR m.file_name IS NOT f.file_name "
+            "OR m.file_size IS NOT f.file_size OR m.quality IS NOT f.quality "
+            "OR m.resolution IS NOT f.resolution OR mm.tmdb_id IS NOT f.tmdb_id "
+            f"OR mm.title IS NOT f.meta_title{inactive}"
         )
-        if resp.status_code != 200:
-            print(f"  Error loading series: {resp.status_code}")
-            break
-        batch = resp.json()
-        if not batch:
-            break
-        all_series.extend(batch)
-        offset += batch_size
+        keys, ids = set(), set()
+        for norm_series, season, episode, sqlite_id in self.conn.execute(
+            "SELECT f.norm_series, f.season, f.episode, f.sqlite_id "
+            "FROM episode_migration_files f LEFT JOIN movies m ON m.id = f.sqlite_id "
+            "LEFT JOIN movie_metadata mm ON mm.movie_id = f.sqlite_id " + where
+        ):
+            keys.add((norm_series, season, episode))
+            ids.add(sqlite_id)
+        return keys, ids
+
+    def load_groups(self, keys) -> dict:
+        """{key: (episode_id, (pick_720, pick_1080), [EpisodeFile survivors in id order])}"""
+        self.conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS wanted_groups "
+            "(norm_series TEXT, season INTEGER, episode INTEGER, PRIMARY KEY (norm_series, season, episode))"
+        )
+        self.conn.execute("DELETE FROM wanted_groups")
+        self.conn.executemany("INSERT OR IGNORE INTO wanted_groups VALUES (?, ?, ?)", keys)
+
+        groups = {}
+        for norm_series, season, episode, episode_id, pick_720, pick_1080 in self.conn.execute(
+            "SELECT g.norm_series, g.season, g.episode, g.episode_id, g.pick_720, g.pick_1080 "
+            "FROM episode_migration_groups g JOIN wanted_groups w USING (norm_series, season, episode)"
+        ):
+            groups[(norm_series, season, episode)] = (episode_id, (pick_720, pick_1080), [])
+
+        for (norm_series, season, episode, sqlite_id, file_name, file_size,
+             quality, resolution, tmdb_id, meta_title) in self.conn.execute(
+            "SELECT f.norm_series, f.season, f.episode, f.sqlite_id, f.file_name, f.file_size, "
+            "f.quality, f.resolution, f.tmdb_id, f.meta_title "
+            "FROM episode_migration_files f JOIN wanted_groups w USING (norm_series, season, episode) "
+            "ORDER BY f.norm_series, f.season, f.episode, f.sqlite_id"
+        ):
+            group = groups.get((norm_series, season, episode))
+            if group is not None:
+                group[2].append(EpisodeFile(sqlite_id, file_name, file_size, quality, resolution,
+                                            tmdb_id, meta_title, parse_release(file_name)))
+        return groups
+
+    def save_groups(self, updates: dict):
+        """updates: {key: (episode_id, (pick_720, pick_1080), [survivor EpisodeFiles]) or None to drop it}"""
+        for key, update in updates.items():
+            if update is None:
+                self.conn.execute(
+                    "DELETE FROM episode_migration_groups WHERE norm_series = ? AND season = ? AND episode = ?", key
+                )
+                self.conn.execute(
+                    "DELETE FROM episode_migration_files WHERE norm_series = ? AND season = ? AND episode = ?", key
+                )
+                continue
+            episode_id, (pick_720, pick_1080), survivors = update
+            self.conn.execute(
+                "INSERT OR REPLACE INTO episode_migration_groups VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, episode_id, pick_720, pick_1080),
+            )
+            self.conn.execute(
+                "DELETE FROM episode_migration_files WHERE norm_series = ? AND season = ? AND episode = ?", key
+            )
+            self.conn.executemany(
+                "INSERT INTO episode_migration_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, f.sqlite_id, f.file_name, f.file_size, f.quality, f.resolution,
+                  f.tmdb_id, f.meta_title) for f in survivors],
+            )
 
-    by_tmdb = {}
-    by_title = {}
-    for s in all_series:
-        if s.get("tmdb_id"):
-            by_tmdb[s["tmdb_id"]] = s
-        norm = normalize_series_name(s.get("title", ""))
-        if norm:
-            by_title[norm] = s
+    def commit(self):
+        self.conn.commit()
 
-    print(f"  Loaded {len(all_series):,} series ({len(by_tmdb):,} with TMDB IDs)")
-    return by_tmdb, by_title
+    def close(self):
+        self.conn.close()
 
 
-def load_all_episodes() -> dict:
-    """Load all episodes with season info. Returns {(series_id, season_num, episode_num): episode}."""
-    print("  Loading all seasons from PostgreSQL...")
+def group_survivors(files: list, picks: dict) -> list:
+    """First file of the group plus the current picks, in id order."""
+    pick_ids = {p["sqlite_id"] for p in picks.values()}
+    keep = [f for f in files if f.sqlite_id in pick_ids]
+    if files and files[0] not in keep:
+        keep.insert(0, files[0])
+    return keep
 
-    all_seasons = []
-    offset = 0
-    while True:
-        resp = requests.get(
-            f"{POSTGREST_URL}/seasons",
-            params={"select": "id,series_id,season_number", "limit": "5000", "offset": str(offset)},
-            headers=postgrest_headers(),
-            timeout=30,
-        )
-        if resp.status_code != 200:
-            break
-        batch = resp.json()
-        if not batch:
-            break
-        all_seasons.extend(batch)
-        offset += 5000
 
-    season_map = {}  # season.id -> {series_id, season_number}
-    for s in all_seasons:
-        season_map[s["id"]] = s
+# ============================================================
+# MULTI-CORE PARSE/SCORE (--workers)
+# ============================================================
+
+def summarize_groups(groups: dict) -> dict:
+    """
+    Reduce every group to its survivors: the first file plus the best
+    720p/1080p candidates. Step 5 only ever looks at those, so the picks,
+    the TMDB hint and the incremental state come out exactly the same.
+    """
+    return {key: group_survivors(files, pick_best_episode_files(files)) for key, files in groups.items()}
+
 
-    print(f"  Loaded {len(all_seasons):,} seasons")
+def _parse_shard(task: tuple) -> tuple[dict, dict]:
+    """Pool worker: read, parse, filter and pre-score one movies.id shard."""
+    db_path, series_filter, immutable, id_range, parse_cache, fill_cache = task
+    read_stats = new_read_stats()
+    groups = group_episodes(iter_episode_files(db_path, read_stats, series_filter=series_filter,
+                                               immutable=immutable, id_range=id_range,
+                                               parse_cache=parse_cache, fill_cache=fill_cache))
+    return summarize_groups(groups), read_stats
 
-    print("  Loading all episodes from PostgreSQL...")
-    all_episodes = []
-    offset = 0
+
+def shard_id_ranges(after_id: int, upto_id: int, shards: int) -> list[tuple]:
+    """Split (after_id, upto_id] into at most `shards` contiguous ranges."""
+    step = max(1, -(-(upto_id - after_id) // max(1, shards)))
+    return [(lo, min(lo + step, upto_id)) for lo in range(after_id, upto_id, step)]
+
+
+def limit_groups(groups: dict, series_limit: int) -> dict:
+    """
+    The --limit cut of group_episodes() applied to merged groups: keep
+    everything opened before the first group of series N+1.
+    """
+    kept = {}
+    seen_series = set()
+    for key, files in groups.items():
+        if key[0] not in seen_series:
+            if len(seen_series) >= series_limit:
+                break
+            seen_series.add(key[0])
+        kept[key] = files
+    return kept
+
+
+def group_episodes_parallel(db_path: str, read_stats: dict, workers: int, series_filter: str = "",
+                            immutable: bool = False, id_range: tuple = None, series_limit: int = 0,
+                            parse_cache: bool = False, fill_cache: bool = True) -> dict:
+    """
+    Steps 1+2 across a process pool. movies.id is cut into contiguous
+    shards; each worker returns survivor summaries for its shard and the
+    parent folds them together in id order. Shards are merged in order,
+    so group order, first files and tie-breaks (earliest id wins) match
+    group_episodes() on the single stream.
+    """
+    after_id, upto_id = id_range or (0, max_movie_id(db_path, immutable=immutable))
+    tasks = [(db_path, series_filter, immutable, shard, parse_cache, fill_cache)
+             for shard in shard_id_ranges(after_id, upto_id, workers * SHARDS_PER_WORKER)]
+
+    groups = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for summaries, shard_stats in pool.map(_parse_shard, tasks):
+            for name, value in shard_stats.items():
+                if name == "by_language":
+                    read_stats[name].update(value)
+                else:
+                    read_stats[name] += value
+            for key, survivors in summaries.items():
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = survivors
+                else:
+                    group += survivors
+                    groups[key] = group_survivors(group, pick_best_episode_files(group))
+
+    return limit_groups(groups, series_limit) if series_limit else groups
+
+
+# ============================================================
+# POSTGREST LOAD FUNCTIONS
+# ============================================================
+
+_http_session = None
+
+# Stage timings and request latencies; reported with --profile
+profiler = RunProfiler("migrate_episode_ddl")
+
+
+def _record_latency(resp, *args, **kwargs):
+    endpoint = resp.request.path_url.split("?", 1)[0]
+    profiler.observe_http(f"{resp.request.method} {endpoint}", resp.elapsed.total_seconds())
+
+
+def http_session() -> "requests.Session":
+    """Shared keep-alive session; the pool covers every loader/writer thread."""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        _http_session.mount("http://", adapter)
+        _http_session.mount("https://", adapter)
+        _http_session.headers.update(postgrest_headers())
+        _http_session.hooks["response"].append(_record_latency)
+    return _http_session
+
+
+def _fetch_id_range(table: str, select: str, lo: int, hi: int, page_size: int,
+                    filters: list = ()) -> list:
+    """Keyset-paginate one id range (lo, hi] of a table (hi=None: no upper bound)."""
+    rows = []
+    last = lo
     while True:
-        resp = requests.get(
-            f"{POSTGREST_URL}/episodes",
-            params={"select": "id,season_id,series_id,episode_number", "limit": "10000", "offset": str(offset)},
-            headers=postgrest_headers(),
-            timeout=30,
-        )
+        params = [("select", select), ("id", f"gt.{last}")]
+        if hi is not None:
+            params.append(("id", f"lte.{hi}"))
+        params += list(filters) + [("order", "id.asc"), ("limit", str(page_size))]
+        resp = http_session().get(f"{POSTGREST_URL}/{table}", params=params, timeout=30)
         if resp.status_code != 200:
+            print(f"  Error loading {table} ({lo}, {hi}]: {resp.status_code}")
             break
         batch = resp.json()
-        if not batch:
+        rows.extend(batch)
+        if len(batch) < page_size:
             break
-        all_episodes.extend(batch)
-        offset += 10000
+        last = batch[-1]["id"]
+    return rows
+
+
+def fetch_table_keyset(table: str, select: str, page_size: int = 5000,
+                       workers: int = LOAD_WORKERS) -> list:
+    """
+    Load a whole PostgREST table by id keyset (id=gt.<last>) instead of
+    limit/offset. The id space is cut into ranges that are fetched
+    concurrently; results come back in id order.
+    """
+    resp = http_session().get(
+        f"{POSTGREST_URL}/{table}",
+        params={"select": "id", "order": "id.desc", "limit": "1"},
+        timeout=30,
+    )
+    if resp.status_code != 200:
+        print(f"  Error loading {table}: {resp.status_code}")
+        return []
+    top = resp.json()
+    if not top:
+        return []
+    max_id = top[0]["id"]
+
+    n_ranges = max(1, workers * 4)
+    width = max(page_size, -(-max_id // n_ranges))
+    bounds = [(lo, min(lo + width, max_id)) for lo in range(0, max_id, width)]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = pool.map(lambda b: _fetch_id_range(table, select, b[0], b[1], page_size), bounds)
+        return [row for chunk in chunks for row in chunk]
+
+
+def load_all_series(catalogue: CatalogueIndex):
+    """Load all series from PostgreSQL into the catalogue index."""
+    print("  Loading all series from PostgreSQL...")
+
+    total = 0
+    for s in fetch_table_keyset("series", "id,tmdb_id,title", page_size=1000):
+        total += 1
+        catalogue.add_series(s["id"], s.get("tmdb_id"), normalize_series_name(s.get("title", "")))
+
+    print(f"  Loaded {total:,} series ({len(catalogue.series_by_tmdb):,} with TMDB IDs)")
 
-    print(f"  Loaded {len(all_episodes):,} episodes")
 
-    # Build lookup: (series_id, season_number, episode_number) -> episode
-    ep_lookup = {}
-    for ep in all_episodes:
-        season_info = season_map.get(ep["season_id"])
-        if season_info:
-            key = (ep["series_id"], season_info["season_number"], ep["episode_number"])
-            ep_lookup[key] = ep
+def load_all_episodes(catalogue: CatalogueIndex):
+    """
+    Load all episodes with their season number in one pass (PostgREST
+    embeds seasons(season_number) through episodes.season_id) into the
+    packed (series_id, season, episode) -> episode id map.
+    """
+    print("  Loading all episodes (with seasons) from PostgreSQL...")
+
+    total = 0
+    for ep in fetch_table_keyset("episodes", EPISODES_SELECT, page_size=10000):
+        total += 1
+        season = ep.get("seasons")
+        if season:
+            catalogue.add_episode(ep["series_id"], season["season_number"], ep["episode_number"], ep["id"])
+
+    print(f"  Loaded {total:,} episodes ({len(catalogue.episodes):,} indexed)")
+    if catalogue.skipped_episodes:
+        print(f"  Skipped {catalogue.skipped_episodes:,} episodes with out-of-range season/episode numbers")
+
+
+def load_episodes_for_series(catalogue: CatalogueIndex, series_ids: set):
+    """
+    --series/--limit runs: load only the episodes of the series the
+    SQLite groups matched, SCOPED_SERIES_BATCH series per keyset scan.
+    """
+    print(f"  Loading episodes (with seasons) for {len(series_ids):,} matched series...")
 
-    return ep_lookup
+    ids = sorted(series_ids)
+    total = 0
+    for i in range(0, len(ids), SCOPED_SERIES_BATCH):
+        in_list = ",".join(str(sid) for sid in ids[i:i + SCOPED_SERIES_BATCH])
+        for ep in _fetch_id_range("episodes", EPISODES_SELECT, 0, None, page_size=10000,
+                                  filters=[("series_id", f"in.({in_list})")]):
+            total += 1
+            season = ep.get("seasons")
+            if season:
+                catalogue.add_episode(ep["series_id"], season["season_number"], ep["episode_number"], ep["id"])
+
+    print(f"  Loaded {total:,} episodes ({len(catalogue.episodes):,} indexed)")
+    if catalogue.skipped_episodes:
+        print(f"  Skipped {catalogue.skipped_episodes:,} episodes with out-of-range season/episode numbers")
+
+
+def load_catalogue() -> CatalogueIndex:
+    catalogue = CatalogueIndex()
+    load_all_series(catalogue)
+    load_all_episodes(catalogue)
+    return catalogue
+
+
+# ============================================================
+# SERIES MATCHING
+# ============================================================
+
+class FuzzySeriesMatcher:
+    """
+    Fuzzy fallback for series titles that miss the TMDB-id and exact-title
+    lookups. Same rule as before: best SequenceMatcher ratio >= 0.90 among
+    titles with the same word count, first title wins on ties.
+
+    Candidates are bucketed by word count and sorted by length. Before the
+    full SequenceMatcher runs, two upper bounds on its ratio prune the
+    bucket: the length bound (real_quick_ratio) and the character-count
+    bound (quick_ratio). A title that fails either can never reach the
+    threshold, so pruning never changes the result. Each distinct name is
+    resolved once; misses are cached too.
+    """
+
+    def __init__(self, series_by_title: dict, threshold: float = FUZZY_MATCH_RATIO):
+        self.threshold = threshold
+        self._cache = {}
+        self.lookups = 0
+        self.full_comparisons = 0
+
+        buckets = defaultdict(list)
+        for order, (title_key, series_id) in enumerate(series_by_title.items()):
+            buckets[len(title_key.split())].append(
+                (len(title_key), order, title_key, Counter(title_key), series_id)
+            )
+        self._buckets = {}
+        for words, entries in buckets.items():
+            entries.sort(key=lambda e: (e[0], e[1]))
+            self._buckets[words] = ([e[0] for e in entries], entries)
+
+    def match(self, norm_series: str):
+        """Return the matched series id, or None."""
+        if norm_series in self._cache:
+            return self._cache[norm_series]
+        self.lookups += 1
+        result = self._search(norm_series)
+        self._cache[norm_series] = result
+        return result
+
+    def _search(self, norm_series: str):
+        bucket = self._buckets.get(len(norm_series.split()))
+        if not bucket:
+            return None
+        lengths, entries = bucket
+
+        # Length bound: ratio <= 2*min(la, lb) / (la + lb)
+        la = len(norm_series)
+        # (window widened by one so float rounding can't drop a boundary title)
+        lo = bisect_left(lengths, la * self.threshold / (2 - self.threshold) - 1)
+        hi = bisect_right(lengths, la * (2 - self.threshold) / self.threshold + 1)
+
+        query_chars = Counter(norm_series)
+        best_ratio = 0
+        best_order = None
+        best_candidate = None
+        for lb, order, title_key, title_chars, series_id in entries[lo:hi]:
+            total = la + lb
+            if 2.0 * min(la, lb) / total < self.threshold:
+                continue
+            # Character-count bound: matches <= shared character multiset
+            shared = sum(min(n, title_chars[ch]) for ch, n in query_chars.items())
+            if 2.0 * shared / total < self.threshold:
+                continue
+
+            self.full_comparisons += 1
+            ratio = SequenceMatcher(None, norm_series, title_key).ratio()
+            if ratio < self.threshold:
+                continue
+            if ratio > best_ratio or (ratio == best_ratio and order < best_order):
+                best_ratio = ratio
+                best_order = order
+                best_candidate = series_id
+
+        return best_candidate
 
 
 # ============================================================
 # POSTGREST INSERT FUNCTIONS
 # ============================================================
 
-def clear_episode_links(live: bool = False) -> int:
+def probe_episode_links(table: str = "download_links") -> tuple:
+    """
+    (count, error) for the Telegram episode links in a table (HEAD, no rows
+    sent). error is "" on success, "missing" on a 404 (table not created),
+    otherwise a description (401/403: the PostgREST role lacks grants).
+    """
+    try:
+        resp = http_session().head(
+            f"{POSTGREST_URL}/{table}",
+            params={"content_type": "eq.episode", "source": "eq.telegram"},
+            headers={"Prefer": "count=exact"},
+            timeout=30,
+        )
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    if resp.status_code == 404:
+        return None, "missing"
+    if resp.status_code not in (200, 206):
+        hint = ""
+        if resp.status_code in (401, 403):
+            hint = (" (check the PostgREST role's grants)" if POSTGREST_KEY
+                    else " (set POSTGREST_KEY to the writer role's JWT)")
+        return None, f"HTTP {resp.status_code}{hint}"
+    # Content-Range: 0-24/3056 (or */0 when empty)
+    total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+    if not total.isdigit():
+        return None, f"no count in Content-Range {resp.headers.get('Content-Range')!r}"
+    return int(total), ""
+
+
+def count_episode_links(table: str = "download_links"):
+    """Exact number of Telegram episode links in a table; None if unavailable."""
+    count, error = probe_episode_links(table)
+    if error and error != "missing":
+        print(f"  Count of {table} failed: {error}")
+    return count
+
+
+def clear_episode_links(live: bool = False) -> list[int]:
+    """Delete every Telegram episode link; returns the episode ids they pointed at."""
     if not live:
-        try:
-            resp = requests.get(
-                f"{POSTGREST_URL}/download_links",
-                params={"content_type": "eq.episode", "source": "eq.telegram", "select": "id"},
-                headers=postgrest_headers(),
-                timeout=10,
-            )
-            if resp.status_code == 200:
-                count = len(resp.json())
-                print(f"  Would delete {count} existing episode Telegram links (dry-run)")
-                return count
-        except Exception as e:
-            print(f"  Error counting: {e}")
-        return 0
+        count = count_episode_links()
+        if count is not None:
+            print(f"  Would delete {count:,} existing episode Telegram links (dry-run)")
+        return []
 
     try:
-        resp = requests.delete(
+        resp = http_session().delete(
             f"{POSTGREST_URL}/download_links",
-            params={"content_type": "eq.episode", "source": "eq.telegram"},
-            headers=postgrest_headers(),
+            params={"content_type": "eq.episode", "source": "eq.telegram", "select": "content_id"},
+            headers={"Prefer": "return=representation"},
             timeout=60,
         )
         if resp.status_code in (200, 204):
-            deleted = len(resp.json()) if resp.text else 0
-            print(f"  Cleared {deleted} existing episode Telegram links")
-            return deleted
+            cleared = [r["content_id"] for r in resp.json()] if resp.text else []
+            print(f"  Cleared {len(cleared)} existing episode Telegram links")
+            return cleared
         else:
             print(f"  Delete error: {resp.status_code} {resp.text[:200]}")
     except Exception as e:
         print(f"  Delete exception: {e}")
-    return 0
-
-
-def batch_insert_links(rows: list[dict], live: bool = False) -> int:
-    if not rows:
-        return 0
+    return []
+
+
+def reset_staging(live: bool = False) -> bool:
+    """Drop leftovers of an earlier, unfinished staged rebuild."""
+    leftover = count_episode_links(STAGING_TABLE) or 0
+    if leftover:
+        print(f"  {'Removing' if live else 'Would remove'} {leftover:,} rows left in {STAGING_TABLE} by an earlier run")
+    if not live or not leftover:
+        return True
+    resp = http_session().delete(
+        f"{POSTGREST_URL}/{STAGING_TABLE}",
+        params={"content_type": "eq.episode", "source": "eq.telegram"},
+        timeout=SWAP_TIMEOUT,
+    )
+    if resp.status_code not in (200, 204):
+        print(f"  Staging reset error: {resp.status_code} {resp.text[:200]}")
+        return False
+    return True
+
+
+def activate_staged_links(live: bool = False) -> bool:
+    """
+    Swap the staged set in: one transaction deletes the live Telegram
+    episode links and moves the staged ones over
+    (migrations/005_episode_link_staging.sql).
+    """
     if not live:
-        return len(rows)
+        print("  Would swap the staged set into download_links (dry-run)")
+        return True
 
+    started = time.time()
     try:
-        resp = requests.post(
-            f"{POSTGREST_URL}/download_links",
-            json=rows,
-            headers=postgrest_headers(),
-            timeout=30,
-        )
-        if resp.status_code in (200, 201):
-            result = resp.json()
-            return len(result) if isinstance(result, list) else 1
-        else:
-            print(f"  Batch insert error: {resp.status_code} {resp.text[:300]}")
-            return 0
+        resp = http_session().post(f"{POSTGREST_URL}/rpc/activate_staged_episode_links", json={},
+                                   timeout=SWAP_TIMEOUT)
     except Exception as e:
-        print(f"  Batch insert exception: {e}")
-        return 0
+        print(f"  Swap exception: {e} (live links unchanged)")
+        return False
+    if resp.status_code != 200:
+        print(f"  Swap error: {resp.status_code} {resp.text[:200]} (live links unchanged)")
+        return False
+    result = resp.json()
+    print(f"  Swapped in {result['added']:,} links, retired {result['removed']:,} "
+          f"({time.time() - started:.1f}s)")
+    return True
+
+
+class BatchSizer:
+    """
+    AIMD controller for the insert batch size, shared by the writer
+    threads. Each finished POST reports its row count, body size, latency
+    and outcome; the next batch the producer cuts uses the updated size.
+    """
+
+    __slots__ = ("size", "min_size", "max_size", "target_seconds", "max_bytes",
+                 "batches", "low", "high", "_bytes_per_row", "_lock")
+
+    def __init__(self, size: int, min_size: int = BATCH_MIN, max_size: int = BATCH_MAX,
+                 target_seconds: float = None, max_bytes: int = None):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(size, self.min_size), self.max_size)
+        self.target_seconds = target_seconds or BATCH_TARGET_SECONDS
+        self.max_bytes = max_bytes or BATCH_MAX_BYTES
+        self.batches = 0
+        self.low = self.high = self.size
+        self._bytes_per_row = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_size > self.min_size
+
+    def observe(self, rows: int, nbytes: int, seconds: float, ok: bool):
+        if not self.adaptive or not rows:
+            return
+        with self._lock:
+            self.batches += 1
+            per_row = nbytes / rows
+            self._bytes_per_row = per_row if not self._bytes_per_row else 0.8 * self._bytes_per_row + 0.2 * per_row
+            byte_cap = int(self.max_bytes / self._bytes_per_row) if self._bytes_per_row else self.max_size
+            # Relative to this batch, not the current size: the batches in
+            # flight together grow the size once and halve it once
+            if not ok or seconds > self.target_seconds or nbytes > self.max_bytes:
+                size = min(self.size, rows // 2)
+            else:
+                size = max(self.size, rows + BATCH_GROW_ROWS)
+            self.size = min(max(min(size, byte_cap), self.min_size), self.max_size)
+            self.low = min(self.low, self.size)
+            self.high = max(self.high, self.size)
+
+
+class LinkWriter:
+    """
+    Pipelined bulk writer for download_links.
+
+    The matching loop submit()s rows; full batches go onto a bounded queue
+    that WRITER_THREADS workers POST over the pooled session, so network
+    I/O overlaps with matching. 5xx/429 responses and request errors
+    (timeouts, dropped connections, broken chunked replies, ...) are
+    retried with exponential backoff; batches that still fail are counted
+    in failed_rows and appended to an NDJSON journal that --resume
+    replays. Workers never die on an error, so the queue always drains
+    and close() returns. (A timeout after PostgREST committed can still
+    duplicate a batch on retry.)
+    Batches are cut at the size the BatchSizer currently suggests.
+
+    In dry-run mode rows are only counted.
+    """
+
+    def __init__(self, live: bool, batch_size: int, workers: int = WRITER_THREADS,
+                 journal_path: str = "", table: str = "download_links", batch_bounds: tuple = None):
+        self.live = live
+        self.table = table
+        min_size, max_size = batch_bounds or (batch_size, batch_size)
+        self.sizer = BatchSizer(batch_size, min_size, max_size)
+        self.journal_path = journal_path
+        self.submitted = 0
+        self.inserted = 0
+        self.failed_rows = 0
+        self.retries = 0
+        self._batch = []
+        self._batches_done = 0
+        self._started = None
+        self._write_seconds = 0.0
+        self._lock = threading.Lock()
+        self._queue = Queue(maxsize=workers * 2)
+        self._threads = []
+        if live:
+            for _ in range(workers):
+                t = threading.Thread(target=self._worker, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, row: dict):
+        self.submitted += 1
+        if not self.live:
+            self.inserted += 1
+            return
+        if self._started is None:
+            self._started = time.time()
+        self._batch.append(row)
+        if len(self._batch) >= self.sizer.size:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self) -> "LinkWriter":
+        """Flush the last batch and wait for every worker to finish."""
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        if self._threads and self._started is not None:
+            self._write_seconds = time.time() - self._started
+            if self.sizer.adaptive and self.sizer.batches:
+                print(f"  Batch size settled at {self.sizer.size:,} rows "
+                      f"(ranged {self.sizer.low:,}-{self.sizer.high:,} over {self.sizer.batches:,} batches), "
+                      f"{self.rows_per_second():,.0f} rows/s")
+        self._threads = []
+        return self
+
+    def rows_per_second(self) -> float:
+        return self.inserted / self._write_seconds if self._write_seconds else 0.0
+
+    def _worker(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Keep draining the queue; the batch still counts as failed
+                print(f"  Writer error ({len(batch)} rows): {type(e).__name__}: {e}")
+                self._failed(batch, f"{type(e).__name__}: {e}")
+
+    def _write(self, batch: list):
+        try:
+            ok, error = self._post_with_retry(batch)
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+            print(f"  Batch insert failed ({len(batch)} rows): {error}")
+        if ok is None:
+            # The sizer shrank while this batch kept failing: re-cut it
+            size = self.sizer.size
+            for i in range(0, len(batch), size):
+                self._write(batch[i:i + size])
+            return
+        if not ok:
+            self._failed(batch, error)
+            return
+        with self._lock:
+            self.inserted += len(batch)
+            self._batches_done += 1
+            if self._batches_done % 10 == 0:
+                print(f"  Inserted {self.inserted:,}/{self.submitted:,} rows...")
+
+    def _post_with_retry(self, batch: list) -> tuple[bool, str]:
+        """(True, ""), (False, error), or (None, error) if the batch should be re-cut smaller."""
+        error = ""
+        for attempt in range(WRITE_RETRIES + 1):
+            if attempt and len(batch) > self.sizer.size:
+                return None, error
+            if attempt:
+                with self._lock:
+                    self.retries += 1
+                delay = min(RETRY_BACKOFF_BASE * (2 ** (attempt - 1)), RETRY_BACKOFF_MAX)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+            body = json.dumps(batch, separators=(",", ":")).encode()
+            t0 = time.time()
+            try:
+                resp = http_session().post(
+                    f"{POSTGREST_URL}/{self.table}",
+                    data=body,
+                    headers={"Prefer": "return=minimal", "Content-Type": "application/json"},
+                    timeout=INSERT_TIMEOUT,
+                )
+            except requests.RequestException as e:
+                self.sizer.observe(len(batch), len(body), time.time() - t0, ok=False)
+                error = f"{type(e).__name__}: {e}"
+                continue
+            ok = resp.status_code in (200, 201, 204)
+            if ok or resp.status_code >= 500 or resp.status_code in (413, 429):
+                self.sizer.observe(len(batch), len(body), time.time() - t0, ok)
+            if ok:
+                return True, ""
+            error = f"{resp.status_code} {resp.text[:300]}"
+            if resp.status_code < 500 and resp.status_code != 429:
+                break  # not transient: retrying won't help
+        print(f"  Batch insert failed ({len(batch)} rows): {error}")
+        return False, error
+
+    def _failed(self, batch: list, error: str):
+        with self._lock:
+            self.failed_rows += len(batch)
+            self._batches_done += 1
+            try:
+                self._journal(batch, error)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"  Could not journal {len(batch)} failed rows to {self.journal_path}: {e}")
+
+    def _journal(self, batch: list, error: str):
+        if not self.journal_path:
+            return
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        with open(self.journal_path, "a") as fh:
+            fh.write(json.dumps({"error": error, "rows": batch}, separators=(",", ":")) + "\n")
+
+
+def replay_journal(journal_path: str, live: bool, batch_size: int, workers: int,
+                   batch_bounds: tuple = None) -> LinkWriter:
+    """
+    --resume: re-send the batches recorded in the failure journal.
+
+    A live replay first moves the journal to a <journal>.replaying-* file
+    (failures of the replay are journaled afresh under the original name)
+    and deletes it only once the replay has finished. Files left behind by
+    a replay that crashed are picked up again by the next --resume.
+    """
+    leftovers = sorted(glob.glob(glob.escape(journal_path) + ".replaying*"))
+    if not os.path.exists(journal_path) and not leftovers:
+        print(f"  No journal at {journal_path}: nothing to resume")
+        return LinkWriter(live=False, batch_size=batch_size)
+    if leftovers:
+        print(f"  Picking up {len(leftovers)} journal(s) left by an interrupted --resume")
+
+    replaying = leftovers
+    if os.path.exists(journal_path):
+        if live:
+            moved = f"{journal_path}.replaying-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+            os.replace(journal_path, moved)
+            replaying = leftovers + [moved]
+        else:
+            replaying = leftovers + [journal_path]
+
+    writer = LinkWriter(live=live, batch_size=batch_size, workers=workers, journal_path=journal_path,
+                        batch_bounds=batch_bounds)
+    for path in replaying:
+        with open(path) as fh:
+            for line in fh:
+                if line.strip():
+                    for row in json.loads(line)["rows"]:
+                        writer.submit(row)
+    writer.close()
+    if live:
+        for path in replaying:
+            os.remove(path)
+    return writer
+
+
+def delete_links_for_files(telegram_file_ids: list, live: bool = False) -> int:
+    """Delete Telegram episode links pointing at the given SQLite file ids."""
+    if not telegram_file_ids or not live:
+        return len(telegram_file_ids)
+
+    deleted = 0
+    batch_size = 200
+    for i in range(0, len(telegram_file_ids), batch_size):
+        batch = telegram_file_ids[i:i + batch_size]
+        ids_str = ",".join(str(fid) for fid in batch)
+        try:
+            resp = http_session().delete(
+                f"{POSTGREST_URL}/download_links",
+                params={"content_type": "eq.episode", "source": "eq.telegram",
+                        "telegram_file_id": f"in.({ids_str})"},
+                timeout=30,
+            )
+            if resp.status_code in (200, 204):
+                deleted += len(resp.json()) if resp.text else 0
+            else:
+                print(f"  Delete links error: {resp.status_code} {resp.text[:200]}")
+        except Exception as e:
+            print(f"  Delete links exception: {e}")
+
+    return deleted
 
 
 def update_has_downloads(episode_ids: list[int], live: bool = False) -> int:
-    """Set has_downloads = true for matched episodes."""
+    """Set has_downloads = true for matched episodes (fallback without the RPC)."""
     if not episode_ids or not live:
         return len(episode_ids)
 
@@ -525,11 +1636,10 @@ def update_has_downloads(episode_ids: list[int], live: bool = False) -> int:
         batch = episode_ids[i:i + batch_size]
         ids_str = ",".join(str(eid) for eid in batch)
         try:
-            resp = requests.patch(
+            resp = http_session().patch(
                 f"{POSTGREST_URL}/episodes",
                 params={"id": f"in.({ids_str})"},
                 json={"has_downloads": True},
-                headers=postgrest_headers(),
                 timeout=30,
             )
             if resp.status_code in (200, 204):
@@ -542,6 +1652,280 @@ def update_has_downloads(episode_ids: list[int], live: bool = False) -> int:
     return updated
 
 
+def reconcile_has_downloads(series_ids, matched_episode_ids: set, live: bool = False):
+    """
+    Recompute episodes.has_downloads for the affected series (None = all)
+    in one server-side statement (migrations/004_reconcile_episode_downloads.sql).
+    Flags are cleared as well as set, so episodes that lost their links to
+    --clear drop out. Falls back to the batched PATCH (set-only) when the
+    function is not installed. Returns rows changed, or None if unknown.
+    """
+    if series_ids is not None and not series_ids:
+        return 0
+    scope = "all series" if series_ids is None else f"{len(series_ids):,} series"
+    if not live:
+        print(f"  Would reconcile has_downloads across {scope} (dry-run)")
+        return None
+
+    started = time.time()
+    try:
+        resp = http_session().post(
+            f"{POSTGREST_URL}/rpc/reconcile_episode_has_downloads",
+            json={"p_series_ids": sorted(series_ids) if series_ids is not None else None},
+            timeout=RECONCILE_TIMEOUT,
+        )
+    except Exception as e:
+        print(f"  Reconcile exception: {e}")
+        return None
+
+    if resp.status_code == 200:
+        changed = resp.json()
+        print(f"  Reconciled {scope}: {changed:,} episodes changed "
+              f"({time.time() - started:.1f}s)")
+        return changed
+    if resp.status_code == 404:
+        print("  reconcile_episode_has_downloads() not installed "
+              "(apply migrations/004_reconcile_episode_downloads.sql); "
+              "falling back to PATCH, stale flags are NOT cleared")
+        update_has_downloads(sorted(matched_episode_ids), live=live)
+        print(f"  Set has_downloads on {len(matched_episode_ids):,} episodes ({time.time() - started:.1f}s)")
+        return None
+    print(f"  Reconcile error: {resp.status_code} {resp.text[:200]}")
+    return None
+
+
+def make_link_row(episode_id: int, quality: str, file_size: str, sqlite_id: int, variant: str) -> dict:
+    """One download_links row for a Telegram episode file."""
+    return {
+        "content_type": "episode",
+        "content_id": episode_id,
+        "source": "telegram",
+        "quality": quality,
+        "file_size": file_size,
+        "url": f"{TELEGRAM_STREAM_BASE}/stream/{sqlite_id}",
+        "telegram_file_id": str(sqlite_id),
+        "variant": variant,
+        "is_active": True,
+        "click_count": 0,
+    }
+
+
+def prepare_clear(live: bool):
+    """
+    Step 4 of --clear. With the staging table the live links stay up
+    until the new set is swapped in; without it they are deleted now.
+    Returns (staged, cleared episode ids), or None if staging could not
+    be reset or probed. Only a 404 (no staging table) falls back to the
+    destructive in-place delete; any other error aborts with the live
+    links untouched.
+    """
+    _, error = probe_episode_links(STAGING_TABLE)
+    if error and error != "missing":
+        print(f"  ERROR: cannot use {STAGING_TABLE}: {error}; live links left untouched")
+        return None
+    if not error:
+        print(f"[4/6] Staging a fresh episode link set in {STAGING_TABLE} (live links stay up)...")
+        existing = count_episode_links()
+        if existing is not None:
+            print(f"  {existing:,} existing episode Telegram links will be replaced at the swap")
+        if not reset_staging(live=live):
+            return None
+        return True, set()
+
+    print("[4/6] Clearing existing episode Telegram links...")
+    print(f"  NOTE: no {STAGING_TABLE} (apply migrations/005_episode_link_staging.sql); "
+          "clearing in place, episodes have no links until the inserts finish")
+    return False, set(clear_episode_links(live=live))
+
+
+def finish_link_writes(writer: "LinkWriter", staged: bool, live: bool, journal_path: str) -> bool:
+    """Drain the writer; for a staged rebuild, swap the set in. True if swapped."""
+    writer.close()
+    if staged:
+        if writer.failed_rows:
+            print(f"  {writer.failed_rows:,} rows failed after retries: staged set NOT activated, "
+                  f"live links unchanged (re-run with --clear)")
+            return False
+        return activate_staged_links(live=live)
+    if writer.failed_rows:
+        print(f"  {writer.failed_rows:,} rows failed after retries; journaled to {journal_path} "
+              f"(re-send with --live --resume)")
+    return False
+
+
+# ============================================================
+# PLAN FILES (--plan / --apply)
+# ============================================================
+# gzip'd NDJSON, one JSON array per line, tag first:
+#   ["plan", {header}]                                    always first
+#   ["link", episode_id, quality, file_size, sqlite_id, variant]
+#   ["episodes", [episode ids]]   has_downloads set (chunked)
+#   ["series", [series ids]]      series to reconcile (chunked)
+#   ["unmatched", norm_series, episode_groups]
+#   ["end", {counts, stats}]                              always last
+# A plan without its "end" line (or whose counts disagree) is refused.
+
+PLAN_FORMAT = 1
+PLAN_ID_CHUNK = 10000
+
+
+class PlanWriter:
+    """Stands in for LinkWriter under --plan: rows go to the plan file."""
+
+    def __init__(self, path: str, header: dict):
+        self.path = path
+        self.submitted = 0
+        self.inserted = 0
+        self.failed_rows = 0
+        self.retries = 0
+        self._fh = gzip.open(path, "wt", encoding="utf-8")
+        self._write("plan", dict(header, format=PLAN_FORMAT))
+
+    def _write(self, *record):
+        self._fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def submit(self, row: dict):
+        self.submitted += 1
+        self.inserted += 1
+        self._write("link", row["content_id"], row["quality"], row["file_size"],
+                    int(row["telegram_file_id"]), row["variant"])
+
+    def add_ids(self, tag: str, ids):
+        ids = sorted(ids)
+        for i in range(0, len(ids), PLAN_ID_CHUNK):
+            self._write(tag, ids[i:i + PLAN_ID_CHUNK])
+
+    def add_unmatched(self, unmatched_counts: dict):
+        for name, count in sorted(unmatched_counts.items(), key=lambda x: -x[1]):
+            self._write("unmatched", name, count)
+
+    def close(self, stats: dict = None) -> "PlanWriter":
+        self._write("end", {"links": self.submitted, "stats": stats or {}})
+        self._fh.close()
+        return self
+
+
+def iter_plan(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def read_plan_summary(path: str) -> dict:
+    """
+    Validate a plan end to end before anything is written: header first,
+    "end" last, link count matching. Returns header, end record, the
+    has_downloads/series sets and the unmatched report.
+    """
+    summary = {"header": None, "end": None, "links": 0, "episodes": set(), "series": set(), "unmatched": []}
+    for record in iter_plan(path):
+        tag = record[0]
+        if summary["header"] is None:
+            if tag != "plan":
+                raise ValueError(f"{path}: not a migration plan")
+            if record[1].get("format") != PLAN_FORMAT:
+                raise ValueError(f"{path}: plan format {record[1].get('format')} (expected {PLAN_FORMAT})")
+            summary["header"] = record[1]
+        elif summary["end"] is not None:
+            raise ValueError(f"{path}: records after the end marker")
+        elif tag == "link":
+            summary["links"] += 1
+        elif tag == "episodes":
+            summary["episodes"].update(record[1])
+        elif tag == "series":
+            summary["series"].update(record[1])
+        elif tag == "unmatched":
+            summary["unmatched"].append((record[1], record[2]))
+        elif tag == "end":
+            summary["end"] = record[1]
+    if summary["end"] is None:
+        raise ValueError(f"{path}: truncated plan (no end marker)")
+    if summary["end"]["links"] != summary["links"]:
+        raise ValueError(f"{path}: plan lists {summary['links']:,} links, end marker says {summary['end']['links']:,}")
+    return summary
+
+
+def apply_plan(args):
+    """--apply: write exactly what a --plan run computed. No SQLite or catalogue load."""
+    start_time = time.time()
+    print("=" * 70)
+    print("  Episode DDL Migration: apply plan")
+    print(f"  Mode: {'LIVE' if args.live else 'DRY-RUN'}")
+    print(f"  Plan: {args.apply}")
+    print(f"  PostgREST: {POSTGREST_URL}")
+    print("=" * 70)
+    print()
+
+    profiler.stage("validate")
+    try:
+        plan = read_plan_summary(args.apply)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    header = plan["header"]
+    profiler.count(plan["links"])
+    print(f"  Planned {header['created']} from {header['sqlite_db']} "
+          f"({'with' if header['clear'] else 'without'} --clear)")
+    print(f"  {plan['links']:,} links, {len(plan['episodes']):,} episodes with downloads, "
+          f"{len(plan['series']):,} series")
+    for name, count in plan["unmatched"][:20]:
+        print(f"    unmatched: {name:40} ({count} episodes)")
+    if len(plan["unmatched"]) > 20:
+        print(f"    ... {len(plan['unmatched']) - 20:,} more unmatched series")
+    print()
+
+    profiler.stage("clear")
+    staged = False
+    if header["clear"]:
+        prepared = prepare_clear(args.live)
+        if prepared is None:
+            sys.exit(1)
+        staged = prepared[0]
+    else:
+        print("[4/6] Skipping clear (plan made without --clear)")
+
+    writer = LinkWriter(live=args.live, batch_size=args.batch_size, workers=args.writers,
+                        journal_path="" if staged else args.journal,
+                        table=STAGING_TABLE if staged else "download_links",
+                        batch_bounds=(args.batch_min, args.batch_max))
+    profiler.stage("insert")
+    print(f"[6/6] {'Inserting' if args.live else 'Would insert'} {plan['links']:,} rows...")
+    for record in iter_plan(args.apply):
+        if record[0] == "link":
+            writer.submit(make_link_row(*record[1:]))
+    swapped = finish_link_writes(writer, staged, args.live, args.journal)
+    profiler.count(writer.inserted)
+
+    profiler.stage("reconcile")
+
+    # A clear touched every series, whichever way it ran
+    flags_changed = None
+    if header["clear"] and not (staged and not swapped):
+        print("\n  Reconciling has_downloads for all series...")
+        flags_changed = reconcile_has_downloads(None, plan["episodes"], live=args.live)
+    elif not header["clear"] and plan["series"]:
+        print(f"\n  Reconciling has_downloads for {len(plan['series']):,} series...")
+        flags_changed = reconcile_has_downloads(plan["series"], plan["episodes"], live=args.live)
+
+    print()
+    print("=" * 70)
+    print("  EPISODE DDL PLAN APPLY SUMMARY")
+    print("=" * 70)
+    print(f"  Mode:                {'LIVE' if args.live else 'DRY-RUN'}")
+    if staged and not swapped:
+        print(f"  Links staged:        {writer.inserted:,} (not activated)")
+    else:
+        print(f"  Links created:       {writer.inserted:,}")
+    if writer.failed_rows or writer.retries:
+        print(f"  Links failed:        {writer.failed_rows:,} ({writer.retries:,} retries)")
+    if flags_changed is not None:
+        print(f"  Flags changed:       {flags_changed:,}")
+    print(f"  Time elapsed:        {time.time() - start_time:.1f}s")
+    print("=" * 70)
+    if writer.failed_rows:
+        sys.exit(1)
+
+
 # ============================================================
 # MAIN MIGRATION
 # ============================================================
@@ -551,25 +1935,95 @@ def migrate(args):
 
     print("=" * 70)
     print("  Episode DDL Migration (Telegram SQLite → PostgREST)")
-    print(f"  Mode: {'LIVE' if args.live else 'DRY-RUN'}")
+    print(f"  Mode: {'PLAN' if args.plan else 'LIVE' if args.live else 'DRY-RUN'}")
     if args.limit:
         print(f"  Limit: {args.limit} series")
     if args.series:
         print(f"  Series filter: \"{args.series}\"")
-    print(f"  Batch size: {args.batch_size}")
+    if args.batch_max > args.batch_min:
+        print(f"  Batch size: {args.batch_size} (adaptive {args.batch_min}-{args.batch_max})")
+    else:
+        print(f"  Batch size: {args.batch_min} (fixed)")
+    if args.workers > 1:
+        print(f"  Workers: {args.workers}")
+    if args.incremental:
+        print(f"  Incremental: yes{' (state reset by --clear)' if args.clear else ''}")
     print(f"  SQLite DB: {SQLITE_DB}")
     print(f"  PostgREST: {POSTGREST_URL}")
     print("=" * 70)
     print()
 
-    # Step 1: Load episode files from SQLite
-    print("[1/6] Loading episode files from SQLite...")
-    rows = fetch_episode_files(SQLITE_DB)
-    print(f"  Found {len(rows):,} valid episode files")
+    # Incremental runs only read files indexed since the last successful run
+    state = None
+    id_range = None
+    last_id = 0
+    if args.incremental:
+        state = MigrationState(SQLITE_DB)
+        last_id = 0 if args.clear else int(state.get("last_movie_id", "0"))
+        upto_id = max_movie_id(SQLITE_DB, immutable=args.immutable)
+        if last_id:
+            id_range = (last_id, upto_id)
+            print(f"Incremental: reading movies.id {last_id + 1:,} to {upto_id:,}")
+        else:
+            print(f"Incremental: no saved state, full pass up to movies.id {upto_id:,}")
+            if not args.clear:
+                print("  NOTE: combine the first --incremental run with --clear to avoid duplicating existing links")
+        print()
+
+    # Steps 1+2 run as one stream: rows are parsed and grouped as they are read
+    filter_norm = normalize_series_name(args.series) if args.series else ""
+    read_stats = new_read_stats()
 
-    # Step 2: Group by (series, season, episode)
+    profiler.stage("read")
+    print("[1/6] Loading episode files from SQLite...")
     print("[2/6] Grouping by episode...")
-    episode_groups = group_episodes(rows)
+    series_limit = 0 if args.series else args.limit
+    # Dry runs and plans leave movies.db alone unless asked to warm the cache
+    fill_cache = args.live or args.fill_parse_cache
+    if args.workers > 1:
+        print(f"  Parsing and scoring on {args.workers} worker processes...")
+        episode_groups = group_episodes_parallel(
+            SQLITE_DB, read_stats, args.workers, series_filter=filter_norm,
+            immutable=args.immutable, id_range=id_range, series_limit=series_limit,
+            parse_cache=not args.no_parse_cache, fill_cache=fill_cache,
+        )
+    else:
+        episode_groups = group_episodes(
+            iter_episode_files(SQLITE_DB, read_stats, series_filter=filter_norm,
+                               immutable=args.immutable, id_range=id_range,
+                               parse_cache=not args.no_parse_cache, fill_cache=fill_cache),
+            series_limit=series_limit,
+        )
+    profiler.count(read_stats["read"])
+    print_read_stats(read_stats)
+    print(f"  Found {read_stats['kept']:,} valid episode files (of {read_stats['read']:,} rows read)")
+
+    # Incremental: a stored survivor that was deleted or edited since (e.g.
+    # by backfill --follow) invalidates its group, since the files pruned
+    # from the state may now win. Those groups are re-read from every older
+    # row; edited files that now parse into another group join that one.
+    rebuilt_groups = {}
+    moved_files = defaultdict(list)
+    if state is not None and last_id:
+        # Groups were formed by another parser version: none can be trusted
+        parser_changed = state.get("parser_version", str(PARSER_VERSION)) != str(PARSER_VERSION)
+        stale_keys, stale_ids = state.stale_groups(everything=parser_changed)
+        if stale_keys:
+            reason = "parsed by an older parser" if parser_changed else "deleted or edited since the last run"
+            print(f"  {len(stale_ids):,} stored files {reason}: "
+                  f"re-reading {len(stale_keys):,} episode groups up to movies.id {last_id:,}")
+            rebuild_stats = new_read_stats()
+            rebuilt_groups = {key: [] for key in stale_keys}
+            for f in iter_episode_files(SQLITE_DB, rebuild_stats, immutable=args.immutable,
+                                        id_range=(0, last_id), parse_cache=not args.no_parse_cache,
+                                        fill_cache=fill_cache):
+                group = rebuilt_groups.get(f.key)
+                if group is not None:
+                    group.append(f)
+                elif f.sqlite_id in stale_ids:
+                    moved_files[f.key].append(f)
+            for key in list(rebuilt_groups) + list(moved_files):
+                episode_groups.setdefault(key, [])
 
     # Get unique series from the groups
     series_in_sqlite = defaultdict(set)
@@ -581,7 +2035,6 @@ def migrate(args):
 
     # Apply series filter
     if args.series:
-        filter_norm = normalize_series_name(args.series)
         episode_groups = {k: v for k, v in episode_groups.items() if k[0] == filter_norm}
         print(f"  Filtered to \"{args.series}\": {len(episode_groups)} episodes")
         if not episode_groups:
@@ -591,22 +2044,110 @@ def migrate(args):
             return
 
     # Step 3: Load PostgreSQL data for matching
+    profiler.stage("catalogue")
     print("[3/6] Loading PostgreSQL data for matching...")
-    series_by_tmdb, series_by_title = load_all_series()
-    ep_lookup = load_all_episodes()
-
-    # Step 4: Clear existing (if requested)
-    if args.clear:
-        print("[4/6] Clearing existing episode Telegram links...")
-        clear_episode_links(live=args.live)
+    # Debug runs only need the episodes of the series they matched. A full
+    # catalogue is still loaded when it is saved, or when --clear needs
+    # every series to reconcile has_downloads.
+    scoped = bool(args.series or args.limit) and not (args.catalogue or args.save_catalogue or args.clear)
+    if args.catalogue:
+        print(f"  Using saved catalogue index {args.catalogue}")
+        catalogue = CatalogueIndex.load(args.catalogue)
+    elif scoped:
+        catalogue = CatalogueIndex()
+        load_all_series(catalogue)
+    else:
+        catalogue = load_catalogue()
+    if args.save_catalogue:
+        catalogue.save(args.save_catalogue)
+        print(f"  Saved catalogue index to {args.save_catalogue}")
+    series_by_tmdb = catalogue.series_by_tmdb
+    series_by_title = catalogue.series_by_title
+    fuzzy_matcher = FuzzySeriesMatcher(series_by_title)
+
+    def resolve_series(norm_series: str, tmdb_id):
+        """TMDB id first, then exact title, then strict fuzzy (>=0.90, same word count)."""
+        if tmdb_id and tmdb_id in series_by_tmdb:
+            return series_by_tmdb[tmdb_id]
+        series_id = series_by_title.get(norm_series)
+        if series_id is None:
+            t0 = time.perf_counter()
+            series_id = fuzzy_matcher.match(norm_series)
+            profiler.add_time("fuzzy_match", time.perf_counter() - t0)
+        return series_id
+
+    if scoped:
+        wanted = {resolve_series(key[0], files[0].tmdb_id) for key, files in episode_groups.items()}
+        wanted.discard(None)
+        load_episodes_for_series(catalogue, wanted)
+
+    profiler.count(len(catalogue.episodes))
+
+    # Incremental: merge touched groups with their saved survivors
+    stored_groups = {}
+    version = ""
+    if state is not None:
+        version = catalogue.version()
+        if last_id:
+            if version != state.get("catalogue_version"):
+                # A renamed title or fixed tmdb_id can move matched groups
+                # too (exact -> fuzzy), so every stored group is re-matched;
+                # the ones whose links come out the same are not rewritten
+                rematch = [key for key in state.group_keys() if key not in episode_groups]
+                print(f"  Catalogue changed since last run: re-matching {len(rematch):,} stored episode groups")
+                for key in rematch:
+                    episode_groups[key] = []
+            stored_groups = state.load_groups(list(episode_groups.keys()))
+            for key, new_files in episode_groups.items():
+                if key in rebuilt_groups:
+                    older = rebuilt_groups[key]
+                else:
+                    older = stored_groups[key][2] if key in stored_groups else []
+                if key in moved_files:
+                    older = sorted(older + moved_files[key], key=lambda f: f.sqlite_id)
+                episode_groups[key] = older + new_files
+            print(f"  {len(episode_groups):,} episode groups touched ({len(stored_groups):,} seen before)")
+
+    # Step 4: Clear existing (if requested; a plan leaves it to --apply)
+    profiler.stage("clear")
+    cleared_episode_ids = set()
+    staged = False
+    if args.plan:
+        print(f"[4/6] {'Clear deferred to --apply' if args.clear else 'Skipping clear'} (writing plan)")
+    elif args.clear:
+        prepared = prepare_clear(args.live)
+        if prepared is None:
+            sys.exit(1)
+        staged, cleared_episode_ids = prepared
     else:
         print("[4/6] Skipping clear (use --clear to remove existing)")
 
     # Step 5: Pick best files and match to PostgreSQL episodes
+    profiler.stage("match")
     print("[5/6] Matching episodes and picking best files...")
 
-    all_inserts = []
+    # Rows stream into the writer while matching continues; incremental
+    # re-runs buffer them until the links they replace are deleted
+    # (a failed staged rebuild is simply re-run, so it keeps no journal)
+    if args.plan:
+        writer = PlanWriter(args.plan, {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "sqlite_db": SQLITE_DB,
+            "postgrest": POSTGREST_URL,
+            "clear": args.clear,
+            "series_filter": args.series,
+            "limit": args.limit,
+        })
+    else:
+        writer = LinkWriter(live=args.live, batch_size=args.batch_size, workers=args.writers,
+                            journal_path="" if staged else args.journal,
+                            table=STAGING_TABLE if staged else "download_links",
+                            batch_bounds=(args.batch_min, args.batch_max))
+    buffered = None
+    link_count = 0
+    sample_rows = []
     matched_episode_ids = set()
+    affected_series_ids = set()
     stats = {
         "total_episode_groups": len(episode_groups),
         "series_matched": 0,
@@ -623,7 +2164,51 @@ def migrate(args):
     processed_series = set()
     series_limit_counter = 0
 
-    for i, ((norm_series, season, episode_num), files) in enumerate(episode_groups.items()):
+    state_updates = {}
+    replaced_file_ids = set()
+    unchanged_groups = 0
+    if stored_groups:
+        buffered = []
+
+    # Groups whose every file is gone: drop their links and their state
+    for key in [key for key, files in episode_groups.items() if not files]:
+        del episode_groups[key]
+        state_updates[key] = None
+        episode_id, pick_ids, _ = stored_groups[key]
+        if episode_id:
+            replaced_file_ids.update(fid for fid in pick_ids if fid)
+            cleared_episode_ids.add(episode_id)
+    stats["total_episode_groups"] = len(episode_groups)
+
+    columnar_picks = None
+    if args.columnar:
+        print("  Scoring every group on NumPy columns...")
+        t0 = time.perf_counter()
+        columnar_picks = pick_best_columnar(episode_groups)
+        profiler.add_time("columnar_scoring", time.perf_counter() - t0)
+
+    def pick_best(key, files) -> dict:
+        if columnar_picks is not None:
+            return columnar_picks[key]
+        return pick_best_episode_files(files)
+
+    def remember(key, files, episode_id, picks) -> bool:
+        """Record a group's new state; False if its links are unchanged."""
+        pick_ids = tuple(picks[q]["sqlite_id"] if q in picks else None for q in ("720p", "1080p"))
+        state_updates[key] = (episode_id, pick_ids, group_survivors(files, picks))
+        prev = stored_groups.get(key)
+        if prev is None:
+            return True
+        if prev[0] == episode_id and prev[1] == pick_ids:
+            return False
+        if prev[0]:
+            replaced_file_ids.update(fid for fid in prev[1] if fid)
+            # has_downloads of the old episode is reconciled too
+            cleared_episode_ids.add(prev[0])
+        return True
+
+    for i, (group_key, files) in enumerate(episode_groups.items()):
+        norm_series, season, episode_num = group_key
         # Track unique series
         if norm_series not in processed_series:
             processed_series.add(norm_series)
@@ -633,60 +2218,41 @@ def migrate(args):
                 break
 
         # Match series to PostgreSQL
-        pg_series = None
+        series_id = resolve_series(norm_series, files[0].tmdb_id)
 
-        # Try TMDB ID match first
-        tmdb_id = files[0].get("tmdb_id")
-        if tmdb_id and tmdb_id in series_by_tmdb:
-            pg_series = series_by_tmdb[tmdb_id]
-
-        # Fall back to title match
-        if not pg_series:
-            pg_series = series_by_title.get(norm_series)
-
-        # Try fuzzy matching if exact fails (strict: >=0.90 similarity, same word count)
-        if not pg_series:
-            from difflib import SequenceMatcher
-            best_ratio = 0
-            best_candidate = None
-            for title_key, series_data in series_by_title.items():
-                # Require same word count to prevent "The Beauty" matching "True Beauty"
-                if abs(len(norm_series.split()) - len(title_key.split())) > 0:
-                    continue
-                ratio = SequenceMatcher(None, norm_series, title_key).ratio()
-                if ratio >= 0.90 and ratio > best_ratio:
-                    best_ratio = ratio
-                    best_candidate = series_data
-            if best_candidate:
-                pg_series = best_candidate
-
-        if not pg_series:
+        if series_id is None:
             if norm_series not in unmatched_series:
                 unmatched_series.add(norm_series)
                 stats["series_unmatched"] += 1
+            if state is not None:
+                remember(group_key, files, None, pick_best(group_key, files))
             continue
 
         if norm_series not in unmatched_series:
             stats["series_matched"] += 1
 
         # Match episode in PostgreSQL
-        ep_key = (pg_series["id"], season, episode_num)
-        pg_episode = ep_lookup.get(ep_key)
+        episode_id = catalogue.episode_id(series_id, season, episode_num)
 
-        if not pg_episode:
+        if episode_id is None:
             stats["episodes_unmatched"] += 1
             unmatched_episodes.append({
                 "series": norm_series,
-                "series_id": pg_series["id"],
+                "series_id": series_id,
                 "season": season,
                 "episode": episode_num,
             })
+            if state is not None:
+                remember(group_key, files, None, pick_best(group_key, files))
             continue
 
         stats["episodes_matched"] += 1
 
         # Pick best files for this episode
-        picks = pick_best_episode_files(files)
+        picks = pick_best(group_key, files)
+        if state is not None and not remember(group_key, files, episode_id, picks):
+            unchanged_groups += 1
+            continue
         if not picks:
             continue
 
@@ -699,55 +2265,107 @@ def migrate(args):
         if has_720 and has_1080:
             stats["with_both"] += 1
 
-        matched_episode_ids.add(pg_episode["id"])
+        matched_episode_ids.add(episode_id)
+        affected_series_ids.add(series_id)
 
         for quality, pick in picks.items():
-            row = {
-                "content_type": "episode",
-                "content_id": pg_episode["id"],
-                "source": "telegram",
-                "quality": quality,
-                "file_size": format_file_size(pick["file_size"]),
-                "url": f"{TELEGRAM_STREAM_BASE}/stream/{pick['sqlite_id']}",
-                "telegram_file_id": str(pick["sqlite_id"]),
-                "variant": pick["variant"],
-                "is_active": True,
-                "click_count": 0,
-            }
-            all_inserts.append(row)
+            row = make_link_row(episode_id, quality, format_file_size(pick["file_size"]),
+                                pick["sqlite_id"], pick["variant"])
+            link_count += 1
+            if len(sample_rows) < 6:
+                sample_rows.append(row)
+            if buffered is not None:
+                buffered.append(row)
+            else:
+                writer.submit(row)
 
         # Progress logging
         if (i + 1) % 5000 == 0:
-            print(f"  Processed {i + 1:,}/{len(episode_groups):,} episodes ({len(all_inserts):,} links)")
+            print(f"  Processed {i + 1:,}/{len(episode_groups):,} episodes ({link_count:,} links)")
 
-    print(f"  Done: {stats['episodes_matched']:,} matched → {len(all_inserts):,} download links")
+    profiler.count(len(episode_groups))
+    print(f"  Done: {stats['episodes_matched']:,} matched → {link_count:,} download links")
+    print(f"  Fuzzy fallback: {fuzzy_matcher.lookups:,} distinct names, "
+          f"{fuzzy_matcher.full_comparisons:,} full comparisons")
     print()
 
     # Show sample
     print("  Sample entries:")
-    for entry in all_inserts[:6]:
+    for entry in sample_rows:
         print(f"    ep_id:{entry['content_id']} | {entry['quality']} {entry['variant']:7} | {entry['file_size']:>8}")
-    if len(all_inserts) > 6:
-        print(f"    ... and {len(all_inserts) - 6:,} more")
+    if link_count > 6:
+        print(f"    ... and {link_count - 6:,} more")
     print()
 
-    # Step 6: Batch insert
-    print(f"[6/6] {'Inserting' if args.live else 'Would insert'} {len(all_inserts):,} rows...")
-    inserted = 0
-    batch_size = args.batch_size
-
-    for batch_start in range(0, len(all_inserts), batch_size):
-        batch = all_inserts[batch_start:batch_start + batch_size]
-        count = batch_insert_links(batch, live=args.live)
-        inserted += count
-
-        if args.live and (batch_start + batch_size) % (batch_size * 10) == 0:
-            print(f"  Inserted {inserted:,}/{len(all_inserts):,} rows...")
-
-    # Update has_downloads flags
-    if matched_episode_ids:
-        print(f"\n  Updating has_downloads for {len(matched_episode_ids):,} episodes...")
-        update_has_downloads(list(matched_episode_ids), live=args.live)
+    # Step 6: Batch insert (already under way unless buffered, so this
+    # stage is mostly the writer draining what matching queued)
+    profiler.stage("insert")
+    if buffered is not None:
+        # Upsert: drop the links these groups created last time, plus any
+        # copy of the new rows left behind by an interrupted run
+        stale_ids = sorted(replaced_file_ids | {int(r["telegram_file_id"]) for r in buffered})
+        print(f"[6/6] {'Replacing' if args.live else 'Would replace'} links for {len(stale_ids):,} files "
+              f"({unchanged_groups:,} episode groups unchanged)...")
+        delete_links_for_files(stale_ids, live=args.live)
+        for row in buffered:
+            writer.submit(row)
+
+    # Sort by how many episodes they had
+    unmatched_counts = defaultdict(int)
+    for (ns, s, e) in episode_groups.keys():
+        if ns in unmatched_series:
+            unmatched_counts[ns] += 1
+
+    if args.plan:
+        print(f"[6/6] Writing {link_count:,} rows to plan {args.plan}...")
+        writer.add_ids("episodes", matched_episode_ids)
+        writer.add_ids("series", affected_series_ids)
+        writer.add_unmatched(unmatched_counts)
+        writer.close(stats)
+        print(f"  Plan written: {os.path.getsize(args.plan):,} bytes "
+              f"(review, then: {sys.argv[0]} --live --apply {args.plan})")
+        swapped = False
+    else:
+        print(f"[6/6] {'Inserting' if args.live else 'Would insert'} {link_count:,} rows...")
+        swapped = finish_link_writes(writer, staged, args.live, args.journal)
+    inserted = writer.inserted
+    profiler.count(inserted)
+
+    # Reconcile has_downloads for every series whose links were written or cleared
+    profiler.stage("reconcile")
+    if cleared_episode_ids:
+        for key, eid in catalogue.episodes.items():
+            if eid in cleared_episode_ids:
+                affected_series_ids.add(unpack_episode_key(key)[0])
+    flags_changed = None
+    if args.plan:
+        pass  # recorded in the plan
+    elif swapped:
+        print("\n  Reconciling has_downloads for all series...")
+        flags_changed = reconcile_has_downloads(None, matched_episode_ids, live=args.live)
+    elif affected_series_ids and not staged:
+        print(f"\n  Reconciling has_downloads for {len(affected_series_ids):,} series...")
+        flags_changed = reconcile_has_downloads(affected_series_ids, matched_episode_ids, live=args.live)
+
+    # Advance the high-water mark only once every row made it in
+    if state is not None:
+        if not args.live:
+            print("\n  Incremental state not saved (dry-run)")
+        elif writer.failed_rows:
+            print(f"\n  Incremental state NOT advanced: {writer.failed_rows:,} rows failed to insert")
+        elif staged and not swapped:
+            print("\n  Incremental state NOT advanced: staged links were not activated")
+        else:
+            if args.clear:
+                state.reset()
+            state.save_groups(state_updates)
+            state.set("last_movie_id", upto_id)
+            state.set("catalogue_version", version)
+            state.set("parser_version", PARSER_VERSION)
+            state.commit()
+            print(f"\n  Incremental state saved: {len(state_updates):,} groups, high-water mark {upto_id:,}")
+        state.close()
+    profiler.end_stage()
 
     elapsed = time.time() - start_time
 
@@ -756,8 +2374,8 @@ def migrate(args):
     print("=" * 70)
     print("  EPISODE DDL MIGRATION SUMMARY")
     print("=" * 70)
-    print(f"  Mode:                {'LIVE' if args.live else 'DRY-RUN'}")
-    print(f"  Total files:         {len(rows):,}")
+    print(f"  Mode:                {'PLAN' if args.plan else 'LIVE' if args.live else 'DRY-RUN'}")
+    print(f"  Total files:         {read_stats['kept']:,}")
     print(f"  Total episode groups:{stats['total_episode_groups']:,}")
     print(f"  Series matched:      {stats['series_matched']:,}")
     print(f"  Series unmatched:    {stats['series_unmatched']:,}")
@@ -766,39 +2384,131 @@ def migrate(args):
     print(f"  With 720p:           {stats['with_720p']:,}")
     print(f"  With 1080p:          {stats['with_1080p']:,}")
     print(f"  With both:           {stats['with_both']:,}")
-    print(f"  Links created:       {inserted:,}")
+    if args.plan:
+        print(f"  Links planned:       {inserted:,}")
+    elif staged and not swapped:
+        print(f"  Links staged:        {inserted:,} (not activated)")
+    else:
+        print(f"  Links created:       {inserted:,}")
+    if writer.failed_rows or writer.retries:
+        print(f"  Links failed:        {writer.failed_rows:,} ({writer.retries:,} retries)")
     print(f"  has_downloads set:   {len(matched_episode_ids):,}")
+    if flags_changed is not None:
+        print(f"  Flags changed:       {flags_changed:,}")
     print(f"  Time elapsed:        {elapsed:.1f}s")
     print("=" * 70)
 
     if unmatched_series:
         print(f"\n  Top 20 unmatched series (of {len(unmatched_series)}):")
-        # Sort by how many episodes they had
-        unmatched_counts = defaultdict(int)
-        for (ns, s, e) in episode_groups.keys():
-            if ns in unmatched_series:
-                unmatched_counts[ns] += 1
         for name, count in sorted(unmatched_counts.items(), key=lambda x: -x[1])[:20]:
             print(f"    {name:40} ({count} episodes)")
 
-    if not args.live:
+    if not args.live and not args.plan:
         print()
         print("  This was a DRY-RUN. To actually insert, add --live flag.")
         print(f"  Example: python3 {sys.argv[0]} --live")
 
 
-def main():
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Migrate Episode DDLs to PostgREST")
     parser.add_argument("--live", action="store_true", help="Actually write to PostgREST (default: dry-run)")
     parser.add_argument("--clear", action="store_true", help="Clear existing episode links before inserting")
     parser.add_argument("--limit", type=int, default=0, help="Only process first N unique series (0 = all)")
-    parser.add_argument("--batch-size", type=int, default=500, help="PostgREST bulk insert batch size")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Starting PostgREST bulk insert batch size (tuned between --batch-min/--batch-max)")
+    parser.add_argument("--batch-min", type=int, default=BATCH_MIN, help="Smallest adaptive batch size")
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX,
+                        help="Largest adaptive batch size (equal to --batch-min for a fixed size)")
     parser.add_argument("--series", type=str, default="", help="Filter to a single series name for debugging")
-    args = parser.parse_args()
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process files indexed since the last --incremental run (state kept in movies.db)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for SQLite parsing/scoring (sharded by movies.id)")
+    parser.add_argument("--no-parse-cache", action="store_true",
+                        help="Parse every filename; neither read nor fill movies.db file_parse_cache")
+    parser.add_argument("--fill-parse-cache", action="store_true",
+                        help="Dry-run/--plan: also store new parses in file_parse_cache (--live always does)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Score and pick files for all episodes at once with NumPy")
+    parser.add_argument("--writers", type=int, default=WRITER_THREADS, help="Parallel PostgREST insert threads")
+    parser.add_argument("--journal", type=str, default=DEFAULT_JOURNAL,
+                        help="File that collects batches which failed after retries "
+                             "(default under $TRENDIMOVIES_STATE_DIR or ~/.local/state/trendimovies)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Re-send the batches recorded in --journal, then exit")
+    parser.add_argument("--plan", type=str, default="",
+                        help="Compute everything and write it to this plan file (gzip NDJSON) instead of PostgREST")
+    parser.add_argument("--apply", type=str, default="",
+                        help="Write the links recorded in a --plan file (no SQLite or catalogue load)")
+    parser.add_argument("--catalogue", type=str, default="",
+                        help="Use a saved catalogue index file instead of loading series/episodes from PostgREST")
+    parser.add_argument("--save-catalogue", type=str, default="",
+                        help="Write the loaded catalogue index to this file for reuse")
+    parser.add_argument("--immutable", action="store_true",
+                        help="Open SQLite with immutable=1 (snapshot copies / bot stopped only)")
+    parser.add_argument("--optimize-sqlite", action="store_true",
+                        help="Add movies.kind + episode indexes to the SQLite DB, report plans, and exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="Report per-stage wall/CPU/RSS/items/sec and request latencies (JSON + Prometheus)")
+    parser.add_argument("--profile-dir", type=str, default=".",
+                        help="Where --profile writes migrate_episode_ddl.profile.json and .prom")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="With --profile: also dump cProfile stats of the slowest stage")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+
+    if args.optimize_sqlite:
+        if not os.path.exists(SQLITE_DB):
+            print(f"ERROR: SQLite DB not found at {SQLITE_DB}")
+            sys.exit(1)
+        print(f"Optimizing {SQLITE_DB} for episode migration...")
+        sys.exit(0 if optimize_sqlite(SQLITE_DB) else 1)
+
+    if args.incremental and (args.series or args.limit):
+        print("ERROR: --incremental cannot be combined with --series or --limit")
+        sys.exit(1)
+    if args.incremental and args.immutable:
+        print("ERROR: --incremental writes its state to movies.db; drop --immutable")
+        sys.exit(1)
 
     if not HAS_REQUESTS:
         print("ERROR: 'requests' package required. Install: pip install requests")
         sys.exit(1)
+    if args.columnar and not HAS_NUMPY:
+        print("ERROR: --columnar needs numpy. Install: pip install numpy")
+        sys.exit(1)
+
+    if args.plan and (args.live or args.apply or args.incremental):
+        print("ERROR: --plan only computes; drop --live/--apply/--incremental (apply the plan afterwards)")
+        sys.exit(1)
+
+    profiler.cprofile = args.profile and args.cprofile
+    try:
+        run(args)
+    finally:
+        if args.profile:
+            report_profile(args.profile_dir)
+
+
+def run(args):
+    if args.apply:
+        apply_plan(args)
+        return
+
+    if args.resume:
+        profiler.stage("resume")
+        print(f"{'Resuming' if args.live else 'Would resume'} failed inserts from {args.journal}...")
+        writer = replay_journal(args.journal, args.live, args.batch_size, args.writers,
+                                (args.batch_min, args.batch_max))
+        profiler.count(writer.inserted)
+        print(f"  Rows {'inserted' if args.live else 'to insert'}: {writer.inserted:,}")
+        if writer.failed_rows:
+            print(f"  Still failing: {writer.failed_rows:,} rows (kept in {args.journal})")
+            sys.exit(1)
+        return
 
     if not os.path.exists(SQLITE_DB):
         print(f"ERROR: SQLite DB not found at {SQLITE_DB}")
@@ -807,5 +2517,13 @@ def main():
     migrate(args)
 
 
+def report_profile(directory: str):
+    print()
+    print("  PROFILE")
+    profiler.print_table()
+    for path in profiler.write_reports(directory):
+        print(f"  Wrote {path}")
+
+
 if __name__ == "__main__":
     main()
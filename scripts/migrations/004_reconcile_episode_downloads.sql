@@ -0,0 +1,36 @@
+-- Episode has_downloads reconciliation
+-- Called by migrate-episode-ddl.py as POST /rpc/reconcile_episode_has_downloads.
+-- Sets episodes.has_downloads to whether any download_links row points at the
+-- episode, in one statement, and returns the number of rows that changed.
+-- p_series_ids limits the pass to those series (NULL = every episode).
+
+-- Lookup path for the EXISTS probe
+CREATE INDEX IF NOT EXISTS idx_download_links_content ON download_links(content_type, content_id);
+CREATE INDEX IF NOT EXISTS idx_episodes_series_id ON episodes(series_id);
+
+CREATE OR REPLACE FUNCTION reconcile_episode_has_downloads(p_series_ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH changed AS (
+        UPDATE episodes e
+           SET has_downloads = x.has_links
+          FROM (
+                SELECT ep.id,
+                       EXISTS (
+                           SELECT 1 FROM download_links dl
+                            WHERE dl.content_type = 'episode'
+                              AND dl.content_id = ep.id
+                       ) AS has_links
+                  FROM episodes ep
+                 WHERE p_series_ids IS NULL OR ep.series_id = ANY(p_series_ids)
+               ) x
+         WHERE e.id = x.id
+           AND e.has_downloads IS DISTINCT FROM x.has_links
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM changed;
+$$;
+
+-- Make the function visible to PostgREST without a restart
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,55 @@
+-- Staged rebuild of Telegram episode links
+-- Used by migrate-episode-ddl.py --clear: the new link set is written to
+-- download_links_staging while the current links stay live, then
+-- activate_staged_episode_links() swaps them in one transaction, so the
+-- site never sees an empty or half-built set and a crash mid-build
+-- leaves the live links untouched.
+
+CREATE TABLE IF NOT EXISTS download_links_staging (LIKE download_links INCLUDING DEFAULTS);
+
+CREATE OR REPLACE FUNCTION activate_staged_episode_links()
+RETURNS JSON
+LANGUAGE plpgsql
+-- Runs with the owner's rights: the PostgREST role only needs EXECUTE,
+-- not DELETE/INSERT on download_links itself
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    removed INTEGER;
+    added INTEGER;
+BEGIN
+    -- Serialize concurrent swaps
+    LOCK TABLE download_links_staging IN EXCLUSIVE MODE;
+
+    DELETE FROM download_links
+     WHERE content_type = 'episode' AND source = 'telegram';
+    GET DIAGNOSTICS removed = ROW_COUNT;
+
+    INSERT INTO download_links
+           (content_type, content_id, source, quality, file_size, url,
+            telegram_file_id, variant, is_active, click_count)
+    SELECT content_type, content_id, source, quality, file_size, url,
+           telegram_file_id, variant, is_active, click_count
+      FROM download_links_staging
+     WHERE content_type = 'episode' AND source = 'telegram';
+    GET DIAGNOSTICS added = ROW_COUNT;
+
+    DELETE FROM download_links_staging
+     WHERE content_type = 'episode' AND source = 'telegram';
+
+    RETURN json_build_object('removed', removed, 'added', added);
+END;
+$$;
+
+-- Grant permissions for PostgREST. Writer role only: web_anon is the
+-- browser-facing role and must never reach the staging table or the swap
+-- (migrate-episode-ddl.py sends the writer's JWT from POSTGREST_KEY)
+REVOKE ALL ON download_links_staging FROM web_anon;
+GRANT ALL ON download_links_staging TO authenticator;
+REVOKE ALL ON FUNCTION activate_staged_episode_links() FROM PUBLIC;
+REVOKE ALL ON FUNCTION activate_staged_episode_links() FROM web_anon;
+GRANT EXECUTE ON FUNCTION activate_staged_episode_links() TO authenticator;
+
+-- Make the table and function visible to PostgREST without a restart
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Release-name parser shared by the Telegram SQLite scripts
+=========================================================
+Every filename in the channel index is parsed exactly once: it is
+lower-cased a single time, scanned with precompiled patterns, and the
+result is returned as an immutable ParsedRelease record. Results are
+memoized per filename, so the scoring/picking steps that need the same
+facts again pay a dict lookup instead of another regex pass.
+
+Results also persist across runs in the file_parse_cache table of
+movies.db (keyed by movies.id, stamped with PARSER_VERSION): the backfill
+fills it at insert time, the migration fills the gaps and reads it back
+instead of parsing.
+
+Used by:
+  migrate-episode-ddl.py       (episode grouping + best-file scoring)
+  backfill-telegram-sqlite.py  (quality / year / is_series at insert time)
+
+Deploy this file next to whichever script imports it.
+"""
+
+import re
+from functools import lru_cache
+
+# ============================================================
+# SCORING TABLES
+# ============================================================
+
+# Variant priority (higher = better)
+VARIANT_PRIORITY = {
+    "bluray": 1000,
+    "webrip": 800,
+    "webdl": 700,
+    "hdtv": 500,
+    "hdrip": 400,
+    "other": 100,
+}
+
+# Codec bonus
+CODEC_PRIORITY = {
+    "x265": 200, "hevc": 200, "h265": 200,
+    "x264": 100, "h264": 100, "avc": 100,
+}
+
+# Release group bonus
+RELEASE_GROUP_BONUS = {
+    "psa": 30, "bone": 20, "rmteam": 15, "yts": 10, "rarbg": 10,
+}
+
+# Non-English language keywords
+NON_ENGLISH_KEYWORDS = [
+    "tamil", "hindi", "telugu", "kannada", "malayalam", "bengali",
+    "korean", "japanese", "chinese", "mandarin", "cantonese",
+    "arabic", "turkish", "thai", "vietnamese", "indonesian",
+    "french", "spanish", "portuguese", "german", "italian",
+    "russian", "polish", "dutch", "swedish", "danish", "norwegian",
+    "finnish", "czech", "hungarian", "romanian", "greek",
+    "persian", "farsi", "urdu", "punjabi", "marathi", "gujarati",
+    "dual.audio", "multi.audio", "dubbed",
+]
+
+VALID_QUALITIES = ("720p", "1080p", "2160p")
+
+# Cap on memoized filenames (~100 MB worst case on the full channel index)
+PARSE_CACHE_SIZE = 1 << 18
+
+# Stamped on every file_parse_cache row. Bump it whenever parse_release()
+# can return something different for the same filename: rows carrying an
+# older version are ignored on read and re-parsed.
+PARSER_VERSION = 1
+
+# ============================================================
+# PRECOMPILED PATTERNS
+# ============================================================
+
+_BLURAY_MARKERS = ("bluray", "blu-ray", "bdrip", "brrip")
+_WEBDL_MARKERS = ("web-dl", "webdl", "web.dl", "web dl")
+_WEBRIP_MARKERS = ("webrip", "web-rip", "web.rip")
+_HDRIP_MARKERS = ("hdrip", "web-hd", "webhd", "web.hd", "dvdrip")
+_X265_MARKERS = ("x265", "hevc", "h.265", "h265")
+_X264_MARKERS = ("x264", "h.264", "h264", "avc")
+
+# Streaming-service tags imply WEB-DL (matched on the lower-cased name)
+_STREAMING_RE = re.compile(
+    r'\b(?:amzn|amazn|amazon|dsnp|dnsp|disney|hmax|hbo|atvp|apple|pcok|peacock|pmtp|paramount)\b'
+)
+# "NF" is only trusted in upper case; "nf" is too common inside words
+_NETFLIX_RE = re.compile(r'\bNF\b')
+
+_EPISODE_RE = re.compile(r'[. _-]S(\d{1,2})E(\d{1,3})', re.IGNORECASE)
+_SERIES_SEP_RE = re.compile(r'[._-]')
+_SERIES_YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+_WHITESPACE_RE = re.compile(r'\s+')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9\s]')
+_NON_ALNUM_ONLY_RE = re.compile(r'[^a-z0-9]+')
+
+_QUALITY_TOKEN_RE = re.compile(r'(\d{3,4}p)')
+_FILENAME_QUALITY_RE = re.compile(r'[.\-_ ](\d{3,4}p)[.\-_ ]')
+
+_YEAR_RE = re.compile(r'[.\-_\s]((?:19|20)\d{2})[.\-_\s]')
+_SERIES_HINT_RE = re.compile(r's\d{1,2}e\d{1,2}|season\s*\d+|\d{1,2}x\d{1,2}|episode\s*\d+|ep\s*\d+')
+
+# All language markers in one alternation: a single scan per filename
+# finds the leftmost marker (longest keyword first at equal positions)
+_LANGUAGE_RE = re.compile("|".join(
+    re.escape(kw) for kw in sorted(NON_ENGLISH_KEYWORDS, key=len, reverse=True)
+))
+
+# Group markers in dict order; the first match wins, as before
+_GROUP_MARKERS = tuple(
+    (group, bonus, (f"-{group}", f".{group}", f"[{group}]"))
+    for group, bonus in RELEASE_GROUP_BONUS.items()
+)
+
+
+# ============================================================
+# PARSED RECORD
+# ============================================================
+
+class ParsedRelease:
+    """Immutable facts derived from one filename."""
+
+    __slots__ = (
+        "series", "norm_series", "season", "episode", "quality",
+        "variant", "codec", "group_bonus", "language", "score",
+    )
+
+    def __init__(self, series, norm_series, season, episode, quality,
+                 variant, codec, group_bonus, language, score):
+        set_ = object.__setattr__
+        set_(self, "series", series)
+        set_(self, "norm_series", norm_series)
+        set_(self, "season", season)
+        set_(self, "episode", episode)
+        set_(self, "quality", quality)
+        set_(self, "variant", variant)
+        set_(self, "codec", codec)
+        set_(self, "group_bonus", group_bonus)
+        set_(self, "language", language)
+        set_(self, "score", score)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ParsedRelease is immutable (tried to set {name!r})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ParsedRelease is immutable (tried to delete {name!r})")
+
+    def __reduce__(self):
+        # Pickle through __init__ (the --workers pool ships records between processes)
+        return (ParsedRelease, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ParsedRelease({fields})"
+
+    @property
+    def non_english(self) -> bool:
+        return bool(self.language)
+
+    @property
+    def is_episode(self) -> bool:
+        return bool(self.series)
+
+    def score_with_size(self, file_size: int) -> float:
+        """
+        Full episode score: base score minus the INVERTED size tiebreaker
+        (smaller file wins, 0 to -0.99).
+        """
+        size_penalty = min(file_size / (5 * 1024 * 1024 * 1024), 0.99) if file_size else 0
+        return self.score - size_penalty
+
+
+# ============================================================
+# DETECTORS (operate on an already lower-cased name)
+# ============================================================
+
+def _detect_variant(fn: str, file_name: str) -> str:
+    if any(m in fn for m in _BLURAY_MARKERS):
+        return "bluray"
+    if any(m in fn for m in _WEBDL_MARKERS):
+        return "webdl"
+    if _STREAMING_RE.search(fn) or _NETFLIX_RE.search(file_name):
+        return "webdl"
+    if any(m in fn for m in _WEBRIP_MARKERS):
+        return "webrip"
+    if "hdtv" in fn:
+        return "hdtv"
+    if any(m in fn for m in _HDRIP_MARKERS):
+        return "hdrip"
+    return "other"
+
+
+def _detect_codec(fn: str) -> str:
+    if any(m in fn for m in _X265_MARKERS):
+        return "x265"
+    if any(m in fn for m in _X264_MARKERS):
+        return "x264"
+    return ""
+
+
+def _detect_group_bonus(fn: str) -> int:
+    for group, bonus, markers in _GROUP_MARKERS:
+        if fn.endswith(group) or any(m in fn for m in markers):
+            return bonus
+    return 0
+
+
+def _detect_language(fn: str) -> str:
+    # The legacy per-keyword delimiter/startswith checks are all implied by
+    # a plain substring hit, so "any keyword occurs" is the whole rule.
+    match = _LANGUAGE_RE.search(fn)
+    return match.group(0) if match else ""
+
+
+def _filename_quality(fn: str) -> str:
+    match = _FILENAME_QUALITY_RE.search(fn)
+    if match and match.group(1) in VALID_QUALITIES:
+        return match.group(1)
+    return ""
+
+
+def normalize_series_name(name: str) -> str:
+    """Normalize series name for matching."""
+    if not name:
+        return ""
+    n = name.lower().strip()
+    n = _NON_ALNUM_RE.sub('', n)
+    n = _WHITESPACE_RE.sub(' ', n).strip()
+    return n
+
+
+def squash_name(name: str) -> str:
+    """
+    Lower-case alnum-only form of a name. Every word of a normalized
+    series name is a substring of the squashed filename it came from,
+    which makes this a cheap pre-parse filter.
+    """
+    return _NON_ALNUM_ONLY_RE.sub('', name.lower()) if name else ""
+
+
+def _parse_series(file_name: str):
+    match = _EPISODE_RE.search(file_name)
+    if not match:
+        return "", None, None
+
+    # Series name = everything before S##E##
+    series_name = _SERIES_SEP_RE.sub(' ', file_name[:match.start()]).strip()
+    series_name = _SERIES_YEAR_RE.sub('', series_name).strip()
+    series_name = _WHITESPACE_RE.sub(' ', series_name).strip()
+
+    return series_name, int(match.group(1)), int(match.group(2))
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_release(file_name: str) -> ParsedRelease:
+    """Parse one filename into a ParsedRelease (memoized per filename)."""
+    file_name = file_name or ""
+    fn = file_name.lower()
+
+    series, season, episode = _parse_series(file_name)
+    variant = _detect_variant(fn, file_name)
+    codec = _detect_codec(fn)
+    group_bonus = _detect_group_bonus(fn)
+    score = (VARIANT_PRIORITY.get(variant, VARIANT_PRIORITY["other"])
+             + CODEC_PRIORITY.get(codec, 0)
+             + group_bonus)
+
+    return ParsedRelease(
+        series=series,
+        norm_series=normalize_series_name(series),
+        season=season,
+        episode=episode,
+        quality=_filename_quality(fn),
+        variant=variant,
+        codec=codec,
+        group_bonus=group_bonus,
+        language=_detect_language(fn),
+        score=score,
+    )
+
+
+def detect_language(file_name: str) -> str:
+    """Return the first non-English marker in a filename ("" = English)."""
+    return _detect_language((file_name or "").lower())
+
+
+def resolve_quality(quality_str: str, resolution_str: str, parsed: ParsedRelease) -> str:
+    """
+    Pick the quality for a row: SQLite resolution column first, then the
+    quality column, then whatever the filename says.
+    """
+    if resolution_str:
+        res = resolution_str.strip().lower()
+        if res in VALID_QUALITIES:
+            return res
+
+    if quality_str:
+        match = _QUALITY_TOKEN_RE.search(quality_str.lower())
+        if match and match.group(1) in VALID_QUALITIES:
+            return match.group(1)
+
+    return parsed.quality if parsed else ""
+
+
+# ------------------------------------------------------------
+# Persisted parse results (file_parse_cache side table in movies.db)
+# ------------------------------------------------------------
+
+PARSE_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS file_parse_cache (
+        movie_id INTEGER PRIMARY KEY,
+        parser_version INTEGER NOT NULL,
+        series TEXT,
+        norm_series TEXT,
+        season INTEGER,
+        episode INTEGER,
+        quality TEXT,
+        variant TEXT,
+        codec TEXT,
+        group_bonus INTEGER,
+        language TEXT,
+        score INTEGER
+    )
+"""
+
+# Cached columns, in ParsedRelease field order
+PARSE_CACHE_COLUMNS = ParsedRelease.__slots__
+
+PARSE_CACHE_INSERT = (
+    f"INSERT OR REPLACE INTO file_parse_cache (movie_id, parser_version, {', '.join(PARSE_CACHE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(PARSE_CACHE_COLUMNS) + 2))})"
+)
+
+
+def ensure_parse_cache(conn):
+    """Create file_parse_cache if this movies.db does not have it yet."""
+    conn.execute(PARSE_CACHE_DDL)
+
+
+def parse_cache_row(movie_id: int, parsed: ParsedRelease) -> tuple:
+    """Parameters for PARSE_CACHE_INSERT."""
+    return (movie_id, PARSER_VERSION) + tuple(getattr(parsed, name) for name in PARSE_CACHE_COLUMNS)
+
+
+def parsed_from_cache(values) -> ParsedRelease:
+    """Rebuild a ParsedRelease from the PARSE_CACHE_COLUMNS of a cache row."""
+    return ParsedRelease(*values)
+
+
+# ------------------------------------------------------------
+# Backfill helpers (index-time columns)
+# ------------------------------------------------------------
+
+def extract_quality(filename: str) -> str:
+    """Extract quality from filename"""
+    lower = filename.lower()
+    if '2160p' in lower or '4k' in lower:
+        return '2160p'
+    if '1080p' in lower:
+        return '1080p'
+    if '720p' in lower:
+        return '720p'
+    if 'hdrip' in lower:
+        return 'hdrip'
+    if 'bdrip' in lower or 'bluray' in lower:
+        return 'bluray'
+    if 'webrip' in lower or 'web-dl' in lower:
+        return 'webrip'
+    return ''
+
+
+def extract_year(filename: str):
+    """Extract year from filename (e.g. Movie.Title.2024.Quality)"""
+    match = _YEAR_RE.search(filename)
+    if match:
+        year = int(match.group(1))
+        if 1900 <= year <= 2030:
+            return year
+    return None
+
+
+def is_series(filename: str) -> int:
+    """Check if file is a TV series episode (S01E01, Season 1, 1x01, Episode 1, Ep 1)"""
+    return 1 if _SERIES_HINT_RE.search(filename.lower()) else 0
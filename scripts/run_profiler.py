@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Per-stage run profiler for the episode migration and Telegram backfill
+======================================================================
+A run is cut into named stages (one after the other, never nested). For
+each stage the profiler records:
+
+  wall time, CPU time (this process + reaped worker processes),
+  peak RSS so far, items processed and items/sec,
+  named sub-timers (e.g. fuzzy matching inside the match stage)
+
+plus a latency histogram per remote endpoint. With cprofile=True every
+stage also runs under its own cProfile.Profile (main thread only), and
+the hottest stage's profile can be dumped for `python3 -m pstats`.
+
+Reports: a JSON document and a Prometheus textfile-collector file
+(written atomically, so node_exporter never reads half a file).
+
+Used by: migrate-episode-ddl.py, backfill-telegram-sqlite.py (--profile)
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import resource
+import threading
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = "trendimovies"
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+def _peak_rss_bytes() -> int:
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+class LatencyHistogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (max for +Inf)."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "max": round(self.max, 6),
+            "p50_le": self.quantile(0.5),
+            "p95_le": self.quantile(0.95),
+            "p99_le": self.quantile(0.99),
+            "buckets": {str(b): n for b, n in zip(LATENCY_BUCKETS + ("+Inf",), self.buckets)},
+        }
+
+
+class RunProfiler:
+    """Sequential stage timings + request latencies for one script run."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.cprofile = False
+        self.stages = []
+        self.http = {}
+        self._current = None
+        self._profile = None
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """End the running stage (if any) and start `name`."""
+        self.end_stage()
+        self._current = {
+            "stage": name, "items": 0, "timers": {},
+            "_wall": time.perf_counter(), "_cpu": _cpu_seconds(),
+        }
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def count(self, items: int):
+        """Items the running stage processed (for items/sec)."""
+        if self._current is not None:
+            self._current["items"] = items
+
+    def add_time(self, timer: str, seconds: float, calls: int = 1):
+        """Accumulate a named sub-timer inside the running stage."""
+        if self._current is None:
+            return
+        entry = self._current["timers"].setdefault(timer, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def observe_http(self, endpoint: str, seconds: float):
+        with self._lock:
+            histogram = self.http.get(endpoint)
+            if histogram is None:
+                histogram = self.http[endpoint] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def end_stage(self):
+        stage = self._current
+        if stage is None:
+            return
+        self._current = None
+        if self._profile is not None:
+            self._profile.disable()
+        wall = time.perf_counter() - stage.pop("_wall")
+        stage["cpu_seconds"] = round(_cpu_seconds() - stage.pop("_cpu"), 3)
+        stage["wall_seconds"] = round(wall, 3)
+        stage["peak_rss_bytes"] = _peak_rss_bytes()
+        stage["items_per_second"] = round(stage["items"] / wall, 1) if wall > 0 else 0.0
+        stage["timers"] = {k: {"seconds": round(v[0], 3), "calls": v[1]} for k, v in stage["timers"].items()}
+        stage["_profile"] = self._profile
+        self._profile = None
+        self.stages.append(stage)
+
+    def hottest(self) -> dict:
+        return max(self.stages, key=lambda s: s["wall_seconds"], default=None)
+
+    # --------------------------------------------------------
+    # Reports
+    # --------------------------------------------------------
+
+    def report(self) -> dict:
+        self.end_stage()
+        return {
+            "job": self.job,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+            "wall_seconds": round(time.time() - self._started, 3),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "stages": [{k: v for k, v in s.items() if not k.startswith("_")} for s in self.stages],
+            "http": {endpoint: h.to_dict() for endpoint, h in sorted(self.http.items())},
+        }
+
+    def print_table(self):
+        report = self.report()
+        print()
+        print(f"  {'Stage':12} {'Wall':>9} {'CPU':>9} {'Peak RSS':>10} {'Items':>11} {'Items/s':>11}")
+        for s in report["stages"]:
+            print(f"  {s['stage']:12} {s['wall_seconds']:>8.2f}s {s['cpu_seconds']:>8.2f}s "
+                  f"{s['peak_rss_bytes'] / 1024 / 1024:>8.0f}MB {s['items']:>11,} {s['items_per_second']:>11,.0f}")
+            for name, t in s["timers"].items():
+                print(f"    {name:22} {t['seconds']:>8.2f}s over {t['calls']:,} calls")
+        for endpoint, h in report["http"].items():
+            print(f"  {endpoint:40} {h['count']:>6,} calls  p50<={h['p50_le']}s  "
+                  f"p95<={h['p95_le']}s  max {h['max']:.3f}s")
+
+    def write_json(self, path: str):
+        with open(path, "w") as fh:
+            json.dump(self.report(), fh, indent=2)
+
+    def write_prometheus(self, path: str):
+        report = self.report()
+        job = self.job
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in [("job", job)] + labels)
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        stages = report["stages"]
+        metric("stage_wall_seconds", "gauge", "Wall time per stage of the last run.",
+               [([("stage", s["stage"])], s["wall_seconds"]) for s in stages])
+        metric("stage_cpu_seconds", "gauge", "CPU time per stage of the last run.",
+               [([("stage", s["stage"])], s["cpu_seconds"]) for s in stages])
+        metric("stage_peak_rss_bytes", "gauge", "Peak RSS at the end of each stage.",
+               [([("stage", s["stage"])], s["peak_rss_bytes"]) for s in stages])
+        metric("stage_items", "gauge", "Items processed per stage.",
+               [([("stage", s["stage"])], s["items"]) for s in stages])
+        metric("stage_items_per_second", "gauge", "Stage throughput.",
+               [([("stage", s["stage"])], s["items_per_second"]) for s in stages])
+        if self.http:
+            lines.append(f"# HELP {METRIC_PREFIX}_request_duration_seconds Remote call latency of the last run.")
+            lines.append(f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram")
+            for endpoint, h in self.http.items():
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), h.buckets):
+                    cumulative += n
+                    lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket'
+                                 f'{{job="{job}",endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_sum'
+                             f'{{job="{job}",endpoint="{endpoint}"}} {h.total:.6f}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_count'
+                             f'{{job="{job}",endpoint="{endpoint}"}} {h.count}')
+        metric("run_wall_seconds", "gauge", "Wall time of the last run.", [([], report["wall_seconds"])])
+        metric("last_run_timestamp_seconds", "gauge", "When the last run finished.", [([], int(time.time()))])
+
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fh:
+            fh.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def dump_hottest(self, directory: str) -> str:
+        """Write the hottest stage's cProfile stats; returns the path ('' if none)."""
+        self.end_stage()
+        stage = self.hottest()
+        if stage is None or stage["_profile"] is None:
+            return ""
+        path = os.path.join(directory, f"{self.job}.{stage['stage']}.pstats")
+        stage["_profile"].dump_stats(path)
+        return path
+
+    def write_reports(self, directory: str) -> list:
+        """JSON report, Prometheus textfile and (with cprofile) the hottest stage's stats."""
+        os.makedirs(directory or ".", exist_ok=True)
+        paths = [os.path.join(directory, f"{self.job}.profile.json"), os.path.join(directory, f"{self.job}.prom")]
+        self.write_json(paths[0])
+        self.write_prometheus(paths[1])
+        if self.cprofile:
+            pstats_path = self.dump_hottest(directory)
+            if pstats_path:
+                paths.append(pstats_path)
+        return paths